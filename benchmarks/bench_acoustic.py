@@ -0,0 +1,129 @@
+"""
+Benchmarks of the spectral stage on local wav files.
+
+time_* and peakmem_* are the usual asv wall time and peak RSS, track_throughput reports audio seconds processed per
+wall second.
+"""
+import datetime as dt
+import time
+
+import librosa
+import numpy as np
+import pandas as pd
+
+from orcasound_noise.pipeline import acoustic_util
+
+from .common import clip_path, clip_seconds, write_synthetic_clips
+
+T0 = dt.datetime(2023, 1, 1, 12, 0, 0)
+
+
+class WavToArray:
+    params = (["live000", "logchirp", "noise_10min"], [1, 10], [1, 60], [None, 3, 12])
+    param_names = ["clip", "delta_f", "delta_t", "bands"]
+    timeout = 600
+
+    def setup_cache(self):
+        write_synthetic_clips()
+
+    def setup(self, clip, delta_f, delta_t, bands):
+        self.path = clip_path(clip)
+
+    def _run(self, clip, delta_f, delta_t, bands):
+        acoustic_util.wav_to_array(self.path, t0=T0, delta_t=delta_t, delta_f=delta_f, transforms=[], bands=bands)
+
+    def time_wav_to_array(self, *params):
+        self._run(*params)
+
+    def peakmem_wav_to_array(self, *params):
+        self._run(*params)
+
+    def track_throughput(self, clip, *params):
+        start = time.perf_counter()
+        self._run(clip, *params)
+        return clip_seconds(clip) / (time.perf_counter() - start)
+
+    track_throughput.unit = "audio s / s"
+
+
+class StreamWavToProducts:
+    params = (["noise_10min"], [1, 10], [64, 1024])
+    param_names = ["clip", "delta_f", "frames_per_block"]
+    timeout = 600
+
+    def setup_cache(self):
+        write_synthetic_clips()
+
+    def setup(self, clip, delta_f, frames_per_block):
+        self.path = clip_path(clip)
+        self.products = [acoustic_util.Product(60), acoustic_util.Product(60, bands=3),
+                         acoustic_util.Product(60, is_broadband=True)]
+
+    def _run(self, clip, delta_f, frames_per_block):
+        acoustic_util.stream_wav_to_products(self.path, self.products, t0=T0, delta_f=delta_f,
+                                             frames_per_block=frames_per_block)
+
+    def time_stream(self, *params):
+        self._run(*params)
+
+    def peakmem_stream(self, *params):
+        self._run(*params)
+
+    def track_throughput(self, clip, *params):
+        start = time.perf_counter()
+        self._run(clip, *params)
+        return clip_seconds(clip) / (time.perf_counter() - start)
+
+    track_throughput.unit = "audio s / s"
+
+
+class SpecToBands:
+    params = ([1, 10], [1, 3, 12, 24])
+    param_names = ["delta_f", "bands"]
+
+    def setup(self, delta_f, bands):
+        sr = 48000
+        self.n_fft = int(sr / delta_f)
+        self.freqs = librosa.fft_frequencies(sr=sr, n_fft=self.n_fft)
+        # One minute of half overlapped frames
+        self.psd = np.random.default_rng(0).random((2 * 60 * delta_f, len(self.freqs)), dtype=np.float32)
+        acoustic_util.filter_bank(bands, sr, self.n_fft)
+
+    def time_spec_to_bands(self, delta_f, bands):
+        acoustic_util.spec_to_bands(self.psd, bands, delta_f, freqs=self.freqs, ref=1)
+
+    def peakmem_spec_to_bands(self, delta_f, bands):
+        acoustic_util.spec_to_bands(self.psd, bands, delta_f, freqs=self.freqs, ref=1)
+
+
+class OctaveBand:
+    params = ([1, 10], [1, 3, 12, 24])
+    param_names = ["delta_f", "bands"]
+
+    def setup(self, delta_f, bands):
+        self.freqs = librosa.fft_frequencies(sr=48000, n_fft=int(48000 / delta_f))
+
+    def time_octave_band(self, delta_f, bands):
+        acoustic_util.octave_band(bands, self.freqs)
+
+    def time_filter_bank_uncached(self, delta_f, bands):
+        acoustic_util._FILTER_BANKS.clear()
+        acoustic_util.filter_bank(bands, 48000, int(48000 / delta_f))
+
+
+class ArrayResampler:
+    params = ([1, 10], [1, 60])
+    param_names = ["delta_f", "delta_t"]
+
+    def setup(self, delta_f, delta_t):
+        # Ten minutes of half overlapped frames of a 48 kHz clip
+        n_frames = 2 * 600 * delta_f
+        n_freqs = 48000 // (2 * delta_f) + 1
+        index = pd.date_range(T0, periods=n_frames, freq=pd.Timedelta(seconds=0.5 / delta_f))
+        self.df = pd.DataFrame(np.random.default_rng(0).random((n_frames, n_freqs)) * 50, index=index)
+
+    def time_array_resampler(self, delta_f, delta_t):
+        acoustic_util.array_resampler(self.df, delta_t=delta_t)
+
+    def peakmem_array_resampler(self, delta_f, delta_t):
+        acoustic_util.array_resampler(self.df, delta_t=delta_t)
@@ -0,0 +1,90 @@
+"""
+End to end benchmarks of NoiseAnalysisPipeline.generate_psds on local wav files.
+
+DateRangeHLSStream is swapped for LocalClipStream so no S3 access is needed: the benchmark covers everything after the
+download and ffmpeg conversion.
+"""
+import datetime as dt
+import tempfile
+import time
+
+import soundfile as sf
+
+from orcasound_noise.pipeline import pipeline
+from orcasound_noise.utils import Hydrophone
+
+from .common import clip_path, clip_seconds, write_synthetic_clips
+
+
+class LocalClipStream:
+    """
+    Stand-in for DateRangeHLSStream that serves existing wav files as consecutive clips.
+    """
+
+    clips = []
+
+    def __init__(self, feed_url, polling_interval, start_unix_time, end_unix_time, wav_dir, overwrite_output=False):
+        self.start = dt.datetime.fromtimestamp(start_unix_time)
+        self.remaining = list(self.clips)
+        self.offset = 0.0
+
+    def _next(self):
+        path = self.remaining.pop(0)
+        start = self.start + dt.timedelta(seconds=self.offset)
+        self.offset += sf.info(path).duration
+        return path, start.strftime("%Y_%m_%d_%H_%M_%S")
+
+    def get_next_clip(self, current_clip_name=None):
+        path, start = self._next()
+        return path, start, None
+
+    def get_all_clips(self):
+        paths, starts = [], []
+        while not self.is_stream_over():
+            path, start = self._next()
+            paths.append(path)
+            starts.append(start)
+        return paths, starts
+
+    def is_stream_over(self):
+        return len(self.remaining) == 0
+
+
+class GeneratePsds:
+    params = (["safe", "fast"], [1, 10], [1, 60], [None, 3])
+    param_names = ["mode", "delta_f", "delta_t", "bands"]
+    timeout = 900
+
+    clips = ["live000", "live001", "live002", "noise_10min"]
+
+    def setup_cache(self):
+        write_synthetic_clips()
+
+    def setup(self, mode, delta_f, delta_t, bands):
+        LocalClipStream.clips = [clip_path(c) for c in self.clips]
+        self._stream = pipeline.DateRangeHLSStream
+        pipeline.DateRangeHLSStream = LocalClipStream
+        self.wav_folder = tempfile.TemporaryDirectory()
+        self.pipeline = pipeline.NoiseAnalysisPipeline(Hydrophone.SANDBOX, delta_t=delta_t, delta_f=delta_f, bands=bands,
+                                                       wav_folder=self.wav_folder.name, no_auth=True, mode=mode)
+
+    def teardown(self, *params):
+        pipeline.DateRangeHLSStream = self._stream
+        self.wav_folder.cleanup()
+
+    def _run(self):
+        start = dt.datetime(2023, 1, 1, 12, 0, 0)
+        self.pipeline.generate_psds(start, start + dt.timedelta(hours=1))
+
+    def time_generate_psds(self, *params):
+        self._run()
+
+    def peakmem_generate_psds(self, *params):
+        self._run()
+
+    def track_throughput(self, *params):
+        start = time.perf_counter()
+        self._run()
+        return sum(clip_seconds(c) for c in self.clips) / (time.perf_counter() - start)
+
+    track_throughput.unit = "audio s / s"
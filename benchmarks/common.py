@@ -0,0 +1,42 @@
+import os
+
+import numpy as np
+import soundfile as sf
+
+TEST_FILES = os.path.join(os.path.dirname(__file__), "..", "test_files")
+
+# Short HLS clips and a 24 bit log chirp shipped with the repo
+CLIPS = {
+    "live000": os.path.join(TEST_FILES, "live000.wav"),
+    "live001": os.path.join(TEST_FILES, "live001.wav"),
+    "live002": os.path.join(TEST_FILES, "live002.wav"),
+    "logchirp": os.path.join(TEST_FILES, "logchirp20_20000_24bit.wav"),
+}
+
+# Generated clips, the length of the intermediate wav files the pipeline writes by default
+SYNTHETIC_SECONDS = {"noise_10min": 600}
+SYNTHETIC_SR = 48000
+
+
+def synthetic_path(name):
+    return os.path.abspath(name + ".wav")
+
+
+def write_synthetic_clips():
+    """
+    Write the synthetic clips into the current directory, which asv keeps for the whole run of setup_cache users.
+    """
+
+    rng = np.random.default_rng(0)
+    for name, seconds in SYNTHETIC_SECONDS.items():
+        with sf.SoundFile(synthetic_path(name), "w", SYNTHETIC_SR, 1, subtype="PCM_16") as f:
+            for _ in range(seconds // 60):
+                f.write(rng.normal(0, 0.1, SYNTHETIC_SR * 60).astype("float32"))
+
+
+def clip_path(name):
+    return CLIPS[name] if name in CLIPS else synthetic_path(name)
+
+
+def clip_seconds(name):
+    return sf.info(clip_path(name)).duration
@@ -1,4 +1,6 @@
 import datetime as dt
+import os
+import tempfile
 from copy import deepcopy
 
 import streamlit as st
@@ -9,6 +11,8 @@ from src.orcasound_noise.utils import Hydrophone
 from src.orcasound_noise.pipeline import pipeline
 from src.orcasound_noise.pipeline import acoustic_util
 
+# Local catalog of the archive, so reruns don't list every file in S3 again
+CATALOG = os.path.join(tempfile.gettempdir(), "orcasound_noise_catalog.sqlite")
 
 
 col1, col2, col3, radio = st.columns([3,1,1,2])
@@ -25,7 +29,7 @@ with col1:
         key='spec_hydro'
     )
 
-delta_ts, delta_fs, _ = accessor.NoiseAccessor(Hydrophone[selected_hydrophone.upper().replace(" ", "_")]).get_options()
+delta_ts, delta_fs, _ = accessor.NoiseAccessor(Hydrophone[selected_hydrophone.upper().replace(" ", "_")], catalog=CATALOG).get_options()
 
 with col2:
     delta_t = st.selectbox(
@@ -76,7 +80,7 @@ end = dt.datetime.combine(end_date, end_time)
 
 @st.cache
 def get_spec_dfs(selected_hydrophone):
-    return accessor.NoiseAccessor(Hydrophone[selected_hydrophone.upper().replace(" ", "_")]).create_df(start=start,end=end, delta_t=delta_t, delta_f=delta_f)
+    return accessor.NoiseAccessor(Hydrophone[selected_hydrophone.upper().replace(" ", "_")], catalog=CATALOG).create_df(start=start,end=end, delta_t=delta_t, delta_f=delta_f)
 
 # Get data
 try:                                                                    
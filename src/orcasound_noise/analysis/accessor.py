@@ -4,18 +4,43 @@ import datetime as dt
 import os
 from tempfile import TemporaryDirectory
 
+import numpy as np
 import pandas as pd
 
 from ..utils.file_connector import S3FileConnector
+from ..utils.dataset import read_dataset
+from ..utils.encoding import read_parquet
+from ..utils.rollup import ROLLUP_COUNT_COLUMN, ROLLUP_LEVELS, rollup_levels, split_counts
 from ..utils import Hydrophone
 
 class NoiseAccessor:
 
-    def __init__(self, hydrophone: Hydrophone):
-        self.connector = S3FileConnector(hydrophone, no_sign=True)
-
-
-    def create_df(self, start, end, delta_t=1, delta_f="3oct", round_timestamps=False, is_broadband=False):
+    def __init__(self, hydrophone: Hydrophone, dataset=None, catalog=None):
+        """
+        * hydrophone: Hydrophone enum of the files to access.
+        * dataset: Str, default None. Root of files written with the pipeline's layout="dataset", a local folder or an
+          s3:// uri such as "s3://<save bucket>/<save folder>". Queries then only read the row groups and columns they
+          need instead of downloading whole files.
+        * catalog: Str, default None. Path of a local SQLite catalog of the archive's files, see utils/catalog.py.
+          create_df and get_options then query it instead of listing the whole archive every call.
+        """
+        self.hydrophone = hydrophone
+        self.dataset = dataset
+        self.catalog = catalog
+        self._connector = None
+
+    @property
+    def connector(self):
+        if self._connector is None:
+            self._connector = S3FileConnector(self.hydrophone, no_sign=True, catalog=self.catalog)
+        return self._connector
+
+    @connector.setter
+    def connector(self, connector):
+        self._connector = connector
+
+    def create_df(self, start, end, delta_t=1, delta_f="3oct", round_timestamps=False, is_broadband=False,
+                  columns=None, resolution=None):
         """
         Creates a dataframe of one days worth of data.
 
@@ -24,10 +49,33 @@ class NoiseAccessor:
         * delta_t: Int, Time frequency to find
         * delta_f: Str, Hz frequency to find. Use format '50hz' for linear hz bands or '3oct' for octave bands
         * round_timestamps: Bool, default False. Set to True to round timestamps to the delta_t frequency. Good for when grouping by time.
+        * columns: List, default None. Frequency columns to read, only from a dataset. Defaults to all of them.
+        * resolution: Int, default None. Seconds per row to return instead of delta_t, a multiple of it that divides a
+          day. Each day's rows are read from the coarsest rollup level, see pipeline/rollup.py, that divides
+          resolution and has every bin of the day, else from delta_t, and averaged up to resolution. Rows are then the
+          bins that start in [start, end], and round_timestamps doesn't apply.
 
         # Return: Dataframe with request data in daterange. Index is datetime
         """
 
+        if resolution is not None:
+            return self._create_resolution_df(start, end, delta_t, delta_f, is_broadband, columns, resolution)
+
+        if self.dataset is not None:
+            df = read_dataset(self.dataset, self.hydrophone.value.name, start, end, delta_t,
+                              "broadband" if is_broadband else delta_f, columns=columns)
+            return self._finish_df(df, start, end, delta_t, round_timestamps)
+
+        # Compile
+        df = pd.concat(self._archive_frames(start, end, delta_t, delta_f, is_broadband), axis=0)
+
+        return self._finish_df(df, start, end, delta_t, round_timestamps)
+
+    def _archive_frames(self, start, end, delta_t, delta_f, is_broadband):
+        """
+        Dataframes of the archive files of a product overlapping [start, end], each trimmed to the range of its name.
+        """
+
         # Setup
         dfs = []
 
@@ -40,7 +88,7 @@ class NoiseAccessor:
 
                 # Load df
                 this_start, this_end, _, _, _  = S3FileConnector.parse_filename(filename)
-                this_df = pd.read_parquet(save_location)
+                this_df = read_parquet(save_location)
                 try:
                     this_df = this_df[(this_df.index >= this_start) & (this_df.index <= this_end)]
                 except KeyError:
@@ -48,14 +96,91 @@ class NoiseAccessor:
                 finally:
                     dfs.append(this_df)
 
-        # Compile
-        df = pd.concat(dfs, axis=0)
+        return dfs
+
+    def _create_resolution_df(self, start, end, delta_t, delta_f, is_broadband, columns, resolution):
+        """
+        create_df at resolution seconds per row, each day from the coarsest stored level that has all of its rows.
+
+        Rollups are built a day at a time, so coverage is checked per day: a level covers a day when the counts of its
+        rows add up to every delta_t row of its bins in the day. Days that no level covers, e.g. with gaps in the
+        recordings, take the level with the most base rows for the day, the coarsest on ties, so days whose rollups
+        weren't built, or were built before all of their files arrived, come from the finer levels.
+        """
+
+        if resolution % delta_t != 0 or 86400 % resolution != 0:
+            raise ValueError("resolution must be a multiple of delta_t that divides a day")
+
+        levels = sorted([level for level in ROLLUP_LEVELS
+                         if delta_t < level and level % delta_t == 0 and resolution % level == 0], reverse=True)
+        one_day = dt.timedelta(days=1)
+        days = list(pd.date_range(pd.Timestamp(start).floor("D"), pd.Timestamp(end).floor("D"), freq="D"))
+        best, covered, empty = {}, set(), None
+        for level in levels + [delta_t]:
+            todo = [day for day in days if day not in covered]
+            if not todo:
+                break
+            level_start, level_end = max(pd.Timestamp(start), todo[0]), min(pd.Timestamp(end), todo[-1] + one_day)
+            if self.dataset is not None:
+                # Rollups need their counts to be averaged further
+                level_columns = None if columns is None or level == delta_t else list(columns) + [ROLLUP_COUNT_COLUMN]
+                df = self.create_df(level_start, level_end, delta_t=level, delta_f=delta_f, is_broadband=is_broadband,
+                                    columns=level_columns)
+            else:
+                dfs = self._archive_frames(level_start, level_end, level, delta_f, is_broadband)
+                if len(dfs) == 0 and level != delta_t:
+                    continue
+                df = self._finish_df(pd.concat(dfs, axis=0), level_start, level_end, level, False)
+            if len(df) == 0:
+                empty = df
+                continue
+
+            df, counts = split_counts(df)
+            df_days = df.index.floor("D")
+            for day in todo:
+                in_day = df_days == day
+                total = counts[in_day].sum()
+                if total > 0 and (day not in best or total > best[day][0]):
+                    best[day] = (total, level, df[in_day], counts[in_day])
+                if total > 0 and total == self._full_count(start, end, day, level, delta_t):
+                    covered.add(day)
+
+        if not best:
+            df = split_counts(empty)[0] if empty is not None else pd.DataFrame()
+        else:
+            df = pd.concat([best[day][2] for day in sorted(best)])
+            counts = np.concatenate([best[day][3] for day in sorted(best)])
+            if any(best[day][1] != resolution for day in best):
+                df, _ = rollup_levels(df, resolution, counts)
+        if columns is not None:
+            df = df[[str(column) for column in columns]]
+
+        return df[(df.index >= start) & (df.index <= end)]
+
+    @staticmethod
+    def _full_count(start, end, day, level, delta_t):
+        """
+        Number of delta_t rows in the bins of level seconds of day that start in [start, end].
+        """
+
+        step = pd.Timedelta(seconds=level)
+        first = max(pd.Timestamp(start), day).ceil(step)
+        last = min(pd.Timestamp(end), day + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1))
+        if last < first:
+            return 0
+        return ((last - first) // step + 1) * (level // delta_t)
+
+    def _finish_df(self, df, start, end, delta_t, round_timestamps):
+        """
+        Drop duplicate timestamps, round them if asked and trim to [start, end].
+        """
+
         df = df[~df.index.duplicated(keep='first')]
 
         # Round
         if round_timestamps:
             df.index = pd.Series(df.index).apply(self._round_seconds, round_to=delta_t)
-            df = df.asfreq(str(delta_t) + 's')
+            df = df.asfreq(pd.Timedelta(seconds=delta_t))
 
         # Clean
         df = df[~df.index.duplicated(keep='first')]
@@ -92,6 +217,9 @@ class NoiseAccessor:
         # Return
         Tuple of lists.  Delta_t values, Delta_f values, frequency types. 
         """
+        if self.connector.catalog is not None:
+            return self.connector.catalog.options()
+
         delta_fs = []
         delta_ts = []
         freq_types = []
@@ -1,15 +1,134 @@
 import os
 import datetime
+import warnings
+from collections import namedtuple
+from contextlib import contextmanager
 
 import librosa
 import librosa.display
+import soundfile as sf
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from skimage.restoration import denoise_wavelet
 import numpy as np
 import pandas as pd
+from scipy import sparse
+import scipy.fft
 import plotly.graph_objects as go
 
+# One output of the spectral stage: a linear PSD (bands=None), octave bands (bands=N) or broadband level,
+# averaged over delta_t seconds
+Product = namedtuple("Product", "delta_t bands is_broadband", defaults=(None, False))
+
+# How the STFT of a clip is computed for a set of products, see plan_stft
+StftPlan = namedtuple("StftPlan", "n_fft hop_length window strategy")
+
+STFT_STRATEGIES = ("frames", "welch", "auto")
+
+# Number of frames each output bin must average before "auto" drops the frame overlap
+WELCH_MIN_FRAMES = 64
+
+
+def plan_stft(sr, delta_f, products, strategy="frames"):
+    """
+    Choose the STFT window, hop and averaging strategy for computing products at delta_f.
+
+    The window is always a Hann window of n_fft = sr/delta_f samples. The strategy picks the hop:
+
+    * "frames": half overlapped frames, hop = n_fft/2, as the spectral stage has always used.
+    * "welch": non-overlapping frames, hop = n_fft, so each output bin is a Welch-style averaged periodogram. This
+      computes half as many frames. Levels averaged over many frames barely move (measured at delta_t=60: within
+      0.05 dB for octave bands and 0.03 dB for broadband) but a single linear PSD bin has fewer frames behind it and is
+      noticeably noisier (up to 2 dB at delta_f=1), so it is only worth it for band and broadband products. Bins that
+      only hold a few frames, like partial bins at the ends of a clip, can differ by several dB.
+    * "auto": "welch" when no product is a linear PSD and every product averages at least WELCH_MIN_FRAMES frames,
+      otherwise "frames".
+
+    Whatever the strategy, the hop is capped at the shortest delta_t so every output bin gets at least one frame.
+
+    Args:
+        sr: int. Sample rate of the audio.
+        delta_f: Int, number of hz per frequency bin of the STFT
+        products: list of Product that will be computed from the STFT.
+        strategy: str, default "frames". One of "frames", "welch" or "auto".
+
+    Returns:
+        StftPlan of (n_fft, hop_length, window, strategy) with strategy resolved to "frames" or "welch".
+    """
+
+    if strategy not in STFT_STRATEGIES:
+        raise ValueError(f"Unknown STFT strategy {strategy!r}, expected one of {STFT_STRATEGIES}")
+
+    n_fft = int(sr / delta_f)
+    min_delta_t = min(p.delta_t for p in products)
+
+    if strategy == "auto":
+        linear = any(p.bands is None and not p.is_broadband for p in products)
+        strategy = "welch" if not linear and min_delta_t * sr >= WELCH_MIN_FRAMES * n_fft else "frames"
+
+    hop_length = n_fft if strategy == "welch" else int(n_fft / 2)
+    hop_length = max(1, min(hop_length, int(min_delta_t * sr)))
+
+    return StftPlan(n_fft, hop_length, "hann", strategy)
+
+
+FFT_BACKENDS = ("numpy", "scipy", "pyfftw")
+
+
+@contextmanager
+def use_fft_backend(backend=None, workers=1):
+    """
+    Run librosa's FFTs with the given backend and number of threads inside the with block.
+
+    * "numpy": numpy.fft, always single threaded.
+    * "scipy": scipy.fft, splitting each STFT's frames across workers threads.
+    * "pyfftw": pyFFTW's scipy interface with its plan cache enabled, so repeated STFTs of the same n_fft reuse the
+      FFTW plan. Needs the optional pyfftw package.
+
+    The FFT library is a librosa global, so don't switch backends from several threads at once.
+
+    Args:
+        backend: str, default None. One of "numpy", "scipy" or "pyfftw". None keeps librosa's FFT library, numpy.fft
+            unless it was changed, for one worker and uses "scipy" for more, so the threads are actually used.
+        workers: int, default 1. Number of threads for the "scipy" and "pyfftw" backends.
+    """
+
+    if backend is None:
+        if workers <= 1:
+            yield
+            return
+        backend = "scipy"
+
+    if backend == "numpy":
+        lib = np.fft
+    elif backend == "scipy":
+        lib = scipy.fft
+    elif backend == "pyfftw":
+        try:
+            import pyfftw
+            import pyfftw.interfaces.scipy_fft
+        except ImportError as e:
+            raise ImportError("The pyfftw FFT backend needs the pyfftw package: pip install pyfftw") from e
+        pyfftw.interfaces.cache.enable()
+        pyfftw.config.NUM_THREADS = workers
+        lib = pyfftw.interfaces.scipy_fft
+    else:
+        raise ValueError(f"Unknown FFT backend {backend!r}, expected one of {FFT_BACKENDS}")
+
+    # set_fftlib is deprecated in newer librosa but is the one hook that works across the versions we support
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        previous = librosa.get_fftlib()
+        librosa.set_fftlib(lib)
+    try:
+        with scipy.fft.set_workers(workers):
+            yield
+    finally:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            librosa.set_fftlib(previous)
+
+
 def apply_per_channel_energy_norm(spectrogram):
     """Apply PCEN.
 
@@ -136,7 +255,8 @@ def wav_to_array(filepath,
                  delta_f=10,
                  transforms=[wavelet_denoising],
                  ref=1,
-                 bands=None
+                 bands=None,
+                 dtype="float64"
                  ):
     """
     This function converts a wavfile to a dataframe of power spectral density, with the index as the timestamp from the start of the wav file and the columns as the frequency bin.  This function also calculates the broadband average noise level of the input wavefile before the dB conversion per time step after the FFT calculation.
@@ -156,63 +276,570 @@ def wav_to_array(filepath,
         bands: int. default=None. If not None this value selects how many octave subdivisions the frequency spectrum should
           be divided into, where each frequency step is 1/Nth of an octave with N=bands. Based on the ISO R series.
           Accepts values 1, 3, 6, 12, or 24.
+        dtype: str, default "float64". Precision of the computed levels, see wav_to_products.
 
     Returns:
         Tuple of (df1, df2)
     """
 
+    psd_product = Product(delta_t, bands)
+    broadband_product = Product(delta_t, is_broadband=True)
+    results = wav_to_products(filepath, [psd_product, broadband_product], t0=t0, delta_f=delta_f,
+                              transforms=transforms, ref=ref, dtype=dtype)
+
+    return results[psd_product], results[broadband_product]
+
+
+def wav_to_products(filepath,
+                    products,
+                    t0=datetime.datetime.now(),
+                    delta_f=10,
+                    transforms=[wavelet_denoising],
+                    ref=1,
+                    memory_limit=None,
+                    dtype="float64",
+                    stft_strategy="frames",
+                    fft_backend=None,
+                    fft_workers=1,
+                    preroll=None,
+                    postroll=None,
+                    partial=False
+                    ):
+    """
+    Compute several spectral products from one wavfile, decoding it and running the STFT only once.
+
+    Every product shares the STFT at delta_f: a linear PSD product is the spectrogram itself, an octave band product
+    reduces it with the filter bank for its bands, and a broadband product sums it over frequency. Each product is then
+    averaged over its own delta_t, exactly as wav_to_array does for a single PSD and broadband pair.
+
+    If memory_limit is set and the clip's STFT would not fit in it, the file is streamed instead of loaded: see
+    stream_wav_to_products.
+
+    The audio and STFT are always single precision. With dtype="float32" the levels derived from them stay in single
+    precision too, halving the memory of the frame values and of the returned dataframes. Levels are rounded to
+    0.01 dB per frame either way, so float32 results differ from float64 ones by at most about one rounding step
+    (0.01 dB), which happens when a frame's level lands on a rounding boundary in one precision and not the other.
+
+    The window and hop come from plan_stft(sr, delta_f, products, stft_strategy), and the FFTs run on
+    use_fft_backend(fft_backend, fft_workers).
+
+    A clip cut from a longer recording can be given the samples just around it as preroll and postroll, so that its
+    first and last frames see the real signal instead of zero padding, the overlap-save way. With a postroll the frame
+    centred on the end of the clip is left to the next clip, so consecutive clips never share a frame. With
+    partial=True the per-bin sums and frame counts are returned instead of levels, so that ProductStitcher can add
+    up the bins that straddle two clips.
+
+    Args:
+        filepath: file path to .wav
+        products: list of Product to compute.
+        t0: datetime.  starting time of the recording.
+        delta_f: Int, number of hz per frequency bin of the STFT
+        transforms: List of functions to apply to DB-spectogram of the linear PSD products.
+        ref: float.  reference level for the amplitude to dB conversion.  must be an absolute value, not dB.
+        memory_limit: int, default None. Approximate number of bytes the STFT working set may use.
+        dtype: str, default "float64". Either "float64" or "float32", the precision of the levels.
+        stft_strategy: str, default "frames". STFT strategy passed to plan_stft.
+        fft_backend: str, default None. FFT backend passed to use_fft_backend.
+        fft_workers: int, default 1. Number of FFT threads.
+        preroll: np.ndarray, default None. Samples just before the clip, at least n_fft/2 of them are used.
+        postroll: np.ndarray, default None. Samples just after the clip, at least n_fft/2 of them are used.
+        partial: bool, default False. Return the partial bins of the clip instead of levels.
+
+    Returns:
+        Dict of {product: dataframe}, or with partial=True dict of {product: (dataframe of sums, array of counts)}
+    """
+
+    if memory_limit is not None:
+        info = sf.info(filepath)
+        plan = plan_stft(info.samplerate, delta_f, products, stft_strategy)
+        frames_per_block = _frames_per_block(info, plan, memory_limit)
+        if frames_per_block is not None:
+            return stream_wav_to_products(filepath, products, t0=t0, delta_f=delta_f, transforms=transforms, ref=ref,
+                                          frames_per_block=frames_per_block, dtype=dtype, stft_strategy=stft_strategy,
+                                          fft_backend=fft_backend, fft_workers=fft_workers, preroll=preroll,
+                                          postroll=postroll, partial=partial)
+
     # Load the .wav file
     y, sr = librosa.load(filepath, sr=None)
 
+    return array_to_products(y, sr, products, t0=t0, delta_f=delta_f, transforms=transforms, ref=ref, dtype=dtype,
+                             stft_strategy=stft_strategy, fft_backend=fft_backend, fft_workers=fft_workers,
+                             preroll=preroll, postroll=postroll, partial=partial)
+
+
+def array_to_products(y,
+                      sr,
+                      products,
+                      t0=datetime.datetime.now(),
+                      delta_f=10,
+                      transforms=[wavelet_denoising],
+                      ref=1,
+                      dtype="float64",
+                      stft_strategy="frames",
+                      fft_backend=None,
+                      fft_workers=1,
+                      preroll=None,
+                      postroll=None,
+                      partial=False
+                      ):
+    """
+    Compute products from audio samples already in memory, such as a clip decoded straight from .ts segments.
+
+    Same as wav_to_products without the file read, see it for the arguments.
+
+    Args:
+        y: np.ndarray. Mono float32 audio samples.
+        sr: int. Sample rate of y.
+
+    Returns:
+        Dict of {product: dataframe}
+    """
+
     # Set FFT parameters
-    n_fft = int(sr / delta_f)
-    hop_length = int(n_fft / 2)
-
-    # Apply the STFT
-    D_highres = librosa.stft(y, hop_length=hop_length, n_fft=n_fft)
-    # Convert from amplitude to decibels
-    spec = librosa.amplitude_to_db(np.abs(D_highres), ref=ref)
-    # Save the frequencies and time for Dataframe construction
-    freqs = librosa.core.fft_frequencies(sr=sr, n_fft=n_fft)
-    secs = librosa.core.frames_to_time(np.arange(spec.shape[1]), sr=sr, n_fft=n_fft, hop_length=hop_length)
-    times = [t0 + datetime.timedelta(seconds=x) for x in secs]
-
-    # Apply transforms
-    for transform_func in transforms:
-        spec = transform_func(spec)
-
-    rms = []
-    delta_f = sr / n_fft
-    DT = D_highres.transpose()
-    # Sum over the frequencies for each time to calculate broadband
-    for i in range(len(DT)):
-        rms.append(delta_f * np.sum(np.abs(DT[i, :])))
-
-    # Create the PSD Dataframe
-    df = pd.DataFrame(spec.transpose(), columns=freqs, index=times)
-    df = df.astype(float).round(2)
-    df.columns = df.columns.map(str)
-
-    # Create the broadband dataframe
-    rms_df = pd.DataFrame(rms, index=times)
-    rms_df = rms_df.astype(float).round(2)
-    rms_df.columns = rms_df.columns.map(str)
-    # Average over desired time and convert to decibels for the broadband
-    rms_df = array_resampler_bands(df=rms_df, delta_t=delta_t)
-
-    # Calculate bands if specified
-    if bands is not None:
-        # Convert to bands
-        oct_unscaled, fm = spec_to_bands(np.abs(DT), bands, delta_f, freqs=freqs, ref=ref)
-        oct_df = pd.DataFrame(oct_unscaled, columns=fm, index=times).astype(float).round(2)
-        # Average over desired time and convert to decibels for bands
-        oct_df = array_resampler_bands(df=oct_df, delta_t=delta_t)
-        return oct_df, rms_df
+    n_fft, hop_length, window, _ = plan_stft(sr, delta_f, products, stft_strategy)
+
+    # Apply the STFT, to the clip padded with its neighbouring samples like librosa's centred frames pad with zeros
+    n_frames = _n_frames(len(y), hop_length, postroll)
+    y = _pad_edges(y, n_fft // 2, n_fft // 2, preroll, postroll)
+    with use_fft_backend(fft_backend, fft_workers):
+        magnitude = np.abs(librosa.stft(y, hop_length=hop_length, n_fft=n_fft, window=window, center=False))
+    magnitude = magnitude[:, :n_frames]
+    del y
+
+    # The whole clip is a single block, so its own peaks set the 80 dB floors
+    bins = _ProductBins(products, t0, sr, n_fft, hop_length, dtype=dtype)
+    bins.add(0, _frame_values(magnitude, products, sr, n_fft, ref, transforms=transforms, dtype=dtype))
+
+    return bins.partials() if partial else bins.results()
+
+
+def stream_wav_to_products(filepath,
+                           products,
+                           t0=datetime.datetime.now(),
+                           delta_f=10,
+                           transforms=[],
+                           ref=1,
+                           frames_per_block=256,
+                           dtype="float64",
+                           stft_strategy="frames",
+                           fft_backend=None,
+                           fft_workers=1,
+                           preroll=None,
+                           postroll=None,
+                           partial=False
+                           ):
+    """
+    Compute the same products as wav_to_products while holding only frames_per_block STFT frames in memory.
+
+    The wavfile is read in overlapping blocks, each block is transformed, and the frames are reduced into running
+    per-delta_t sums straight away, so memory no longer grows with the clip length. The output is equal to the one-shot
+    path. The 80 dB floor that amplitude_to_db applies to PSD and band levels is relative to the loudest frame of the
+    whole clip, so when PSD or band products are requested the file is transformed twice: once to find those peaks and
+    once to accumulate. Broadband-only requests need a single pass.
+
+    Args:
+        filepath: file path to a .wav readable by soundfile
+        products: list of Product to compute.
+        t0: datetime.  starting time of the recording.
+        delta_f: Int, number of hz per frequency bin of the STFT
+        transforms: Must be empty, transforms work on the whole spectrogram and can't be streamed.
+        ref: float.  reference level for the amplitude to dB conversion.  must be an absolute value, not dB.
+        frames_per_block: int. Number of STFT frames to compute at a time.
+        dtype: str, default "float64". Either "float64" or "float32", the precision of the levels.
+        stft_strategy: str, default "frames". STFT strategy passed to plan_stft.
+        fft_backend: str, default None. FFT backend passed to use_fft_backend.
+        fft_workers: int, default 1. Number of FFT threads.
+        preroll: np.ndarray, default None. Samples just before the clip, see wav_to_products.
+        postroll: np.ndarray, default None. Samples just after the clip, see wav_to_products.
+        partial: bool, default False. Return the partial bins of the clip instead of levels, see wav_to_products.
+
+    Returns:
+        Dict of {product: dataframe}
+    """
+
+    if transforms:
+        raise ValueError("Spectrogram transforms need the whole clip and can't be used when streaming.")
+
+    sr = sf.info(filepath).samplerate
+    n_fft, hop_length, window, _ = plan_stft(sr, delta_f, products, stft_strategy)
+
+    with use_fft_backend(fft_backend, fft_workers):
+        # First pass: find the peaks the 80 dB floors are relative to
+        floors = {}
+        keys = set(_product_key(p) for p in products) - {"broadband"}
+        if keys:
+            for _, magnitude in _stft_blocks(filepath, n_fft, hop_length, frames_per_block, window, preroll,
+                                             postroll):
+                for key, peak in _frame_peaks(magnitude, keys, sr, n_fft, ref).items():
+                    floors[key] = np.maximum(floors.get(key, -np.inf), peak - 80.0)
+
+        # Second pass: reduce each block's frames into per-delta_t sums
+        bins = _ProductBins(products, t0, sr, n_fft, hop_length, dtype=dtype)
+        for first_frame, magnitude in _stft_blocks(filepath, n_fft, hop_length, frames_per_block, window, preroll,
+                                                   postroll):
+            bins.add(first_frame, _frame_values(magnitude, products, sr, n_fft, ref, floors=floors, dtype=dtype))
 
+    return bins.partials() if partial else bins.results()
+
+
+def _product_key(product):
+    """
+    Key of the per-frame values a product is averaged from: "psd", "broadband" or the number of octave bands.
+    """
+
+    if product.is_broadband:
+        return "broadband"
+    elif product.bands is not None:
+        return product.bands
     else:
-        # Convert PSD back to amplitude, average over time period, and convert back to decibels
-        df = array_resampler(df=df, delta_t=delta_t)
-        return df, rms_df
+        return "psd"
+
+
+def _frame_peaks(magnitude, keys, sr, n_fft, ref):
+    """
+    Loudest level in dB of the PSD and octave band frames of an STFT magnitude block, before any floor.
+    """
+
+    peaks = {}
+    for key in keys:
+        if key == "psd":
+            peaks[key] = librosa.amplitude_to_db(np.array([magnitude.max()]), ref=ref, top_db=None)[0]
+        else:
+            octaves, _ = spec_to_bands(magnitude.T, key, sr / n_fft, freqs=None, ref=ref, sr=sr, top_db=None)
+            peaks[key] = octaves.max()
+
+    return peaks
+
+
+def _frame_values(magnitude, products, sr, n_fft, ref, floors=None, transforms=(), dtype="float64"):
+    """
+    Convert an STFT magnitude block to the per-frame values each product is averaged from.
+
+    * magnitude: array of shape (freqs, frames)
+    * floors: dict of dB floors by product key. If None, the block is the whole clip and amplitude_to_db sets
+      the usual 80 dB floor from its own peak.
+    * transforms: functions to apply to the dB spectrogram of the linear PSD
+    * dtype: precision of the returned values
+
+    # Return
+    Dict of {product key: array of shape (frames, columns)}. PSD values are amplitudes, band values are dB and broadband
+    values are summed amplitudes, all rounded to 0.01 in the units they are stored in.
+    """
+
+    delta_f = sr / n_fft
+    top_db = 80.0 if floors is None else None
+    values = {}
+    for key in set(_product_key(p) for p in products):
+        if key == "broadband":
+            # Sum over the frequencies for each time to calculate broadband
+            rms = delta_f * np.sum(magnitude, axis=0)
+            values[key] = np.round(rms.astype(dtype), 2)[:, np.newaxis]
+
+        elif key == "psd":
+            # Convert from amplitude to decibels
+            spec = librosa.amplitude_to_db(magnitude, ref=ref, top_db=top_db)
+            if floors is not None:
+                spec = np.maximum(spec, floors[key])
+            # Apply transforms
+            for transform_func in transforms:
+                spec = transform_func(spec)
+            # Convert back to amplitude for averaging
+            values[key] = librosa.db_to_amplitude(np.round(spec.transpose().astype(dtype), 2))
+
+        else:
+            # Convert to bands
+            octaves, _ = spec_to_bands(magnitude.T, key, delta_f, freqs=None, ref=ref, sr=sr, top_db=top_db)
+            if floors is not None:
+                octaves = np.maximum(octaves, floors[key])
+            values[key] = np.round(octaves.astype(dtype), 2)
+
+    return values
+
+
+class _ProductBins:
+    """
+    Running per-delta_t sums of every product's frame values, for STFT frames that arrive in time order.
+    """
+
+    def __init__(self, products, t0, sr, n_fft, hop_length, dtype="float64"):
+        self.products = products
+        self.t0 = pd.Timestamp(t0)
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.dtype = dtype
+        self.origin = None
+        self.sums = {product: _BinnedSum() for product in products}
+
+    def add(self, first_frame, values):
+        """
+        Add the frame values of a block, as returned by _frame_values, starting at frame number first_frame.
+        """
+
+        n_frames = len(next(iter(values.values())))
+        secs = librosa.core.frames_to_time(np.arange(first_frame, first_frame + n_frames), sr=self.sr,
+                                           n_fft=self.n_fft, hop_length=self.hop_length)
+        # Frame times in ns from t0, at the microsecond precision of t0 + datetime.timedelta(seconds=secs)
+        offsets = np.round(secs * 1e6).astype(np.int64) * 1000
+
+        if self.origin is None:
+            # DataFrame.resample counts bins from midnight of the first timestamp
+            self.origin = (self.t0 + pd.Timedelta(int(offsets[0]), 'ns')).normalize()
+
+        for product in self.products:
+            bins = (self.t0.value - self.origin.value + offsets) // int(product.delta_t * 1e9)
+            self.sums[product].add(bins, values[_product_key(product)])
+
+    def results(self):
+        """
+        Get the averaged products in decibels, as dict of {product: dataframe}.
+        """
+
+        results = {}
+        for product in self.products:
+            first_bin, means = self.sums[product].mean()
+            index = _bin_index(self.origin, first_bin, len(means), product.delta_t)
+            results[product] = _levels(product, index, means, self.dtype)
+
+        return results
+
+    def partials(self):
+        """
+        Get the sums and frame counts of every bin the frames fell in, as dict of {product: (dataframe, counts)}.
+        """
+
+        partials = {}
+        for product in self.products:
+            bins, sums, counts = self.sums[product].totals()
+            index = self.origin + pd.to_timedelta(bins * product.delta_t, 's')
+            partials[product] = (pd.DataFrame(sums, index=index), counts)
+
+        return partials
+
+
+def _levels(product, index, means, dtype):
+    """
+    Dataframe of a product's levels in decibels from the means of its per-frame values.
+    """
+
+    means = means.astype(dtype)
+    if _product_key(product) == "psd":
+        # Convert back to decibels
+        return pd.DataFrame(librosa.amplitude_to_db(means, ref=1), index=index.rename('ind'))
+    # Convert to decibels
+    return pd.DataFrame(librosa.amplitude_to_db(means, ref=1, top_db=200.0), index=index)
+
+
+class ProductStitcher:
+    """
+    Join the partial bins of consecutive clips into finished products, see wav_to_products(partial=True).
+
+    A bin that straddles two clips gets frames from both: their sums and counts are added up before averaging, so every
+    bin comes out once, averaged over all its frames, and in time order. The last bin of a clip is held back until the
+    next clip shows whether it continues it.
+    """
+
+    def __init__(self, products, dtype="float64"):
+        self.products = products
+        self.dtype = dtype
+        # Per product, the (index, sums, counts) of the bins a later clip may still add to
+        self.held = {}
+
+    def add(self, partials):
+        """
+        Add the partial bins of the next clip.
+
+        # Return
+        Dict of {product: dataframe} of the bins that are now complete.
+        """
+
+        results = {}
+        for product in self.products:
+            frame, counts = partials[product]
+            index, sums = frame.index, frame.to_numpy()
+            if product in self.held:
+                held_index, held_sums, held_counts = self.held[product]
+                if len(index) > 0 and index[0] < held_index[-1]:
+                    # Clips that overlap by more than a bin: the bins already written out can't be changed
+                    keep = index >= held_index[-1]
+                    index, sums, counts = index[keep], sums[keep], counts[keep]
+                if len(index) > 0 and index[0] == held_index[-1]:
+                    sums = sums.copy()
+                    sums[0] += held_sums[-1]
+                    counts = counts.copy()
+                    counts[0] += held_counts[-1]
+                    held_index, held_sums, held_counts = held_index[:-1], held_sums[:-1], held_counts[:-1]
+                index = held_index.append(index)
+                sums = np.concatenate([held_sums, sums])
+                counts = np.concatenate([held_counts, counts])
+
+            if len(index) == 0:
+                results[product] = _levels(product, index, np.zeros((0, sums.shape[1])), self.dtype)
+                continue
+            self.held[product] = (index[-1:], sums[-1:], counts[-1:])
+            results[product] = _levels(product, index[:-1], sums[:-1] / counts[:-1, np.newaxis], self.dtype)
+
+        return results
+
+    def flush(self):
+        """
+        Finish the bins held back from the last clip.
+
+        # Return
+        Dict of {product: dataframe}, or None if no bins were held.
+        """
+
+        if not self.held:
+            return None
+
+        results = {product: _levels(product, index, sums / counts[:, np.newaxis], self.dtype)
+                   for product, (index, sums, counts) in self.held.items()}
+        self.held = {}
+        return results
+
+
+# Rough bytes of STFT working set per frequency bin of a frame: the complex frame plus its magnitude, dB and
+# averaging copies
+STREAM_BYTES_PER_BIN = 40
+
+
+def _frames_per_block(info, plan, memory_limit):
+    """
+    Number of STFT frames of plan that fit in memory_limit bytes, or None if the whole clip fits.
+    """
+
+    n_fft, hop_length = plan.n_fft, plan.hop_length
+    n_frames = 1 + (info.frames + 2 * (n_fft // 2) - n_fft) // hop_length
+    frame_bytes = STREAM_BYTES_PER_BIN * (n_fft // 2 + 1) + 4 * info.channels * hop_length
+    frames_per_block = max(1, int(memory_limit // frame_bytes))
+
+    return frames_per_block if frames_per_block < n_frames else None
+
+
+def _stft_blocks(filepath, n_fft, hop_length, frames_per_block, window, preroll=None, postroll=None):
+    """
+    Yield (first frame index, STFT magnitude) for consecutive blocks of a wavfile.
+
+    Each block reads just the samples its frames cover, padded at the ends of the file with preroll and postroll or
+    zeros, so the frames are the same as array_to_products computes for the whole file.
+    """
+
+    pad = n_fft // 2
+    with sf.SoundFile(filepath) as sound:
+        n_samples = sound.frames
+        n_frames = _n_frames(n_samples, hop_length, postroll)
+        for first_frame in range(0, n_frames, frames_per_block):
+            block_frames = min(frames_per_block, n_frames - first_frame)
+            start = first_frame * hop_length - pad
+            stop = start + (block_frames - 1) * hop_length + n_fft
+
+            sound.seek(max(start, 0))
+            y = sound.read(min(stop, n_samples) - max(start, 0), dtype='float32', always_2d=True)
+            y = librosa.to_mono(y.T)
+            y = _pad_edges(y, max(-start, 0), max(stop - n_samples, 0), preroll, postroll)
+
+            D = librosa.stft(y, hop_length=hop_length, n_fft=n_fft, window=window, center=False)
+            yield first_frame, np.abs(D)
+
+
+def _n_frames(n_samples, hop_length, postroll=None):
+    """
+    Number of frames of a clip: one centred on every hop, and on its end too unless the next clip follows it.
+    """
+
+    if postroll is not None:
+        return -(-n_samples // hop_length)
+    return 1 + n_samples // hop_length
+
+
+def _pad_edges(y, before, after, preroll=None, postroll=None):
+    """
+    Pad y with the last before samples of preroll and the first after samples of postroll, or zeros where they run out.
+    """
+
+    head = np.zeros(0, dtype=y.dtype) if preroll is None else np.asarray(preroll, dtype=y.dtype)[-before:][:before]
+    tail = np.zeros(0, dtype=y.dtype) if postroll is None else np.asarray(postroll, dtype=y.dtype)[:after]
+    return np.concatenate([np.zeros(before - len(head), dtype=y.dtype), head, y,
+                           tail, np.zeros(after - len(tail), dtype=y.dtype)])
+
+
+class _BinnedSum:
+    """
+    Running sums and counts of frame values per time bin, for frames that arrive in time order.
+    """
+
+    def __init__(self):
+        self.bins = []
+        self.sums = []
+        self.counts = []
+
+    def add(self, bins, values):
+        starts = np.flatnonzero(np.diff(bins, prepend=bins[0] - 1))
+        sums = np.add.reduceat(values, starts, axis=0, dtype=np.float64)
+        counts = np.diff(np.append(starts, len(bins)))
+        bins = bins[starts]
+
+        # The first bin may continue the last one of the previous block
+        if self.bins and self.bins[-1][-1] == bins[0]:
+            self.sums[-1][-1] += sums[0]
+            self.counts[-1][-1] += counts[0]
+            bins, sums, counts = bins[1:], sums[1:], counts[1:]
+
+        if len(bins) > 0:
+            self.bins.append(bins)
+            self.sums.append(sums)
+            self.counts.append(counts)
+
+    def totals(self):
+        """
+        Get (bins, sums, counts) of the bins that have frames.
+        """
+
+        return np.concatenate(self.bins), np.concatenate(self.sums), np.concatenate(self.counts)
+
+    def mean(self):
+        """
+        Get (first bin, means) where means has one row per bin from the first to the last, NaN for empty bins.
+        """
+
+        bins = np.concatenate(self.bins)
+        sums = np.concatenate(self.sums)
+        counts = np.concatenate(self.counts)
+
+        means = np.full((bins[-1] - bins[0] + 1, sums.shape[1]), np.nan)
+        means[bins - bins[0]] = sums / counts[:, np.newaxis]
+
+        return bins[0], means
+
+
+def _bin_index(origin, first_bin, periods, delta_t):
+    """
+    DatetimeIndex labelling delta_t second bins by their start, counted from origin.
+    """
+
+    start = origin + pd.Timedelta(seconds=int(first_bin) * delta_t)
+    return pd.date_range(start, periods=periods, freq=pd.Timedelta(seconds=delta_t))
+
+
+def _resample_mean(index, values, delta_t):
+    """
+    Average the rows of values over delta_t second bins of their DatetimeIndex, like DataFrame.resample().mean().
+
+    # Return
+    Tuple of (DatetimeIndex of the bins, array of means with one row per bin)
+    """
+
+    if not index.is_monotonic_increasing:
+        order = np.argsort(index.asi8, kind='stable')
+        index, values = index[order], values[order]
+
+    # Bins are counted from midnight of the first timestamp
+    origin = index[0].normalize()
+    binned = _BinnedSum()
+    binned.add((index.asi8 - origin.value) // int(delta_t * 1e9), values)
+    first_bin, means = binned.mean()
+
+    return _bin_index(origin, first_bin, len(means), delta_t), means
 
 
 def array_resampler(df, delta_t=1):
@@ -226,27 +853,16 @@ def array_resampler(df, delta_t=1):
     Returns:
         resampled_df: data frame of spectrogram data.
     """
-    # Save columns and index for later Dataframe construction
-    cols = df.columns
-    ind = df.index
-    resampled_df = df.to_numpy()
     # Convert back to amplitude for averaging
-    resampled_df = librosa.db_to_amplitude(resampled_df)
-    resampled_df = pd.DataFrame(resampled_df, columns=cols)
-    resampled_df['ind'] = ind
-    resampled_df = resampled_df.set_index(pd.DatetimeIndex(resampled_df['ind']))
-
-    sample_length = str(delta_t) + 's'
+    amplitude = librosa.db_to_amplitude(df.to_numpy(dtype=float))
 
     # Average over given time span
-    resampled_df = resampled_df.resample(sample_length).mean()
-    resampledIndex = resampled_df.index
+    resampledIndex, resampled = _resample_mean(df.index, amplitude, delta_t)
 
-    resampled_df = resampled_df.to_numpy()
     # Convert back to decibels
-    resampled_df = librosa.amplitude_to_db(resampled_df, ref=1)
+    resampled = librosa.amplitude_to_db(resampled, ref=1)
     # Reconstruct Dataframe
-    resampled_df = pd.DataFrame(resampled_df, index=resampledIndex)
+    resampled_df = pd.DataFrame(resampled, index=resampledIndex.rename('ind'))
 
     return resampled_df
 
@@ -262,18 +878,13 @@ def array_resampler_bands(df, delta_t=1):
     Returns:
         resampled_df: data frame of broadband data.
     """
-    resampled_df = df
-    sample_length = str(delta_t) + 's'
-
     # Average over given time span
-    resampled_df = resampled_df.resample(sample_length).mean()
-    resampledIndex = resampled_df.index
+    resampledIndex, resampled = _resample_mean(df.index, df.to_numpy(dtype=float), delta_t)
 
-    resampled_df = resampled_df.to_numpy()
     # Convert to decibels
-    resampled_df = librosa.amplitude_to_db(resampled_df, ref=1, top_db=200.0)
+    resampled = librosa.amplitude_to_db(resampled, ref=1, top_db=200.0)
     # Reconstruct Dataframe
-    resampled_df = pd.DataFrame(resampled_df, index=resampledIndex)
+    resampled_df = pd.DataFrame(resampled, index=resampledIndex.rename(df.index.name))
 
     return resampled_df
 
@@ -348,9 +959,76 @@ def band_power(psd, g, delta_f):
     return np.sqrt(delta_f * np.sum(x))
 
 
+# ISO R5 frequencies
+ISO_R5 = np.array([63, 125, 250, 500, 1000, 2000,
+                   4000, 8000, 16000])
+
+# ISO R10 frequencies from 63 Hz to 22.4 kHz
+# Add additional bands up to your Nyquist frequency as necessary
+# , 25000, 31500, 40000, 50000,
+# 63000, 80000, 100000])
+ISO_R10 = np.array([63, 80, 100, 125, 160, 200,
+                    250, 315, 400, 500, 630, 800, 1000, 1250, 1600, 2000, 2500, 3150,
+                    4000, 5000, 6300, 8000, 10000, 12500, 16000, 20000])
+
+# ISO R20 frequencies from 63 Hz to 22.4 kHz
+ISO_R20 = np.array([63, 71, 80, 90, 100, 112, 125, 140, 160, 180, 200, 224, 250,
+                    280, 315, 355, 400, 450, 500, 560, 630, 710, 800, 900, 1000,
+                    1120, 1250, 1400, 1600, 1800, 2000, 2240, 2500, 2800, 3150, 3550, 4000,
+                    4500, 5000, 5600, 6300, 7100, 8000, 9000, 10000, 11200, 12500, 14000, 16000,
+                    18000, 20000, 22400])
+
+# ISO R40 frequencies from 67 Hz to 22.4 kHz
+ISO_R40 = np.array([67, 71, 75, 80, 85, 90, 95, 100, 106, 112, 118, 125,
+                    132, 140, 150, 160, 170, 180, 190, 200, 212, 224, 236, 250,
+                    265, 280, 300, 315, 335, 355, 375, 400, 425, 450, 475, 500,
+                    530, 560, 600, 630, 670, 710, 750, 800, 850, 900, 950, 1000,
+                    1060, 1120, 1180, 1250, 1320, 1400, 1500, 1600, 1700, 1800, 1900, 2000,
+                    2120, 2240, 2360, 2500, 2650, 2800, 3000, 3150, 3350, 3550, 3750, 4000,
+                    4250, 4500, 4750, 5000, 5300, 5600, 6000, 6300, 6700, 7100, 7500, 8000,
+                    8500, 9000, 9500, 10000, 10600, 11200, 11800, 12500, 13200, 14000, 15000, 16000,
+                    17000, 18000, 19000, 20000, 21200, 22400])
+
+# ISO R80 frequencies from 67 Hz to 22.4 kHz
+ISO_R80 = np.array([67, 69, 71, 73, 75, 77.5, 80, 82.5, 85, 87.5,
+                    90, 92.5, 95, 97.5, 100, 103, 106, 109, 112, 115, 118, 122,
+                    125, 128, 132, 136, 140, 145, 150, 155, 160, 165, 170, 175,
+                    180, 185, 190, 195, 200, 206, 212, 218, 224, 230, 236, 243,
+                    250, 258, 265, 272, 280, 290, 300, 307, 315, 325, 335,
+                    345, 355, 365, 375, 387, 400, 412, 425, 437, 450, 462,
+                    475, 487, 500, 515, 530, 545, 560, 580, 600, 615, 630,
+                    650, 670, 690, 710, 730, 750, 775, 800, 825, 850, 875,
+                    900, 925, 950, 975, 1000, 1030, 1060, 1090, 1120, 1150, 1180,
+                    1220, 1250, 1280, 1320, 1360, 1400, 1450, 1500, 1550, 1600, 1650,
+                    1700, 1750, 1800, 1850, 1900, 1950, 2000, 2060, 2120, 2180, 2240,
+                    2300, 2360, 2430, 2500, 2580, 2650, 2720, 2800, 2900, 3000, 3070,
+                    3150, 3250, 3350, 3450, 3550, 3650, 3750, 3870, 4000, 4120, 4250,
+                    4370, 4500, 4620, 4750, 4870, 5000, 5150, 5300, 5450, 5600, 5800,
+                    6000, 6150, 6300, 6500, 6700, 6900, 7100, 7300, 7500, 7750, 8000,
+                    8250, 8500, 8750, 9000, 9250, 9500, 9750, 10000, 10300, 10600, 10900,
+                    11200, 11500, 11800, 12200, 12500, 12800, 13200, 13600, 14000, 14500, 15000,
+                    15500, 16000, 16500, 17000, 17500, 18000, 18500, 19000, 19500, 20000, 20600,
+                    21200, 21800, 22400])
+
+ISO_BANDS = {1: ISO_R5,
+             3: ISO_R10,
+             6: ISO_R20,
+             12: ISO_R40,
+             24: ISO_R80}
+
+# Squared filter gains below this value (-140 dB) are not stored in a FilterBank. Band levels then stay within 1e-5 dB
+# of the dense gains' down to an 80 dB floor, 5e-4 dB at -120 dB
+FILTER_BANK_TOL = 1e-14
+
+FilterBank = namedtuple("FilterBank", "centers weights")
+
+# Filter banks built in this process, keyed by (N, sample rate, n_fft)
+_FILTER_BANKS = {}
+
+
 def octave_band(N, freqs):
     """
-
+    Get the center frequencies and filter gains of one ISO R series.
 
     ISO Series
     R5: 1 octave
@@ -364,95 +1042,102 @@ def octave_band(N, freqs):
     freqs: frequencies in the original PSD
 
     Returns:
-    ISO R series
-    """
-
-    # ISO R5 frequencies
-    Rfive = np.array([63, 125, 250, 500, 1000, 2000,
-                      4000, 8000, 16000])
-    g_Rfive = [filt_gain(freqs, x, 1) for x in Rfive]
-
-    # ISO R10 frequencies from 63 Hz to 22.4 kHz
-    Rten = np.array([63, 80, 100, 125, 160, 200,
-                     250, 315, 400, 500, 630, 800, 1000, 1250, 1600, 2000, 2500, 3150,
-                     4000, 5000, 6300, 8000, 10000, 12500, 16000, 20000])
-    # Add additional bands up to your Nyquist frequency as necessary
-    # , 25000, 31500, 40000, 50000,
-    # 63000, 80000, 100000])
-    g_Rten = [filt_gain(freqs, x, 3) for x in Rten]
-
-    # ISO R20 frequencies from 63 Hz to 22.4 kHz
-    Rtwenty = np.array([63, 71, 80, 90, 100, 112, 125, 140, 160, 180, 200, 224, 250,
-                        280, 315, 355, 400, 450, 500, 560, 630, 710, 800, 900, 1000,
-                        1120, 1250, 1400, 1600, 1800, 2000, 2240, 2500, 2800, 3150, 3550, 4000,
-                        4500, 5000, 5600, 6300, 7100, 8000, 9000, 10000, 11200, 12500, 14000, 16000,
-                        18000, 20000, 22400])
-
-    g_Rtwenty = [filt_gain(freqs, x, 6) for x in Rtwenty]
-
-    # ISO R40 frequencies from 67 Hz to 22.4 kHz
-    Rforty = np.array([67, 71, 75, 80, 85, 90, 95, 100, 106, 112, 118, 125,
-                       132, 140, 150, 160, 170, 180, 190, 200, 212, 224, 236, 250,
-                       265, 280, 300, 315, 335, 355, 375, 400, 425, 450, 475, 500,
-                       530, 560, 600, 630, 670, 710, 750, 800, 850, 900, 950, 1000,
-                       1060, 1120, 1180, 1250, 1320, 1400, 1500, 1600, 1700, 1800, 1900, 2000,
-                       2120, 2240, 2360, 2500, 2650, 2800, 3000, 3150, 3350, 3550, 3750, 4000,
-                       4250, 4500, 4750, 5000, 5300, 5600, 6000, 6300, 6700, 7100, 7500, 8000,
-                       8500, 9000, 9500, 10000, 10600, 11200, 11800, 12500, 13200, 14000, 15000, 16000,
-                       17000, 18000, 19000, 20000, 21200, 22400])
-
-    g_Rforty = [filt_gain(freqs, x, 12) for x in Rforty]
-
-    # ISO R80 frequencies from 67 Hz to 22.4 kHz
-    Reighty = np.array([67, 69, 71, 73, 75, 77.5, 80, 82.5, 85, 87.5,
-                        90, 92.5, 95, 97.5, 100, 103, 106, 109, 112, 115, 118, 122,
-                        125, 128, 132, 136, 140, 145, 150, 155, 160, 165, 170, 175,
-                        180, 185, 190, 195, 200, 206, 212, 218, 224, 230, 236, 243,
-                        250, 258, 265, 272, 280, 290, 300, 307, 315, 325, 335,
-                        345, 355, 365, 375, 387, 400, 412, 425, 437, 450, 462,
-                        475, 487, 500, 515, 530, 545, 560, 580, 600, 615, 630,
-                        650, 670, 690, 710, 730, 750, 775, 800, 825, 850, 875,
-                        900, 925, 950, 975, 1000, 1030, 1060, 1090, 1120, 1150, 1180,
-                        1220, 1250, 1280, 1320, 1360, 1400, 1450, 1500, 1550, 1600, 1650,
-                        1700, 1750, 1800, 1850, 1900, 1950, 2000, 2060, 2120, 2180, 2240,
-                        2300, 2360, 2430, 2500, 2580, 2650, 2720, 2800, 2900, 3000, 3070,
-                        3150, 3250, 3350, 3450, 3550, 3650, 3750, 3870, 4000, 4120, 4250,
-                        4370, 4500, 4620, 4750, 4870, 5000, 5150, 5300, 5450, 5600, 5800,
-                        6000, 6150, 6300, 6500, 6700, 6900, 7100, 7300, 7500, 7750, 8000,
-                        8250, 8500, 8750, 9000, 9250, 9500, 9750, 10000, 10300, 10600, 10900,
-                        11200, 11500, 11800, 12200, 12500, 12800, 13200, 13600, 14000, 14500, 15000,
-                        15500, 16000, 16500, 17000, 17500, 18000, 18500, 19000, 19500, 20000, 20600,
-                        21200, 21800, 22400])
-    g_Reighty = [filt_gain(freqs, x, 24) for x in Reighty]
-
-    bands = {1: Rfive,
-             3: Rten,
-             6: Rtwenty,
-             12: Rforty,
-             24: Reighty}
-    filters = {1: g_Rfive,
-               3: g_Rten,
-               6: g_Rtwenty,
-               12: g_Rforty,
-               24: g_Reighty}
-
-    if N not in bands:
-        raise ValueError
-    else:
-        return bands[N], filters[N]
+    ISO R series, list of gains with one array per band
+    """
+
+    centers = _iso_series(N)
+    return centers, [filt_gain(freqs, x, N) for x in centers]
+
+
+def _iso_series(N):
+    """
+    Look up the ISO R series center frequencies for N octave divisions.
+    """
+
+    if N not in ISO_BANDS:
+        raise ValueError(f"No ISO R series for {N} octave divisions. Accepts values {list(ISO_BANDS)}")
+    return ISO_BANDS[N]
+
+
+def filter_bank(N, sr, n_fft):
+    """
+    Get the octave filter bank for an STFT, building it on first use.
+
+    Banks are cached per process and keyed by (N, sr, n_fft), so every clip with the same sample rate
+    and resolution shares one. The squared gains are stored as a sparse (freqs, bands) matrix: each band
+    only keeps the bins where its gain is above FILTER_BANK_TOL, instead of a dense vector over every bin.
+
+    Args:
+        N: int. Number of octave divisions, see octave_band.
+        sr: int. Sample rate of the audio.
+        n_fft: int. FFT size used for the STFT.
+
+    Returns:
+        FilterBank of (band center frequencies, sparse weight matrix)
+    """
+
+    key = (N, sr, n_fft)
+    bank = _FILTER_BANKS.get(key)
+    if bank is None:
+        freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+        centers = _iso_series(N)
+        rows = []
+        for fm in centers:
+            weights = np.square(filt_gain(freqs, fm, N))
+            weights[weights < FILTER_BANK_TOL] = 0
+            rows.append(sparse.csr_matrix(weights))
+        bank = FilterBank(centers, sparse.vstack(rows).T.tocsr())
+        _FILTER_BANKS[key] = bank
+
+    return bank
+
+
+def filter_banks():
+    """
+    Get a copy of every filter bank built in this process, for handing to worker processes with load_filter_banks.
+    """
+
+    return dict(_FILTER_BANKS)
+
+
+def load_filter_banks(banks):
+    """
+    Add prebuilt filter banks to this process' cache. Used as a multiprocessing Pool initializer so workers
+    don't each rebuild the banks.
+
+    * banks: dict of filter banks, as returned by filter_banks()
+    """
+
+    _FILTER_BANKS.update(banks)
 
 
-def spec_to_bands(psd, N, delta_f, freqs, ref):
+def spec_to_bands(psd, N, delta_f, freqs, ref, sr=None, top_db=80.0):
     """
+    Convert a linear spectrogram to fractional octave band levels.
+
+    The filter bank is applied to every frame at once: summing psd * g**2 over frequency
+    for each band and frame is the matrix product of psd with the bank's squared gains,
+    which gives the same levels as calling band_power for each frame and band.
 
+    Args:
+        psd: array of shape (frames, freqs) with the magnitude of the STFT.
+        N: int. Number of octave divisions, see octave_band.
+        delta_f: float. Hz per frequency bin.
+        freqs: frequencies of the columns of psd.
+        ref: float. Reference level for the amplitude to dB conversion.
+        sr: int, default None. Sample rate of the audio. If None, it is inferred from freqs assuming an even n_fft.
+        top_db: float, default 80. Floor of the levels below their maximum, passed to librosa.amplitude_to_db.
+
+    Returns:
+        Tuple of (band levels in dB with shape (frames, bands), band center frequencies)
     """
 
-    bands, gains = octave_band(N, freqs)
-    octaves = np.empty((0, len(bands)), dtype=float)
-    for row in psd:
-        octaves = np.append(octaves, np.array([[band_power(row, g, delta_f) for g in gains]]), axis=0)
+    n_fft = 2 * (len(freqs) - 1) if sr is None else int(round(sr / delta_f))
+    sr = sr or int(round(n_fft * delta_f))
+    bands, weights = filter_bank(N, sr, n_fft)
+    octaves = np.sqrt(delta_f * (psd @ weights))
 
-    octaves_scaled = librosa.amplitude_to_db(octaves, ref=ref)
+    octaves_scaled = librosa.amplitude_to_db(octaves, ref=ref, top_db=top_db)
 
     return octaves_scaled, bands
 
@@ -0,0 +1,207 @@
+# Native imports
+import datetime as dt
+import logging
+import os
+import tempfile
+import threading
+
+# Third part imports
+import pandas as pd
+
+# Local imports
+from .parquet_writer import ParquetStreamWriter
+from .scheduler import shard_bounds
+from ..utils.catalog import CatalogRecord
+from ..utils.encoding import read_parquet
+from ..utils.file_connector import S3FileConnector
+
+PERIODS = ("day", "month")
+
+
+def period_bounds(time: dt.datetime, period="day"):
+    """
+    (start, end) of the day or calendar month holding time.
+    """
+
+    start = dt.datetime.combine(time.date(), dt.time())
+    if period == "month":
+        start = start.replace(day=1)
+        return shard_bounds(start, start + dt.timedelta(days=31), "month")[0]
+    return start, start + dt.timedelta(days=1)
+
+
+class ArchiveCompactor:
+    """
+    Merge the small, possibly overlapping parquet files of the archive's series into one sorted file per day or month.
+
+    A series is the files of one hydrophone at one delta_t and delta_f. Every whole period of a series that has more
+    than one file, or a file that isn't already its compacted file, is rewritten as a single time sorted file without
+    duplicate timestamps, named by the period, with large row groups. Like the pipeline's files, a compacted file holds
+    the row at its end time too, if there is one. Where files overlap the rows of the earliest one are kept, as
+    NoiseAccessor.create_df does, so reads return the same data before and after compaction.
+
+    The connector's catalog is the source of truth. Compacted files are uploaded first, then swapped into the catalog
+    for the files they replace in one transaction, and only then are the originals deleted, so a reader of the catalog
+    always finds either the originals or the compacted files. An original is only replaced once every one of its
+    rows is in a compacted file. Only files directly in the save folder are compacted, not dataset layout partitions.
+    """
+
+    def __init__(self, connector: S3FileConnector, period="day", encoding="float",
+                 row_group_bytes=ParquetStreamWriter.ROW_GROUP_BYTES, scratch_folder=None, delete_originals=True):
+        """
+        * connector: S3FileConnector of the hydrophone, created with a catalog.
+        * period: Str, default "day". Length of the compacted files, "day" or "month". Monthly files of fine
+          resolutions are large, and a month is merged in memory.
+        * encoding: Str, default "float". Storage encoding of the compacted files, see utils/encoding.py. Originals can
+          be of any encoding.
+        * row_group_bytes: Int, approximate in-memory size of the row groups of the compacted files.
+        * scratch_folder: Folder to download originals and write compacted files to. Defaults to a temporary folder.
+        * delete_originals: Bool, default True. Delete the replaced files from S3 once the catalog no longer lists them.
+        """
+
+        if connector.catalog is None:
+            raise ValueError("compaction needs an S3FileConnector created with a catalog")
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+
+        self.connector = connector
+        self.catalog = connector.catalog
+        self.period = period
+        self.encoding = encoding
+        self.row_group_bytes = row_group_bytes
+        self.scratch_folder = scratch_folder
+        self.delete_originals = delete_originals
+
+    def compact_all(self, end: dt.datetime = None):
+        """
+        Compact every series of the archive, see compact.
+
+        # Return
+        List of keys of the written files
+        """
+
+        keys = []
+        for secs_per_sample, hz_bands, is_broadband in self.catalog.series():
+            keys += self.compact(secs_per_sample, hz_bands, is_broadband, end=end)
+        return keys
+
+    def run(self, interval=3600, stop: threading.Event = None):
+        """
+        Compact every series every interval seconds until stop is set, e.g. in a background thread.
+        """
+
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                self.compact_all()
+            except Exception as e:
+                logging.exception("Compaction failed, retrying in %s seconds: %s", interval, e)
+            stop.wait(interval)
+
+    def compact(self, secs_per_sample: int, hz_bands=None, is_broadband=False, end: dt.datetime = None):
+        """
+        Compact the whole periods of one series that end by end.
+
+        * secs_per_sample: Int, delta_t of the series.
+        * hz_bands: Str, delta_f of the series in '50hz' or '3oct' format.
+        * is_broadband: Bool, default False. Compact the broadband series of secs_per_sample instead.
+        * end: datetime, default None. Periods ending later are left alone, as more files may still arrive for them.
+          Defaults to now, in UTC like file names.
+
+        # Return
+        List of keys of the written files
+        """
+
+        end = end or dt.datetime.utcnow()
+        records = [record for record in self.catalog.records(secs_per_sample, hz_bands, is_broadband)
+                   if "/" not in record.key[len(self.catalog.prefix):]]
+
+        # The files with rows in each period, from their names
+        members = {}
+        for record in records:
+            for bounds in self._periods(record.start, record.end):
+                members.setdefault(bounds, []).append(record)
+
+        filename_kwargs = S3FileConnector.frequency_kwargs(hz_bands, is_broadband)
+        todo = []
+        for bounds in sorted(members):
+            name = S3FileConnector.create_filename(*bounds, secs_per_sample, **filename_kwargs)
+            done = len(members[bounds]) == 1 and members[bounds][0].key.endswith("/" + name)
+            if bounds[1] <= end and not done:
+                todo.append((bounds, name))
+        if not todo:
+            return []
+
+        with tempfile.TemporaryDirectory(dir=self.scratch_folder) as scratch:
+            frames, rows_left, added = {}, {}, []
+            last_period = {record.key: max(self._periods(record.start, record.end)) for record in records}
+            for bounds, name in todo:
+                slices = []
+                for record in members[bounds]:
+                    if record.key not in frames:
+                        frames[record.key] = self._read(record, scratch)
+                        rows_left[record.key] = len(frames[record.key])
+                    frame = frames[record.key]
+                    frame = frame[(frame.index >= bounds[0]) & (frame.index <= bounds[1])]
+                    # A row at the end of the period is also the first of the next one, unless the file ends there
+                    if last_period[record.key] == bounds:
+                        rows_left[record.key] -= len(frame)
+                        del frames[record.key]
+                    else:
+                        rows_left[record.key] -= (frame.index < bounds[1]).sum()
+                    slices.append(frame)
+
+                frame = pd.concat(slices)
+                frame = frame[~frame.index.duplicated(keep='first')].sort_index()
+                if len(frame) > 0:
+                    added.append(self._write(frame, bounds, name, secs_per_sample, filename_kwargs, scratch))
+
+        # Files whose every row is now in a compacted file
+        added_keys = {record.key for record in added}
+        removed = [key for key, left in rows_left.items() if left == 0 and key not in added_keys]
+        self.catalog.swap(removed, added)
+        if self.delete_originals:
+            for i in range(0, len(removed), 1000):
+                self.connector.client.delete_objects(Bucket=self.catalog.bucket, Delete={
+                    "Objects": [{"Key": key} for key in removed[i:i + 1000]], "Quiet": True})
+
+        return [record.key for record in added]
+
+    def _periods(self, start, end):
+        """
+        The periods a file of [start, end] has rows in, from its name. A row at exactly the end of a period, as the
+        pipeline writes at the end of its files, goes in the compacted file of that period.
+        """
+
+        periods = [period_bounds(start, self.period)]
+        while periods[-1][1] < end:
+            periods.append(period_bounds(periods[-1][1], self.period))
+        return periods
+
+    def _read(self, record: CatalogRecord, scratch):
+        """
+        Rows of an archive file inside the range of its name, like NoiseAccessor.create_df reads them.
+        """
+
+        location = os.path.join(scratch, record.key.split("/")[-1])
+        self.connector.download_file(record.key, location)
+        frame = read_parquet(location)
+        os.remove(location)
+        return frame[(frame.index >= record.start) & (frame.index <= record.end)]
+
+    def _write(self, frame, bounds, name, secs_per_sample, filename_kwargs, scratch):
+        """
+        Write and upload the compacted file of a period.
+
+        # Return
+        CatalogRecord of the uploaded file
+        """
+
+        path = os.path.join(scratch, name)
+        with ParquetStreamWriter(path, row_group_bytes=self.row_group_bytes, encoding=self.encoding) as writer:
+            writer.write(frame)
+        if not self.connector.upload_file(path, *bounds, secs_per_sample, file_name=name, **filename_kwargs):
+            raise RuntimeError(f"Could not upload {name}, the originals are left in place")
+        os.remove(path)
+
+        return self.catalog.record(self.connector.save_folder + "/" + name)
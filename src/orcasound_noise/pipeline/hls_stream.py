@@ -0,0 +1,137 @@
+# Native imports
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+# Third part imports
+import ffmpeg
+import m3u8
+import numpy as np
+import requests
+
+# Local imports
+from orca_hls_utils import datetime_utils
+from orca_hls_utils.DateRangeHLSStream import DateRangeHLSStream
+
+
+def decode_ts(data):
+    """
+    Decode MPEG-TS audio into a mono float32 array by piping it through ffmpeg, without touching the disk.
+
+    Channels are averaged into mono like librosa.load does. Samples stay in float32 instead of going through the
+    16 bit PCM of an intermediate wav file, so levels can differ from the wav path by that quantization noise.
+
+    * data: Bytes of one or more concatenated .ts segments.
+
+    # Return
+
+    Tuple of (samples, sample rate)
+    """
+
+    out, err = (
+        ffmpeg
+        .input('pipe:', format='mpegts')
+        .output('pipe:', format='f32le', acodec='pcm_f32le', ac=1)
+        .run(input=data, capture_stdout=True, capture_stderr=True)
+    )
+
+    # f32le has no header, so the rate comes from ffmpeg's description of the input stream
+    match = re.search(r"Audio: .*?(\d+) Hz", err.decode(errors='replace'))
+    if match is None:
+        raise ValueError("ffmpeg did not report a sample rate for the .ts audio")
+
+    return np.frombuffer(out, dtype=np.float32), int(match.group(1))
+
+
+class MemoryHLSStream(DateRangeHLSStream):
+    """
+    DateRangeHLSStream that hands back decoded audio instead of writing a wav file per clip.
+
+    The .ts segments of each clip are downloaded into memory by download_workers threads sharing one pooled HTTP
+    session, or read from cache if given a SegmentCache, concatenated and decoded with decode_ts. get_next_clip returns ((samples, sample rate), clip start time,
+    None) in place of the wav path, so wav_dir is never written to.
+    """
+
+    def __init__(self, *args, download_workers=8, cache=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = cache
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=download_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.downloader = ThreadPoolExecutor(download_workers)
+
+    def _download(self, url):
+        if self.cache is not None:
+            data = self.cache.get(self.cache.key_from_url(url))
+            if data is not None:
+                return data
+
+        try:
+            response = self.session.get(url)
+            response.raise_for_status()
+        except requests.RequestException:
+            print("Skipping", url, ": error.")
+            return None
+
+        if self.cache is not None:
+            self.cache.put(self.cache.key_from_url(url), response.content)
+        return response.content
+
+    def get_next_clip(self, current_clip_name=None):
+        current_folder = int(self.valid_folders[self.current_folder_index])
+        _, clip_start_time = datetime_utils.get_clip_name_from_unix_time(
+            self.folder_name.replace("_", "-"), self.current_clip_start_time
+        )
+
+        stream_url = "{}/hls/{}/live.m3u8".format(self.stream_base, current_folder)
+        stream_obj = m3u8.loads(self.session.get(stream_url).text, uri=stream_url)
+        num_total_segments = len(stream_obj.segments)
+        target_duration = sum([item.duration for item in stream_obj.segments]) / num_total_segments
+        num_segments_in_wav_duration = math.ceil(self.polling_interval_in_seconds / target_duration)
+
+        # Same segment arithmetic as DateRangeHLSStream, including its offset for the delay before audio starts
+        time_since_folder_start = datetime_utils.get_difference_between_times_in_seconds(
+            self.current_clip_start_time, current_folder
+        ) - self.audio_offset
+        segment_start_index = math.ceil(time_since_folder_start / target_duration)
+        segment_end_index = segment_start_index + num_segments_in_wav_duration
+
+        if segment_end_index > num_total_segments:
+            self.current_folder_index += 1
+            if self.current_folder_index < len(self.valid_folders):
+                self.current_clip_start_time = self.valid_folders[self.current_folder_index]
+            else:
+                # No more folders, end the stream rather than asking for this clip again
+                self.current_clip_start_time = self.end_unix_time
+            return None, None, None
+
+        self.current_clip_start_time = datetime_utils.add_interval_to_unix_time(
+            self.current_clip_start_time, self.polling_interval_in_seconds
+        )
+
+        urls = [s.base_uri + s.uri for s in stream_obj.segments[segment_start_index:segment_end_index]]
+        segments = [segment for segment in self.downloader.map(self._download, urls) if segment is not None]
+
+        if len(segments) == 0:
+            return None, clip_start_time, None
+
+        return decode_ts(b"".join(segments)), clip_start_time, None
+
+    def get_all_clips(self):
+        """
+        Decode every clip of the date range.
+
+        # Return
+
+        Tuple of lists, the (samples, sample rate) of each clip and their start times
+        """
+
+        clips, clip_start_times = [], []
+        while not self.is_stream_over():
+            audio, clip_start_time, _ = self.get_next_clip()
+            if audio is not None:
+                clips.append(audio)
+                clip_start_times.append(clip_start_time)
+
+        return clips, clip_start_times
@@ -0,0 +1,217 @@
+# Native imports
+import datetime as dt
+import json
+import os
+import re
+
+# Third part imports
+import m3u8
+import numpy as np
+import requests
+
+# Local imports
+from .hls_stream import decode_ts
+
+# Bucket of the hydrophones' live HLS streams, as opposed to Hydrophone.bucket which holds the archive
+LIVE_BUCKET = "streaming-orcasound-net"
+
+
+def _natural_key(name):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+class LiveSource:
+    """
+    The newest HLS segments of a live stream, read from a url or a local directory.
+
+    source is either a hydrophone's stream base, containing latest.txt and hls/<stream timestamp>/live.m3u8 like
+    https://s3-us-west-2.amazonaws.com/streaming-orcasound-net/rpi_orcasound_lab, or a single folder of segments with
+    a live.m3u8 playlist. A local folder without a playlist is read in natural file name order, so a folder of
+    live000.ts, live001.ts... can stand in for a stream.
+
+    Like DateRangeHLSStream, segment n of a stream is taken to start n target durations after the stream timestamp
+    plus audio_offset, the delay before its audio starts, in local time. Folders not named by a stream timestamp have
+    no such times.
+    """
+
+    def __init__(self, source, audio_offset=2):
+        """
+        * source: Str, url or local path, see above.
+        * audio_offset: Int, default 2. Seconds between the stream timestamp and its first audio.
+        """
+
+        self.source = source.rstrip('/')
+        self.audio_offset = audio_offset
+        self.is_local = not re.match(r'https?://', self.source)
+        self.session = None if self.is_local else requests.Session()
+
+    def _read(self, location):
+        if self.is_local:
+            with open(location, 'rb') as f:
+                return f.read()
+        response = self.session.get(location)
+        response.raise_for_status()
+        return response.content
+
+    def _exists(self, location):
+        if self.is_local:
+            return os.path.exists(location)
+        return self.session.head(location).ok
+
+    def folder(self):
+        """
+        Location of the segments of the current stream.
+        """
+
+        latest = self.source + '/latest.txt'
+        if self._exists(latest):
+            return self.source + '/hls/' + self._read(latest).decode().strip()
+        return self.source
+
+    def stream_start(self, folder):
+        """
+        Time of the first audio of the stream in folder, or None if the folder isn't named by a stream timestamp.
+        """
+
+        name = folder.rstrip('/').split('/')[-1]
+        if not name.isdigit():
+            return None
+        return dt.datetime.fromtimestamp(int(name)) + dt.timedelta(seconds=self.audio_offset)
+
+    def target_duration(self, folder):
+        """
+        Nominal length of the segments of folder in seconds, from its playlist. Defaults to 10.
+        """
+
+        playlist = folder + '/live.m3u8'
+        if self._exists(playlist):
+            return m3u8.loads(self._read(playlist).decode()).target_duration or 10
+        return 10
+
+    def segment_start(self, folder, segment):
+        """
+        Nominal start time of a segment, or None if it can't be told from the folder and segment names.
+        """
+
+        start = self.stream_start(folder)
+        number = re.findall(r'\d+', segment)
+        if start is None or not number:
+            return None
+        return start + dt.timedelta(seconds=int(number[-1]) * self.target_duration(folder))
+
+    def segments(self, folder):
+        """
+        Names of the segments of folder, oldest first.
+        """
+
+        playlist = folder + '/live.m3u8'
+        if self._exists(playlist):
+            return [segment.uri for segment in m3u8.loads(self._read(playlist).decode()).segments]
+        if self.is_local:
+            return sorted([name for name in os.listdir(folder) if name.endswith('.ts')], key=_natural_key)
+        return []
+
+    @staticmethod
+    def since(segments, segment, inclusive=False):
+        """
+        The segments after segment in stream order, and segment itself if inclusive.
+        """
+
+        key = _natural_key(segment)
+        return [name for name in segments if _natural_key(name) > key or (inclusive and name == segment)]
+
+    def download(self, folder, segment):
+        """
+        Decoded (samples, sample rate) of a segment.
+        """
+
+        return decode_ts(self._read(folder + '/' + segment))
+
+
+class LiveCursor:
+    """
+    Where live processing stopped, persisted to a json file so a restart neither reprocesses nor skips audio.
+
+    It records the first segment whose samples are still needed, as the next chunk or its preroll, the time that
+    segment starts at, and position, the time of the first sample not processed yet.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.folder = None
+        self.segment = None
+        self.segment_start = None
+        self.position = None
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.folder = state['folder']
+            self.segment = state['segment']
+            self.segment_start = dt.datetime.fromisoformat(state['segment_start'])
+            self.position = dt.datetime.fromisoformat(state['position'])
+
+    def save(self, folder, segment, segment_start, position):
+        self.folder, self.segment, self.segment_start, self.position = folder, segment, segment_start, position
+        if self.path is None:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'folder': folder, 'segment': segment, 'segment_start': segment_start.isoformat(),
+                       'position': position.isoformat()}, f)
+        os.replace(tmp_path, self.path)
+
+
+class SampleBuffer:
+    """
+    Decoded segments waiting to be processed, as one contiguous run of samples starting at start.
+
+    The last samples taken out are kept as history, the preroll of the next chunk.
+    """
+
+    def __init__(self):
+        self.start = None
+        self.sr = None
+        self.samples = np.zeros(0, dtype=np.float32)
+        self.history = np.zeros(0, dtype=np.float32)
+        # (segment name, segment start) of every segment that still has samples in the buffer or its history,
+        # oldest first
+        self.segments = []
+
+    @property
+    def end(self):
+        return self.start + dt.timedelta(seconds=len(self.samples) / self.sr)
+
+    def add(self, segment, segment_start, samples, sr, skip_to=None, history=0):
+        """
+        Append a decoded segment, moving any of its samples before skip_to to the history, up to history of them.
+        """
+
+        if self.start is None:
+            self.start, self.sr = segment_start, sr
+        if skip_to is not None and skip_to > segment_start:
+            n_skipped = int(round((skip_to - segment_start).total_seconds() * sr))
+            self.history = self._keep(self.history, samples[:n_skipped], history)
+            samples = samples[n_skipped:]
+            if len(self.samples) == 0:
+                self.start = skip_to
+        self.samples = np.concatenate([self.samples, samples])
+        self.segments.append((segment, segment_start))
+
+    def take(self, until, history=0):
+        """
+        Remove and return the samples before until, keeping the last history of them.
+        """
+
+        n = int(round((until - self.start).total_seconds() * self.sr))
+        taken, self.samples = self.samples[:n], self.samples[n:]
+        self.history = self._keep(self.history, taken, history)
+        self.start = until
+        # Keep the segments that still have samples in the buffer or its history
+        history_start = until - dt.timedelta(seconds=len(self.history) / self.sr)
+        while len(self.segments) > 1 and self.segments[1][1] <= history_start:
+            self.segments.pop(0)
+        return taken
+
+    @staticmethod
+    def _keep(history, samples, n):
+        return np.concatenate([history, samples])[len(history) + len(samples) - n:] if n else history[:0]
@@ -0,0 +1,207 @@
+# Native imports
+import datetime as dt
+import math
+import os
+import re
+from collections import namedtuple
+
+# Third part imports
+import librosa
+import m3u8
+import soundfile as sf
+
+# Local imports
+from .hls_stream import decode_ts
+
+# A clip that is part of a local wav file: frames [start_frame, start_frame + frames) of path. Only those frames are
+# read, with block reads, when the clip is processed
+WavSlice = namedtuple("WavSlice", "path start_frame frames")
+
+# One file of a local archive and the time its audio starts at
+ArchiveFile = namedtuple("ArchiveFile", "path start")
+
+ARCHIVE_EXTENSIONS = ('.ts', '.wav')
+
+# Date times in file names: 2023_01_01_12_00_00 as in clip names, 2023-01-01T12:00:00 or 20230101T120000
+_DATETIME_PATTERN = re.compile(r'(\d{4})[_-]?(\d{2})[_-]?(\d{2})[T_ -]?(\d{2})[_:-]?(\d{2})[_:-]?(\d{2})')
+
+
+def read_wav_slice(clip: WavSlice):
+    """
+    Read the frames of a WavSlice, in mono float32 like librosa.load.
+
+    # Return
+    Tuple of (samples, sample rate)
+    """
+
+    with sf.SoundFile(clip.path) as sound:
+        sound.seek(clip.start_frame)
+        y = sound.read(clip.frames, dtype='float32', always_2d=True)
+        sr = sound.samplerate
+
+    return librosa.to_mono(y.T), sr
+
+
+def file_start_time(path, audio_offset=2, segment_seconds=10):
+    """
+    Time the audio of an archive file starts at, from its path, or None if it can't be told.
+
+    Segments mirrored from the S3 archive, .../hls/<stream timestamp>/liveNNN.ts, start NNN segments after the stream
+    timestamp plus audio_offset, the same arithmetic as DateRangeHLSStream. Other files need a date time in their name,
+    e.g. 2023_01_01_12_00_00.wav, or a unix timestamp of 10 digits. Unix timestamps are converted to local time like
+    the clip times of DateRangeHLSStream.
+
+    * audio_offset: Int, default 2. Seconds between a stream timestamp and its first audio.
+    * segment_seconds: Float, default 10. Length of the segments of a mirrored stream.
+    """
+
+    name = os.path.basename(path)
+    folder = os.path.basename(os.path.dirname(path))
+    number = re.findall(r'\d+', name)
+    if folder.isdigit() and name.endswith('.ts') and number:
+        return (dt.datetime.fromtimestamp(int(folder))
+                + dt.timedelta(seconds=audio_offset + int(number[-1]) * segment_seconds))
+
+    match = _DATETIME_PATTERN.search(name)
+    if match is not None:
+        try:
+            return dt.datetime(*[int(part) for part in match.groups()])
+        except ValueError:
+            pass
+
+    unix_time = re.search(r'(?<!\d)(\d{10})(?!\d)', name)
+    if unix_time is not None:
+        return dt.datetime.fromtimestamp(int(unix_time.group(1)))
+
+    return None
+
+
+class LocalArchiveStream:
+    """
+    Stand-in for DateRangeHLSStream that reads clips from a local folder of .ts and .wav files instead of S3.
+
+    The folder is indexed once, by file names only, see file_start_time: files whose time can't be told are skipped.
+    Either a mirror of the S3 archive layout, <root>/hls/<stream timestamp>/liveNNN.ts, or any tree of time stamped
+    files works. get_next_clip returns, in place of a wav path, a WavSlice of up to polling_interval seconds of a wav
+    file, which is read with block reads when processed, or the decoded (samples, sample rate) of up to
+    polling_interval seconds of consecutive .ts segments of one stream. Nothing is written to wav_dir.
+    """
+
+    def __init__(self, root, polling_interval, start_unix_time, end_unix_time, wav_dir=None, overwrite_output=False,
+                 audio_offset=2):
+        """
+        * root: Str, folder of the archive.
+        * polling_interval: Int, maximum seconds per clip.
+        * start_unix_time, end_unix_time: Float, the date range to read, as for DateRangeHLSStream.
+        * wav_dir, overwrite_output: Unused, for the same signature as DateRangeHLSStream.
+        * audio_offset: Int, default 2. Seconds between a stream timestamp and its first audio, see file_start_time.
+        """
+
+        self.root = root
+        self.polling_interval = polling_interval
+        self.start = dt.datetime.fromtimestamp(start_unix_time)
+        self.end = dt.datetime.fromtimestamp(end_unix_time)
+        self.audio_offset = audio_offset
+        self.clips = self._plan_clips(self._index())
+
+    def _index(self):
+        """
+        ArchiveFile of every file in the archive, oldest first.
+        """
+
+        files = []
+        for folder, _, names in os.walk(self.root):
+            segment_seconds = self._segment_seconds(folder)
+            for name in names:
+                if not name.endswith(ARCHIVE_EXTENSIONS):
+                    continue
+                path = os.path.join(folder, name)
+                start = file_start_time(path, self.audio_offset, segment_seconds)
+                if start is not None:
+                    files.append(ArchiveFile(path, start))
+
+        return sorted(files, key=lambda file: (file.start, file.path))
+
+    @staticmethod
+    def _segment_seconds(folder):
+        playlist = os.path.join(folder, 'live.m3u8')
+        if os.path.exists(playlist):
+            with open(playlist) as f:
+                return m3u8.loads(f.read()).target_duration or 10
+        return 10
+
+    def _plan_clips(self, files):
+        """
+        (start time, wav slice or list of .ts paths) of every clip in the date range, oldest first.
+        """
+
+        clips = []
+        segments, segments_start = [], None
+        for file in files:
+            if file.path.endswith('.wav'):
+                info = sf.info(file.path)
+                # Frames of the file inside the date range
+                first = max(0, math.ceil((self.start - file.start).total_seconds() * info.samplerate))
+                last = min(info.frames, int((self.end - file.start).total_seconds() * info.samplerate))
+                clip_frames = int(self.polling_interval * info.samplerate)
+                for start_frame in range(first, last, clip_frames):
+                    clip_start = file.start + dt.timedelta(seconds=start_frame / info.samplerate)
+                    clips.append((clip_start, WavSlice(file.path, start_frame,
+                                                       min(clip_frames, last - start_frame))))
+                continue
+
+            segment_seconds = self._segment_seconds(os.path.dirname(file.path))
+            if file.start < self.start or file.start >= self.end:
+                continue
+            # Group consecutive segments of the same stream, polling_interval seconds at a time. A segment that doesn't
+            # start where the group ends, e.g. after missing segments, starts a new group
+            segments_end = segments_start + dt.timedelta(seconds=len(segments) * segment_seconds) if segments else None
+            if segments and (os.path.dirname(file.path) != os.path.dirname(segments[-1])
+                             or file.start != segments_end
+                             or len(segments) * segment_seconds >= self.polling_interval):
+                clips.append((segments_start, segments))
+                segments = []
+            if not segments:
+                segments_start = file.start
+            segments.append(file.path)
+
+        if segments:
+            clips.append((segments_start, segments))
+
+        return sorted(clips, key=lambda clip: clip[0])
+
+    def get_next_clip(self, current_clip_name=None):
+        """
+        Get the next clip, as (WavSlice or (samples, sample rate), clip start time, None). The start time is formatted
+        like the clip names of DateRangeHLSStream followed by microseconds, 2023_01_01_12_00_00_500000, as clips of
+        wav files can start between seconds.
+        """
+
+        start, clip = self.clips.pop(0)
+        if isinstance(clip, list):
+            data = []
+            for path in clip:
+                with open(path, 'rb') as f:
+                    data.append(f.read())
+            clip = decode_ts(b"".join(data))
+
+        return clip, start.strftime("%Y_%m_%d_%H_%M_%S_%f"), None
+
+    def get_all_clips(self):
+        """
+        Get every clip of the date range.
+
+        # Return
+        Tuple of lists, the clips and their start times
+        """
+
+        clips, clip_start_times = [], []
+        while not self.is_stream_over():
+            clip, clip_start_time, _ = self.get_next_clip()
+            clips.append(clip)
+            clip_start_times.append(clip_start_time)
+
+        return clips, clip_start_times
+
+    def is_stream_over(self):
+        return len(self.clips) == 0
@@ -0,0 +1,73 @@
+# Native imports
+import datetime as dt
+import json
+import os
+
+
+class RunManifest:
+    """
+    Append-only record of the intervals a batch run has finished, so an interrupted run can resume where it stopped.
+
+    Each line of the file is a JSON record of one interval: the hydrophone, its start and end, and the names of the
+    parquet files written for it, or null if the interval had no data. The file names encode delta_t and delta_f or
+    bands, so an interval only counts as done for the products it was run with.
+    """
+
+    def __init__(self, path):
+        """
+        * path: Path of the manifest file. Created on the first record.
+        """
+
+        self.path = path
+        self.done = {}
+        if os.path.exists(path):
+            with open(path, 'rb+') as f:
+                data = f.read()
+                # A crash while appending can leave a partial last line. It is cut off, so the next record starts
+                # on a line of its own
+                if data and not data.endswith(b'\n'):
+                    data = data[:data.rfind(b'\n') + 1]
+                    f.truncate(len(data))
+            for line in data.decode().splitlines():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                key = self._key(record['hydrophone'], record['start'], record['end'], record['products'])
+                self.done[key] = record
+
+    @staticmethod
+    def _key(hydrophone, start, end, products):
+        if isinstance(start, dt.datetime):
+            start, end = start.isoformat(), end.isoformat()
+        return hydrophone, start, end, tuple(products)
+
+    def get(self, hydrophone, start: dt.datetime, end: dt.datetime, products):
+        """
+        The record of the interval if it was finished for these products, otherwise None.
+
+        * products: List of the interval's file names, one per product.
+        """
+
+        return self.done.get(self._key(hydrophone, start, end, products))
+
+    def record(self, hydrophone, start: dt.datetime, end: dt.datetime, products, files):
+        """
+        Record a finished interval.
+
+        * products: List of the interval's file names, one per product.
+        * files: List of the written file paths, or None if the interval had no data.
+        """
+
+        record = {
+            'hydrophone': hydrophone,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'products': list(products),
+            'files': None if files is None else list(files),
+        }
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.done[self._key(hydrophone, start, end, products)] = record
@@ -0,0 +1,125 @@
+# Native imports
+import os
+
+# Third part imports
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Local imports
+from ..utils.encoding import ENCODING_COMPRESSION, check_encoding, encode_frame
+
+
+class ParquetStreamWriter:
+    """
+    Append per-clip dataframes to one parquet file without holding the whole range in memory.
+
+    Consecutive clips can share their boundary samples. Writing frames one after the other gives the same file as
+    concatenating them and dropping duplicate index values with keep='last', as long as duplicates only occur between
+    neighbouring clips: the latest frame is held back until the next one arrives, so rows it shares with the next frame
+    can be dropped in favour of the newer ones. Rows are written in row groups of about row_group_bytes.
+
+    The file is written under a temporary name and only moved to path by close(), so a crash never leaves a truncated
+    file that looks finished.
+    """
+
+    # Target in-memory size of a row group
+    ROW_GROUP_BYTES = 64 * 2**20
+
+    def __init__(self, path, row_group_bytes=ROW_GROUP_BYTES, compression=None, encoding='float'):
+        """
+        * path: Path of the parquet file to write.
+        * row_group_bytes: Int, rows are buffered until they reach this many bytes before being written as a row group.
+        * compression: Str, default None. Parquet compression codec. Defaults to the one of the encoding, 'snappy' like
+          DataFrame.to_parquet for 'float'.
+        * encoding: Str, default 'float'. Storage encoding of the levels, see utils/encoding.py.
+        """
+
+        check_encoding(encoding)
+
+        self.path = path
+        # Hidden, so dataset readers listing the folder skip it
+        self.tmp_path = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.tmp')
+        self.row_group_bytes = row_group_bytes
+        self.compression = compression or ENCODING_COMPRESSION[encoding]
+        self.encoding = encoding
+        self.rows = 0
+
+        self._writer = None
+        self._schema = None
+        self._pending = None
+        self._buffer = []
+        self._buffer_bytes = 0
+
+    def write(self, frame):
+        """
+        Add a dataframe of rows that come after, or overlap the end of, the previous ones.
+        """
+
+        frame = frame[~frame.index.duplicated(keep='last')]
+        frame.columns = frame.columns.astype(str)
+        if self._pending is not None:
+            self._append(self._pending[~self._pending.index.isin(frame.index)])
+        self._pending = frame
+
+    def close(self):
+        """
+        Write the remaining rows and move the file into place.
+
+        # Return
+        The path of the written file, or None if no rows were written.
+        """
+
+        if self._pending is not None:
+            self._append(self._pending)
+            self._pending = None
+        self._flush()
+
+        if self._writer is None:
+            return None
+
+        self._writer.close()
+        self._writer = None
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+    def abort(self):
+        """
+        Stop writing and remove the partial file.
+        """
+
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            os.remove(self.tmp_path)
+        self._pending = None
+        self._buffer = []
+
+    def _append(self, frame):
+        if len(frame) == 0:
+            return
+        table = encode_frame(frame, self.encoding, schema=self._schema)
+        if self._schema is None:
+            self._schema = table.schema
+        self._buffer.append(table)
+        self._buffer_bytes += table.nbytes
+        self.rows += len(frame)
+        if self._buffer_bytes >= self.row_group_bytes:
+            self._flush()
+
+    def _flush(self):
+        if len(self._buffer) == 0:
+            return
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.tmp_path, self._schema, compression=self.compression)
+        self._writer.write_table(pa.concat_tables(self._buffer))
+        self._buffer = []
+        self._buffer_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -5,19 +5,36 @@ import tempfile
 import time
 import logging
 import random
+import itertools
+import threading
+import queue
+import functools
+import math
 
 
 # Third part imports
+import librosa
 import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
+import soundfile as sf
+from botocore.exceptions import BotoCoreError, ClientError
 from multiprocessing import Pool
 
 # Local imports
 from orca_hls_utils.DateRangeHLSStream import DateRangeHLSStream
-from .acoustic_util import wav_to_array
+from .acoustic_util import (Product, ProductStitcher, plan_stft, wav_to_products, array_to_products, filter_bank,
+                            filter_banks, load_filter_banks)
+from .hls_stream import MemoryHLSStream
+from .parquet_writer import ParquetStreamWriter
+from .manifest import RunManifest
+from .shared_results import to_shared, from_shared
+from .live import LIVE_BUCKET, LiveSource, LiveCursor, SampleBuffer
+from .local_archive import LocalArchiveStream, WavSlice, read_wav_slice
 from ..utils.file_connector import S3FileConnector
+from ..utils.dataset import DATASET_ROW_GROUP_BYTES, dataset_filename, to_dataset_frame
+from ..utils.encoding import ENCODING_COMPRESSION, check_encoding, encode_frame
 
-from orcasound_noise.pipeline.acoustic_util import wav_to_array
 from orcasound_noise.utils import Hydrophone
 from orcasound_noise.utils.file_connector import S3FileConnector
 
@@ -25,7 +42,10 @@ from orcasound_noise.utils.file_connector import S3FileConnector
 class NoiseAnalysisPipeline:
 
     def __init__(self, hydrophone: Hydrophone, delta_t, delta_f, bands=None, wav_folder=None, pqt_folder=None,
-                 no_auth=False, mode='safe'):
+                 no_auth=False, mode='safe', products=None, memory_limit=None, dtype="float64",
+                 stft_strategy="frames", fft_backend=None, fft_workers=None, in_memory=False,
+                 segment_cache=None, pool=None, local_archive=None, layout="flat",
+                 encoding="float"):
         """
         Pipeline object for generating rolled-up PDS parquet files. 
 
@@ -38,11 +58,54 @@ class NoiseAnalysisPipeline:
           be divided into, where each frequency step is 1/Nth of an octave with N=bands. Based on the ISO R series.
           Accepts values 1, 3, 6, 12, or 24.
         * no_auth: Bool, default False. Set to True to allow anonymous downloads. Uploading is not available when True.
+        * products: List of Product, default None. Outputs to write from generate_parquet_file. All of them are computed
+          from one decode and one STFT at delta_f per clip, e.g. [Product(60), Product(1, bands=3), Product(60, bands=12),
+          Product(1, is_broadband=True)]. Defaults to the delta_t/bands PSD and its broadband.
+        * memory_limit: Int, default None. Approximate bytes the STFT of one clip may use. Clips whose STFT would not fit
+          are streamed from disk in blocks instead of loaded whole, so polling_interval no longer drives peak memory.
+        * dtype: Str, default "float64". Set to "float32" to keep spectra, levels and the written parquet columns in single
+          precision. Results differ from float64 by at most about one 0.01 dB rounding step, see wav_to_products.
+        * stft_strategy: Str, default "frames". How the STFT is framed for the products: "frames", "welch" or "auto".
+          See plan_stft for the trade-offs and stft_plan to inspect the resulting plan.
+        * fft_backend: Str, default None. FFT library for the STFT: "numpy", "scipy" or "pyfftw" (needs pyfftw
+          installed). None keeps librosa's own for single threaded FFTs and uses "scipy" for more threads. Only "scipy"
+          and "pyfftw" are multi-threaded.
+        * fft_workers: Int, default None. FFT threads per clip. By default safe mode gives every core to the FFT of its
+          one clip, and fast mode runs one single threaded process per core. Setting it in fast mode runs
+          cores // fft_workers processes so the two never oversubscribe the machine.
+        * in_memory: Bool, default False. Decode the .ts segments straight into memory with ffmpeg instead of writing a
+          wav file per polling_interval to wav_folder and reading it back. memory_limit does not apply to these clips.
+        * segment_cache: SegmentCache, default None. Persistent cache of downloaded .ts segments, which can be shared
+          with other pipelines, so reprocessing the same hours doesn't download them again. Implies in_memory.
+        * pool: multiprocessing.pool.Pool, default None. Worker pool for fast mode, e.g. shared by several pipelines.
+          It is left open by close(). By default the pipeline starts its own pool on the first fast mode call and keeps
+          its workers warm, with libraries imported and filter banks built, until close().
+        * local_archive: Str, default None. Local folder of raw .ts and .wav files to read instead of the S3 archive,
+          either the hydrophone's folder or a folder holding it, see LocalArchiveStream. No S3 connection is made
+          unless files are uploaded or the S3 archive is checked for existing outputs.
+        * layout: Str, default "flat". How parquet files are laid out in the pqt folder and the S3 archive. "flat" puts
+          every file in the folder itself. "dataset" puts them in hive style partitions by hydrophone, product,
+          resolution and start date, with a sorted timestamp column and small row groups, so NoiseAccessor can read
+          just the rows and columns a query needs. See utils/dataset.py.
+        * encoding: Str, default "float". Storage encoding of the levels in the written parquet files: "float" columns
+          as DataFrame.to_parquet writes them, or int16 hundredths of a dB, within 0.005 dB of the levels, compressed
+          with zstd, either as a column per frequency, "centi_db", or one list column, "centi_db_list".
+          NoiseAccessor and utils.encoding.read_parquet read them all back as the same dataframes. See
+          utils/encoding.py.
         """
 
+        if layout not in ("flat", "dataset"):
+            raise ValueError("layout must be 'flat' or 'dataset'")
+        check_encoding(encoding)
+
         # Conenctions
         self.hydrophone = hydrophone.value
-        self.file_connector = S3FileConnector(hydrophone, no_sign=no_auth)
+        self._hydrophone = hydrophone
+        self.no_auth = no_auth
+        self._file_connector = None
+        self.local_archive = local_archive
+        self.layout = layout
+        self.encoding = encoding
         self.mode = mode
 
         # Local storage
@@ -64,14 +127,68 @@ class NoiseAnalysisPipeline:
         self.delta_f = delta_f
         self.delta_t = delta_t
         self.bands = bands
+        self.products = products or [Product(delta_t, bands), Product(delta_t, is_broadband=True)]
+        self.memory_limit = memory_limit
+        self.dtype = dtype
+        self.stft_strategy = stft_strategy
+        self.fft_backend = fft_backend
+        self.fft_workers = fft_workers
+        self.segment_cache = segment_cache
+        self.in_memory = in_memory or segment_cache is not None
+        self.pool = pool
+        self._owns_pool = False
         # Calculate ref for hydrophone with generate_ref()
         self.ref = self.hydrophone.bb_ref
 
+    @property
+    def file_connector(self):
+        """
+        S3FileConnector of the hydrophone, created on first use so offline runs never need AWS.
+        """
+
+        if self._file_connector is None:
+            self._file_connector = S3FileConnector(self._hydrophone, no_sign=self.no_auth)
+        return self._file_connector
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """
+        Shut down the worker pool the pipeline started, if any. A pool passed to the pipeline is left open.
+        """
+
+        if self._owns_pool and self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+            self._owns_pool = False
+
+    def worker_pool(self, processes=None):
+        """
+        The fast mode worker pool, started on first use with the filter banks built so far preloaded in every worker.
+
+        * processes: Int, default None. Number of workers if the pool has to be started. Defaults to parallelism().
+        """
+
+        if self.pool is None:
+            self.pool = Pool(processes or self.parallelism()[0], initializer=load_filter_banks,
+                             initargs=(filter_banks(),))
+            self._owns_pool = True
+        return self.pool
+
     def __del__(self):
         """"
-        Remove Temp Dirs on delete
+        Remove Temp Dirs and stop the worker pool on delete
         """
 
+        try:
+            self.close()
+        except AttributeError:
+            pass
         try:
             self.wav_folder_td.cleanup()
         except AttributeError:
@@ -81,16 +198,69 @@ class NoiseAnalysisPipeline:
         except AttributeError:
             pass
 
+    def stft_plan(self, sr, products=None):
+        """
+        The STFT plan used for clips sampled at sr.
+
+        * sr: Int, sample rate of the clips.
+        * products: List of Product, default None. Defaults to the pipeline's products.
+
+        # Return
+
+        StftPlan of (n_fft, hop_length, window, strategy)
+        """
+
+        return plan_stft(sr, self.delta_f, products or self.products, self.stft_strategy)
+
+    def parallelism(self):
+        """
+        How the cores are split between processes and FFT threads in the current mode.
+
+        # Return
+
+        Tuple of (number of processes, FFT threads per process)
+        """
+
+        cores = os.cpu_count() or 1
+        if self.mode == 'fast':
+            fft_workers = min(self.fft_workers or 1, cores)
+            return max(1, cores // fft_workers), fft_workers
+
+        return 1, self.fft_workers or cores
+
+    @staticmethod
+    def clip_to_products(clip, start_time, delta_f, products, kwargs):
+        """
+        Compute products for a clip that is either a wav file path, a WavSlice or decoded (samples, sample rate).
+        """
+
+        if isinstance(clip, WavSlice):
+            clip = read_wav_slice(clip)
+        if isinstance(clip, str):
+            return wav_to_products(clip, products, t0=start_time, delta_f=delta_f, transforms=[], **kwargs)
+
+        kwargs = {k: v for k, v in kwargs.items() if k != 'memory_limit'}
+        return array_to_products(*clip, products, t0=start_time, delta_f=delta_f, transforms=[], **kwargs)
+
+    @staticmethod
+    def process_wav_file_shared(args):
+        """
+        process_wav_file for pool workers: the dataframes are handed back through shared memory, see to_shared.
+        """
+
+        result = NoiseAnalysisPipeline.process_wav_file(args)
+        if result is None:
+            return None
+        return {product: (to_shared(frame), counts) for product, (frame, counts) in result.items()}
+
     @staticmethod
     def process_wav_file(args):
-        wav_file_path, start_time, delta_t, delta_f, bands, kwargs = args
+        wav_file_path, start_time, delta_f, products, kwargs = args
         try:
-            dfs = wav_to_array(wav_file_path, t0=start_time, delta_t=delta_t, delta_f=delta_f, transforms=[],
-                               bands=bands, **kwargs)
-            return dfs[0], dfs[1]
+            return NoiseAnalysisPipeline.clip_to_products(wav_file_path, start_time, delta_f, products, kwargs)
         except FileNotFoundError as fnf_error:
             logging.debug(f"{wav_file_path} clip failed to download: Error {fnf_error}")
-            return None, None
+            return None
 
     def generate_psds(self, start: dt.datetime, end: dt.datetime, max_files=None, polling_interval=600,
                       overwrite_output=True, ref_lvl=True, **kwargs):
@@ -109,12 +279,102 @@ class NoiseAnalysisPipeline:
         Tuple of lists. First is psds and second is broadbands. Each list has one entry per wav_file generated
 
         """
+
+        psd_product = Product(self.delta_t, self.bands)
+        broadband_product = Product(self.delta_t, is_broadband=True)
+        results = self.generate_products(start, end, products=[psd_product, broadband_product], max_files=max_files,
+                                         polling_interval=polling_interval, overwrite_output=overwrite_output,
+                                         ref_lvl=ref_lvl, **kwargs)
+        if results is None:
+            return None, None
+
+        return results[psd_product], results[broadband_product]
+
+    def generate_products(self, start: dt.datetime, end: dt.datetime, products=None, max_files=None,
+                          polling_interval=600, overwrite_output=True, ref_lvl=True, **kwargs):
+        """
+        Pull ts files from aws and compute every requested product from each clip, decoding and running the STFT once.
+
+        * start_date: First date to pull files for
+        * end_date: Last date to collect files for
+        * products: List of Product to compute. Defaults to the pipeline's products
+        * max_files: Maximum number of wav files to generate. Use to help limit compute and egress whiel testing.
+        * polling_interval: Int, size in secconds of intermediate wav files to generate.
+        * overwrite_output: Automatically overwrite existing wav files. If False, will prompt before overwriting
+        * ref_lvl: Bool, default True. Subtract the hydrophone reference level from broadband products
+        * kwargs: Other keyword args are passed to wav_to_products
+
+        # Return
+
+        Dict of {product: dataframe}, or None if no data was found
+
+        """
+        products = products or self.products
+        results = list(self.iter_clip_products(start, end, products=products, max_files=max_files,
+                                               polling_interval=polling_interval, overwrite_output=overwrite_output,
+                                               **kwargs))
+
+        if len(results) == 0:
+            logging.warning(f"No data found for {start} to {end}")
+            return None
+
+        output = {}
+        for product in products:
+            # Concatenating the per-clip dataframes to get one dataframe per product, they are contiguous and ordered
+            product_result = pd.concat([r[product] for r in results])
+
+            # Subtracting reference level from broadband
+            if ref_lvl and product.is_broadband:
+                product_result = product_result - self.ref
+
+            output[product] = product_result
+        del results
+
+        return output
+
+    def iter_clip_products(self, start: dt.datetime, end: dt.datetime, products=None, max_files=None,
+                           polling_interval=600, overwrite_output=True, **kwargs):
+        """
+        Pull ts files from aws and yield the products of each clip, in time order, as soon as they are computed.
+
+        In fast mode downloading and computing overlap: a producer thread pulls the next clips from the stream, one at a
+        time, and submits each to the pool while worker processes compute the earlier ones. At most two clips per
+        process are in flight, downloaded but not yet consumed, so memory and wav_folder use stay bounded however long
+        the range is. The segments of each clip are only fetched in parallel, over a pooled HTTP session, with
+        in_memory=True, see MemoryHLSStream.
+
+        Consecutive clips are treated as one continuous signal: each clip is transformed with the edge samples of its
+        neighbours, see _clip_tasks, and the bins that straddle two clips are joined by a ProductStitcher. The rows of
+        the clips are therefore contiguous, never repeat and are already in time order.
+
+        * start_date: First date to pull files for
+        * end_date: Last date to collect files for
+        * products: List of Product to compute. Defaults to the pipeline's products
+        * max_files: Maximum number of clips to generate. Use to help limit compute and egress whiel testing.
+        * polling_interval: Int, size in secconds of each clip.
+        * overwrite_output: Automatically overwrite existing wav files. If False, will prompt before overwriting
+        * kwargs: Other keyword args are passed to wav_to_products
+
+        # Return
+
+        Generator of dicts of {product: dataframe}, one per clip and a last one for the final bins, without the
+        reference level subtracted
+        """
+
+        products = products or self.products
+        kwargs.setdefault('memory_limit', self.memory_limit)
+        kwargs.setdefault('dtype', self.dtype)
+        kwargs.setdefault('stft_strategy', self.stft_strategy)
+        kwargs.setdefault('fft_backend', self.fft_backend)
+        processes, fft_workers = self.parallelism()
+        kwargs.setdefault('fft_workers', fft_workers)
+
         # Set timezone, pipeline won't work on devices not set to PST
         os.environ['TZ'] = 'US/Pacific'
         time.tzset()
 
         # Creating the stream object
-        stream = DateRangeHLSStream(
+        stream_args = (
             'https://s3-us-west-2.amazonaws.com/' + self.hydrophone.bucket + '/' + self.hydrophone.ref_folder,
             polling_interval,
             time.mktime(start.timetuple()),
@@ -122,155 +382,523 @@ class NoiseAnalysisPipeline:
             self.wav_folder,
             overwrite_output
         )
-        # Fast mode still in development, use safe mode for accurate results
+        if self.local_archive is not None:
+            root = os.path.join(self.local_archive, self.hydrophone.ref_folder)
+            stream = LocalArchiveStream(root if os.path.isdir(root) else self.local_archive, *stream_args[1:])
+        elif self.in_memory:
+            stream = MemoryHLSStream(*stream_args, cache=self.segment_cache)
+        else:
+            stream = DateRangeHLSStream(*stream_args)
+
         if self.mode == 'fast':
-            tasks = []
+            # Slots are taken when a clip is downloaded and given back when its result is consumed
+            slots = threading.Semaphore(2 * processes)
+            stop = threading.Event()
+            tasks = self._clip_tasks(stream, products, kwargs, max_files, slots, stop)
+            first = next(tasks, None)
+            if first is None:
+                return
+
+            # Build the octave filter banks once here and hand them to the workers instead of each one rebuilding them
+            sr, _ = self._clip_shape(first[0])
+            for bands in set(p.bands for p in products if p.bands is not None and not p.is_broadband):
+                filter_bank(bands, sr, int(sr / self.delta_f))
+
+            # A producer thread downloads the clips and hands them to the pool as they come, the results are consumed
+            # here in clip order. The pool's own task thread never waits on a download, so a shared pool stays free
+            print('#' * 5, "Using Multiprocessing for process_wav_file", '#' * 5)
+            pool = self.worker_pool(processes)
+            results = queue.Queue()
+            producer = threading.Thread(target=self._submit_clips,
+                                        args=(pool, itertools.chain([first], tasks), results, stop), daemon=True)
+            producer.start()
+            stitcher = ProductStitcher(products, dtype=kwargs['dtype'])
+            try:
+                while True:
+                    result = results.get()
+                    if result is None:
+                        break
+                    if isinstance(result, BaseException):
+                        raise result
+                    result = result.get()
+                    slots.release()
+                    if result is not None:
+                        yield stitcher.add({product: (from_shared(shared), counts)
+                                            for product, (shared, counts) in result.items()})
+                final = stitcher.flush()
+                if final is not None:
+                    yield final
+            finally:
+                # If the results were abandoned or failed, unblock the producer so it stops, and free the shared
+                # memory of the clips still in flight
+                stop.set()
+                slots.release()
+                producer.join()
+                self._free_results(results)
+
+        elif self.mode == 'safe':
+            stitcher = ProductStitcher(products, dtype=kwargs['dtype'])
+            for task in self._clip_tasks(stream, products, kwargs, max_files):
+                # Convert the .wav file, or the decoded clip, into a dataframe per product
+                result = self.process_wav_file(task)
+                if result is not None:
+                    yield stitcher.add(result)
+            final = stitcher.flush()
+            if final is not None:
+                yield final
+
+        else:
+            raise ValueError("Specify either 'safe' or 'fast' mode")
+
+    @staticmethod
+    def _submit_clips(pool, tasks, results, stop):
+        """
+        Submit each task to the pool as soon as its clip is downloaded, putting the AsyncResults on the results queue in
+        clip order, then None. An exception while downloading is put on the queue instead, for the consumer to raise.
+        """
+
+        try:
+            for task in tasks:
+                if stop.is_set():
+                    break
+                results.put(pool.apply_async(NoiseAnalysisPipeline.process_wav_file_shared, (task,)))
+        except BaseException as e:
+            results.put(e)
+        results.put(None)
+
+    @staticmethod
+    def _free_results(results):
+        """
+        Wait for the results left on the queue of _submit_clips and free their shared memory.
+        """
+
+        while True:
+            result = results.get()
+            if result is None or isinstance(result, BaseException):
+                return
             try:
-                wav_file_paths_and_clip_start_times = stream.get_all_clips()
-                print('#' * 5, "Finished Downloading .ts files", '#' * 5)
+                result = result.get()
+            except Exception:
+                continue
+            if result is not None:
+                for shared, _ in result.values():
+                    from_shared(shared)
 
-                wav_file_paths = wav_file_paths_and_clip_start_times[0]
-                clip_start_time = wav_file_paths_and_clip_start_times[1]
-                assert len(wav_file_paths) == len(clip_start_time)
+    def _clip_tasks(self, stream, products, kwargs, max_files=None, slots=None, stop=None):
+        """
+        Yield a process_wav_file task for each clip of the stream, for partial products that a ProductStitcher joins.
 
-                for i in range(len(wav_file_paths)):
-                    start_time = [int(x) for x in clip_start_time[i].split('_')]
-                    start_time = dt.datetime(*start_time)
-                    tasks.append((wav_file_paths[i], start_time, self.delta_t, self.delta_f, self.bands, kwargs))
+        Each clip is fetched one ahead, so that when it continues the previous clip or is continued by the next one,
+        within CLIP_JOIN_TOLERANCE seconds, the task gets their edge samples as preroll and postroll. A clip that
+        continues the previous one starts where it ended, by sample count, so the bins of both line up exactly.
+        """
 
-            except FileNotFoundError as fnf_error:
-                logging.debug("%s clip failed to download: Error %s", clip_start_time, fnf_error)
-                pass
-            # Use a multiprocessing Pool
-            print('#' * 5, "Using Multiprocessing for process_wav_file", '#' * 5)
-            with Pool() as pool:
-                results = pool.map(self.process_wav_file, tasks)
-                # Filter out None results and concatenate
-            psd_results = [r[0] for r in results if r[0] is not None]
-            broadband_results = [r[1] for r in results if r[1] is not None]
+        clips = self._clips(stream, max_files, slots, stop)
+        previous, previous_end = None, None
+        current = next(clips, None)
+        while current is not None:
+            following = next(clips, None)
+            clip, start_time = current
+            sr, n_samples = self._clip_shape(clip)
+            pad = plan_stft(sr, self.delta_f, products, kwargs.get('stft_strategy', 'frames')).n_fft // 2
 
-            if len(psd_results) == 0:
-                logging.warning(f"No data found for {start} to {end}")
-                return None, None
+            clip_kwargs = dict(kwargs, partial=True)
+            if previous is not None and self._continues(previous_end, start_time):
+                start_time = previous_end
+                clip_kwargs['preroll'] = self._clip_edge(previous, pad, tail=True)
+            end_time = start_time + dt.timedelta(seconds=n_samples / sr)
+            if following is not None and self._continues(end_time, following[1]):
+                clip_kwargs['postroll'] = self._clip_edge(following[0], pad, tail=False)
 
-            psd_results = pd.concat(psd_results).sort_index()
-            broadband_results = pd.concat(broadband_results).sort_index()
-            psd_results = psd_results[~psd_results.index.duplicated(keep='last')]
-            broadband_results = broadband_results[~broadband_results.index.duplicated(keep='last')]
+            yield clip, start_time, self.delta_f, products, clip_kwargs
+            previous, previous_end, current = clip, end_time, following
 
-            if ref_lvl:
-                broadband_results = broadband_results - self.ref
+    # Largest gap or overlap, in seconds, between the end of a clip and the start of the next for them to be joined
+    CLIP_JOIN_TOLERANCE = 1
 
-            return psd_results, broadband_results
+    def _continues(self, end_time, start_time):
+        return abs((start_time - end_time).total_seconds()) <= self.CLIP_JOIN_TOLERANCE
 
-        elif self.mode == 'safe':
-            psd_results = []
-            broadband_results = []
-            while (max_files is None or (len(psd_results) < max_files)) and not stream.is_stream_over():
-                try:
-                    # Create .wav file with duration of polling_interval
-                    wav_file_path, clip_start_time, _ = stream.get_next_clip()
-                    if clip_start_time is None:
-                        continue
-                    start_time = [int(x) for x in clip_start_time.split('_')]
-                    start_time = dt.datetime(*start_time)
-                    if wav_file_path is not None:
-                        # Convert the .wav file into PSD and broadband dataframes
-                        dfs = wav_to_array(wav_file_path, t0=start_time, delta_t=self.delta_t, delta_f=self.delta_f,
-                                           transforms=[], bands=self.bands, **kwargs)
-                        # Add the PSD and broadband to list of dataframes
-                        psd_results.append(dfs[0])
-                        broadband_results.append(dfs[1])
-                except FileNotFoundError as fnf_error:
-                    logging.debug("%s clip failed to download: Error %s", clip_start_time, fnf_error)
-                    pass
-
-            if len(psd_results) == 0:
-                logging.warning(f"No data found for {start} to {end}")
-                return None, None
+    @staticmethod
+    def _clip_shape(clip):
+        """
+        (sample rate, number of samples) of a wav file path, WavSlice or decoded (samples, sample rate) clip.
+        """
 
-            # Concatenating the list of PSDs and broadband to get one PSD and one broadband
-            psd_result = pd.concat(psd_results)
-            del psd_results
-            broadband_result = pd.concat(broadband_results)
-            del broadband_results
-            # Removing duplicates, occur sometimes at end of one dataframe and start of next
-            psd_result = psd_result[~psd_result.index.duplicated(keep='last')]
-            broadband_result = broadband_result[~broadband_result.index.duplicated(keep='last')]
+        if isinstance(clip, WavSlice):
+            return sf.info(clip.path).samplerate, clip.frames
+        if isinstance(clip, str):
+            info = sf.info(clip)
+            return info.samplerate, info.frames
+        return clip[1], len(clip[0])
 
-            # Subtracting reference level from broadband
-            if ref_lvl:
-                broadband_result = broadband_result - self.ref
+    @staticmethod
+    def _clip_edge(clip, n_samples, tail):
+        """
+        The first, or with tail the last, n_samples mono samples of a wav file path, WavSlice or decoded clip.
+        """
 
-            return psd_result, broadband_result
+        if isinstance(clip, WavSlice):
+            n_samples = min(n_samples, clip.frames)
+            start_frame = clip.start_frame + clip.frames - n_samples if tail else clip.start_frame
+            return read_wav_slice(WavSlice(clip.path, start_frame, n_samples))[0]
+        if not isinstance(clip, str):
+            y = clip[0]
+            return (y[max(len(y) - n_samples, 0):] if tail else y[:n_samples]).copy()
+
+        with sf.SoundFile(clip) as sound:
+            if tail:
+                sound.seek(max(sound.frames - n_samples, 0))
+            y = sound.read(n_samples, dtype='float32', always_2d=True)
+        return librosa.to_mono(y.T)
+
+    def _clips(self, stream, max_files=None, slots=None, stop=None):
+        """
+        Yield (clip, start time) for each clip of the stream, waiting for a free slot before fetching each one. Stops
+        early once stop is set.
+        """
 
-        else:
-            raise ValueError("Specify either 'safe' or 'fast' mode")
+        n_clips = 0
+        while (max_files is None or n_clips < max_files) and not stream.is_stream_over():
+            if slots is not None:
+                slots.acquire()
+            if stop is not None and stop.is_set():
+                return
+            clip, clip_start_time = None, None
+            try:
+                # Create .wav file, or decode the clip, with duration of polling_interval
+                clip, clip_start_time, _ = stream.get_next_clip()
+            except FileNotFoundError as fnf_error:
+                logging.debug("%s clip failed to download: Error %s", clip_start_time, fnf_error)
+
+            if clip is None or clip_start_time is None:
+                if slots is not None:
+                    slots.release()
+                continue
+
+            # Clip names of the S3 streams end in whole seconds, those of local archives in microseconds
+            start_time = [int(x) for x in clip_start_time.split('_')]
+            start_time = dt.datetime(*start_time)
+            n_clips += 1
+            yield clip, start_time
 
     def generate_parquet_file(self, start: dt.datetime, end: dt.datetime, pqt_folder_override=None,
-                              upload_to_s3=False):
+                              upload_to_s3=False, streaming=False):
         """
-        Create a parquet file of the psd at the given daterange.
+        Create a parquet file of each of the pipeline's products at the given daterange.
 
         * Start: datetime, start of data to poll
         * end: datetime, end of data to poll
         * pqt_folder_override: Overide the object level settings for where to save pqt files.
         * upload_to_s3: Boolean, set to true to upload file to S3 after saving
+        * streaming: Boolean, default False. Append each clip's rows to the files as soon as they are computed instead
+          of building whole dataframes first, so peak memory stays at a few clips however long the daterange is.
+          The files hold the same rows as without streaming.
 
         # Return
-        Filepath of generated pqt file.
+        Tuple of filepaths of generated pqt files, one per product. By default (psd file, broadband file).
         """
 
-        # Create PSD and broadband Dataframes
-        pds_frame, broadband_frame = self.generate_psds(start, end, overwrite_output=True)
-
-        if pds_frame is None:
-            return None, None
-
-        # Save file locally
+        # Save files locally
         save_folder = pqt_folder_override or self.pqt_folder
-        os.makedirs(save_folder, exist_ok=True)
-        fileName = self.file_connector.create_filename(start, end, self.delta_t, self.delta_f,
-                                                       octave_bands=self.bands)
-        broadbandName = self.file_connector.create_filename(start, end, self.delta_t, is_broadband=True)
-        filePath = os.path.join(save_folder, fileName)
-        broadbandFilePath = os.path.join(save_folder, broadbandName)
-        pds_frame.columns = pds_frame.columns.astype(str)
-        broadband_frame.columns = broadband_frame.columns.astype(str)
-        pds_frame.to_parquet(filePath)
-        broadband_frame.to_parquet(broadbandFilePath)
-
-        # Upload to S3 bucket
+        file_names = self.product_filenames(start, end)
+        file_paths = [os.path.join(save_folder, fileName) for fileName in file_names]
+        for filePath in file_paths:
+            os.makedirs(os.path.dirname(filePath), exist_ok=True)
+
+        if streaming:
+            if not self._stream_parquet_files(start, end, file_paths):
+                logging.warning(f"No data found for {start} to {end}")
+                return (None,) * len(self.products)
+        else:
+            # Create a Dataframe per product
+            frames = self.generate_products(start, end, overwrite_output=True)
+
+            if frames is None:
+                return (None,) * len(self.products)
+
+            for product, filePath in zip(self.products, file_paths):
+                frame = frames[product]
+                if self.layout == "dataset" or self.encoding != "float":
+                    with self._parquet_writer(filePath) as writer:
+                        writer.write(self._storage_frame(frame))
+                    continue
+                frame.columns = frame.columns.astype(str)
+                frame.to_parquet(filePath)
+
+        # Upload to S3 bucket, under the same relative path
         if upload_to_s3:
-            self.file_connector.upload_file(filePath, start, end, self.delta_t, self.delta_f,
-                                            octave_bands=self.bands)
-            self.file_connector.upload_file(broadbandFilePath, start, end, self.delta_t, is_broadband=True)
+            for product, filePath, fileName in zip(self.products, file_paths, file_names):
+                self.file_connector.upload_file(filePath, start, end, product.delta_t, self.delta_f,
+                                                octave_bands=product.bands, is_broadband=product.is_broadband,
+                                                file_name=fileName)
+
+        return tuple(file_paths)
+
+    def _stream_parquet_files(self, start, end, file_paths):
+        """
+        Write each product's rows to its file clip by clip. Returns False, writing nothing, if there was no data.
+        """
+
+        writers = [self._parquet_writer(path) for path in file_paths]
+        try:
+            for result in self.iter_clip_products(start, end, overwrite_output=True):
+                for product, writer in zip(self.products, writers):
+                    frame = result[product]
+                    # Subtracting reference level from broadband
+                    if product.is_broadband:
+                        frame = frame - self.ref
+                    writer.write(self._storage_frame(frame))
+        except BaseException:
+            for writer in writers:
+                writer.abort()
+            raise
+
+        return all([writer.close() is not None for writer in writers])
+
+    def _parquet_writer(self, path):
+        """
+        ParquetStreamWriter of a file of the pipeline's layout and encoding.
+        """
 
-        return filePath, broadbandFilePath
+        if self.layout == "dataset":
+            return ParquetStreamWriter(path, row_group_bytes=DATASET_ROW_GROUP_BYTES, encoding=self.encoding)
+        return ParquetStreamWriter(path, encoding=self.encoding)
 
-    def generate_parquet_file_batch(self, start: dt.datetime, num_files: int, file_length: dt.timedelta, **kwargs):
+    def _storage_frame(self, frame):
+        return to_dataset_frame(frame) if self.layout == "dataset" else frame
+
+    def product_filenames(self, start: dt.datetime, end: dt.datetime):
+        """
+        Names of the parquet files generate_parquet_file writes for the daterange, one per product. In the dataset
+        layout these are paths relative to the pqt folder.
+        """
+
+        if self.layout == "dataset":
+            return [dataset_filename(self.hydrophone.name, start, end, product.delta_t, self.delta_f,
+                                     octave_bands=product.bands, is_broadband=product.is_broadband)
+                    for product in self.products]
+
+        return [S3FileConnector.create_filename(start, end, product.delta_t, self.delta_f,
+                                                    octave_bands=product.bands, is_broadband=product.is_broadband)
+                for product in self.products]
+
+    def generate_parquet_file_batch(self, start: dt.datetime, num_files: int, file_length: dt.timedelta,
+                                    resume=False, check_s3=None, manifest_path=None, **kwargs):
         """
             Generate a range of parquet files, starting at starttime with given length.
 
             Ex: To generate a weeks worth of data in 1-day sizes, call generate_parquet_file_batch(startDate, 7, timedelta(days=1))
 
+            With resume=True every finished interval is recorded in a manifest file, and intervals are skipped when
+            the manifest has them, when all of their files are already in the pqt folder, or when all of them are
+            already in the S3 archive. Rerunning the same batch after a crash then only processes what is missing.
+            Intervals without data are recorded too, delete the manifest to retry them.
+
             * start: Datetime, start of first file to generate
             * num_files: NUmber of files to generate
             * file_length: The length in time of each file.
+            * resume: Bool, default False. Skip intervals that were already produced, see above.
+            * check_s3: Bool, default None. With resume, also look for already produced files in the S3 archive.
+              Defaults to True unless the pipeline reads a local_archive.
+            * manifest_path: Str, default None. Manifest file used with resume. Defaults to manifest.jsonl in the pqt
+              folder.
             * kwargs: Other kwargs are passed to generate_parquet_file function
 
             # Return
-            List of filepaths generated
+            List of filepaths generated. Intervals only found in the S3 archive give their S3 keys instead.
         """
 
+        intervals = [(start + file_length * i, start + file_length * (i + 1)) for i in range(num_files)]
+        if not resume:
+            return [self.generate_parquet_file(startTime, endTime, **kwargs) for startTime, endTime in intervals]
+
+        save_folder = kwargs.get('pqt_folder_override') or self.pqt_folder
+        os.makedirs(save_folder, exist_ok=True)
+        manifest = RunManifest(manifest_path or os.path.join(save_folder, 'manifest.jsonl'))
+        if check_s3 is None:
+            check_s3 = self.local_archive is None
+        archived = self._archived_files(start, intervals[-1][1]) if check_s3 and num_files > 0 else set()
+
         file_paths = []
-        for i in range(num_files):
-            startTime = start + file_length * i
-            endTime = startTime + file_length
-            file_paths.append(self.generate_parquet_file(startTime, endTime, **kwargs))
+        for startTime, endTime in intervals:
+            fileNames = self.product_filenames(startTime, endTime)
+            local_paths = [os.path.join(save_folder, fileName) for fileName in fileNames]
+            archive_keys = [self.hydrophone.save_folder + "/" + fileName for fileName in fileNames]
+
+            record = manifest.get(self.hydrophone.name, startTime, endTime, fileNames)
+            if record is not None:
+                files = record['files']
+                file_paths.append(tuple(files) if files is not None else (None,) * len(fileNames))
+                continue
+
+            if all([os.path.exists(path) for path in local_paths]):
+                logging.info("Skipping %s to %s, already in %s", startTime, endTime, save_folder)
+                if kwargs.get('upload_to_s3') and not all([key in archived for key in archive_keys]):
+                    for product, path, fileName in zip(self.products, local_paths, fileNames):
+                        self.file_connector.upload_file(path, startTime, endTime, product.delta_t, self.delta_f,
+                                                        octave_bands=product.bands, is_broadband=product.is_broadband,
+                                                        file_name=fileName)
+                files = tuple(local_paths)
+            elif all([key in archived for key in archive_keys]):
+                logging.info("Skipping %s to %s, already in the S3 archive", startTime, endTime)
+                files = tuple(archive_keys)
+            else:
+                files = self.generate_parquet_file(startTime, endTime, **kwargs)
+
+            manifest.record(self.hydrophone.name, startTime, endTime, fileNames,
+                            None if files[0] is None else files)
+            file_paths.append(files)
 
         return file_paths
 
+    def _archived_files(self, start: dt.datetime, end: dt.datetime):
+        """
+        Set of S3 keys of the pipeline's products in the archive that overlap the daterange.
+        """
+
+        keys = set()
+        try:
+            for product in self.products:
+                hz_bands = f"{product.bands}oct" if product.bands is not None else f"{self.delta_f}hz"
+                keys.update(self.file_connector.get_files(start, end, product.delta_t, hz_bands=hz_bands,
+                                                          is_broadband=product.is_broadband))
+        except (BotoCoreError, ClientError) as e:
+            logging.warning("Could not list the S3 archive, only local files will be skipped: %s", e)
+
+        return keys
+
+    def run_live(self, source=None, cursor_path=None, start_time=None, from_start=False, chunk_length=10,
+                 poll_interval=2, max_segments=None, stop=None):
+        """
+        Follow the hydrophone's live stream and process every segment as soon as it is published.
+
+        Decoded audio is cut at boundaries of a fixed grid of chunk_length seconds, rounded up to whole time bins of
+        every product, so each row is computed once from complete bins and lands about one segment after its audio.
+        Each chunk's rows are written to a small parquet file per product in a rolling daily partition,
+        pqt_folder/live/<delta_t>s_<frequency>/<YYYY-MM-DD>/, which can be read with pd.read_parquet on the folder,
+        or utils.encoding.read_parquet with an encoding, while it is being written. Chunks are transformed with the
+        samples around them, so they join up without edge effects. After each chunk a cursor file records the segment
+        the next chunk and its preroll start in and how far into it, so a restarted run picks up exactly where the last
+        one stopped. A new stream folder, e.g. after the hydrophone restarted, drops the unfinished bins of the old one.
+
+        * source: Str, default None. Stream to follow, a url or local folder, see LiveSource. Defaults to the
+          hydrophone's live stream on the streaming-orcasound-net bucket.
+        * cursor_path: Str, default None. Json file of the cursor. Defaults to pqt_folder/live/cursor.json.
+        * start_time: datetime, default None. Start time of the first segment for folders without stream timestamps,
+          such as a local folder of test segments. Defaults to now, in local time like the batch products.
+        * from_start: Bool, default False. Without a cursor, process every segment of the stream rather than only the
+          newest one.
+        * chunk_length: Float, default 10. Seconds of audio per written chunk, rounded up to whole bins.
+        * poll_interval: Float, default 2. Seconds to wait before checking again for new segments.
+        * max_segments: Int, default None. Return after processing this many segments. Runs forever by default.
+        * stop: threading.Event, default None. Return once it is set.
+
+        # Return
+        Number of segments processed.
+        """
+
+        # Set timezone, so rows are stamped in the same local time as the batch products
+        os.environ['TZ'] = 'US/Pacific'
+        time.tzset()
+
+        live = LiveSource(source or f"https://s3-us-west-2.amazonaws.com/{LIVE_BUCKET}/{self.hydrophone.ref_folder}")
+        cursor = LiveCursor(cursor_path or os.path.join(self.pqt_folder, 'live', 'cursor.json'))
+        os.makedirs(os.path.dirname(cursor.path), exist_ok=True)
+        kwargs = {'dtype': self.dtype, 'stft_strategy': self.stft_strategy, 'fft_backend': self.fft_backend,
+                  'fft_workers': self.parallelism()[1]}
+
+        # Chunks must hold whole bins of every product: their length is a multiple of all the products' delta_t
+        period = functools.reduce(math.lcm, [int(round(product.delta_t * 1000)) for product in self.products]) / 1000
+        chunk = dt.timedelta(seconds=period * max(1, math.ceil(chunk_length / period)))
+
+        buffer = SampleBuffer()
+        folder, last, next_start, skip_to = None, None, None, None
+        n_segments = 0
+        # Samples of the edges of each chunk, its preroll and postroll
+        pad = None
+        while (stop is None or not stop.is_set()) and (max_segments is None or n_segments < max_segments):
+            current = live.folder()
+            if current != folder:
+                if folder is not None:
+                    logging.info(f"New stream {current}, dropping {len(buffer.samples)} unwritten samples of {folder}")
+                    buffer = SampleBuffer()
+                folder, last, next_start, skip_to = current, None, None, None
+                if cursor.folder == folder:
+                    next_start, skip_to = cursor.segment_start, cursor.position
+
+            segments = live.segments(folder)
+            if last is not None:
+                segments = live.since(segments, last)
+            elif cursor.folder == folder:
+                segments = live.since(segments, cursor.segment, inclusive=True)
+            elif not from_start:
+                segments = segments[-1:]
+            if max_segments is not None:
+                segments = segments[:max_segments - n_segments]
+
+            if not segments:
+                time.sleep(poll_interval)
+                continue
+
+            for segment in segments:
+                y, sr = live.download(folder, segment)
+                if next_start is None:
+                    next_start = live.segment_start(folder, segment) or start_time or dt.datetime.now()
+                pad = pad or plan_stft(sr, self.delta_f, self.products, self.stft_strategy).n_fft // 2
+                buffer.add(segment, next_start, y, sr, skip_to, history=pad)
+                next_start += dt.timedelta(seconds=len(y) / sr)
+                # The cursor's segment was partly processed already, it doesn't count as a new one
+                n_segments += skip_to is None
+                last, skip_to = segment, None
+                self._write_live_chunks(buffer, chunk, pad, folder, cursor, kwargs)
+
+        return n_segments
+
+    def _write_live_chunks(self, buffer, chunk, pad, folder, cursor, kwargs):
+        """
+        Process and write every complete chunk in the buffer, advancing the cursor after each.
+
+        Frames are labelled n_fft/2 samples after the first sample of their window, so the samples of a chunk start
+        and end pad samples before its bins do. Each chunk is transformed with the pad samples around it, the history
+        of the buffer and the start of the next chunk, so its frames are the same as those of one long clip.
+        """
+
+        offset = dt.timedelta(seconds=pad / buffer.sr)
+        while True:
+            start = buffer.start + offset
+            midnight = dt.datetime.combine(start.date(), dt.time())
+            # Next boundary of the chunk grid, which restarts every midnight like the products' bins
+            cut = midnight + chunk * ((start - midnight) // chunk + 1)
+            cut = min(cut, midnight + dt.timedelta(days=1))
+            if cut > buffer.end:
+                return
+
+            chunk_start = buffer.start
+            preroll = buffer.history if len(buffer.history) > 0 else None
+            y = buffer.take(cut - offset, history=pad)
+            chunk_kwargs = dict(kwargs, preroll=preroll, postroll=buffer.samples[:pad])
+            result = self.clip_to_products((y, buffer.sr), chunk_start, self.delta_f, self.products, chunk_kwargs)
+            for product, file_name in zip(self.products, self.product_filenames(start, cut)):
+                frame = result[product]
+                # Subtracting reference level from broadband
+                if product.is_broadband:
+                    frame = frame - self.ref
+                frame.columns = frame.columns.astype(str)
+
+                # The product part of the file name, after the start and end dates
+                partition = os.path.join(self.pqt_folder, 'live', file_name.split('_', 2)[2][:-len('.parquet')],
+                                         start.strftime('%Y-%m-%d'))
+                os.makedirs(partition, exist_ok=True)
+                # Written under a name readers skip, then renamed, so the partition only ever holds whole files
+                tmp_path = os.path.join(partition, '.' + file_name + '.tmp')
+                pq.write_table(encode_frame(frame, self.encoding), tmp_path,
+                               compression=ENCODING_COMPRESSION[self.encoding])
+                os.replace(tmp_path, os.path.join(partition, file_name))
+
+            segment, segment_start = buffer.segments[0]
+            cursor.save(folder, segment, segment_start, buffer.start)
+
     def process_ancient_ambient(self, ref_time: dt.datetime, dB=True):
         """
         Calculate the ancient ambient level for a given date and update the parquet file storing the
@@ -0,0 +1,114 @@
+# Native imports
+import datetime as dt
+import os
+import tempfile
+
+# Local imports
+from .parquet_writer import ParquetStreamWriter
+from .scheduler import shard_bounds
+from ..analysis.accessor import NoiseAccessor
+from ..utils import Hydrophone
+from ..utils.dataset import dataset_filename, to_dataset_frame
+from ..utils.file_connector import S3FileConnector
+from ..utils.rollup import ROLLUP_COUNT_COLUMN, ROLLUP_LEVELS, rollup_levels
+
+
+class RollupBuilder:
+    """
+    Build coarser levels of a stored product, 1 minute, 10 minute, 1 hour and 1 day by default, from its base files.
+
+    Each day of the base product is read back with a NoiseAccessor and averaged up one level at a time with
+    rollup_levels, every level from the one below it, and written as one file per level and day, named and laid out
+    like the pipeline's own files at that delta_t. Rollup files have a count column, the number of base rows in each
+    row, so levels and days merge exactly. NoiseAccessor.create_df(resolution=...) reads the coarsest level that fits.
+    """
+
+    def __init__(self, hydrophone: Hydrophone, levels=ROLLUP_LEVELS, pqt_folder=None, layout="flat",
+                 encoding="float", upload_to_s3=False, no_auth=False, dataset=None, catalog=None):
+        """
+        * hydrophone: Hydrophone enum of the product.
+        * levels: Tuple of int, default ROLLUP_LEVELS. Seconds per row of the levels to build. Those that aren't
+          multiples of the base delta_t are skipped.
+        * pqt_folder: Local folder to write the rollup files to. Defaults to a temporary directory.
+        * layout, encoding: Str, how files are written, as for NoiseAnalysisPipeline.
+        * upload_to_s3: Bool, default False. Upload the rollup files to the archive, and add them to the catalog if
+          there is one.
+        * no_auth: Bool, default False. Read the base files anonymously. Uploading is not available when True.
+        * dataset, catalog: Where the base files are read from, as for NoiseAccessor.
+        """
+
+        self.hydrophone = hydrophone
+        self.levels = sorted(levels)
+        self.layout = layout
+        self.encoding = encoding
+        self.upload_to_s3 = upload_to_s3
+        self.accessor = NoiseAccessor(hydrophone, dataset=dataset, catalog=catalog)
+        if not no_auth:
+            self.accessor.connector = S3FileConnector(hydrophone, catalog=catalog)
+
+        if pqt_folder:
+            self.pqt_folder = pqt_folder
+            self.pqt_folder_td = None
+        else:
+            self.pqt_folder_td = tempfile.TemporaryDirectory()
+            self.pqt_folder = self.pqt_folder_td.name
+
+    def build(self, start: dt.datetime, end: dt.datetime, delta_t=1, delta_f="3oct", is_broadband=False):
+        """
+        Build the rollup levels of every day of [start, end) of a base product.
+
+        * start, end: datetime. Whole days are built, from the midnight before start to the one at or after end.
+        * delta_t: Int, default 1. Seconds per row of the base product.
+        * delta_f: Str, default "3oct". Bands of the base product, '50hz' or '3oct' format.
+        * is_broadband: Bool, default False. Build from the broadband product instead.
+
+        # Return
+        Dict of {level: list of file paths}
+        """
+
+        levels = [level for level in self.levels if level > delta_t and level % delta_t == 0]
+        first_day = dt.datetime.combine(start.date(), dt.time())
+        last_day = dt.datetime.combine((end - dt.timedelta(microseconds=1)).date(), dt.time()) + dt.timedelta(days=1)
+
+        paths = {level: [] for level in levels}
+        for day_start, day_end in shard_bounds(first_day, last_day, dt.timedelta(days=1)):
+            df = self.accessor.create_df(day_start, day_end, delta_t=delta_t, delta_f=delta_f,
+                                         is_broadband=is_broadband)
+            # The row at midnight belongs to the next day
+            df = df[df.index < day_end]
+            if len(df) == 0:
+                continue
+
+            counts = None
+            for level in levels:
+                df, counts = rollup_levels(df, level, counts)
+                paths[level].append(self._write(df, counts, day_start, day_end, level, delta_f, is_broadband))
+
+        return paths
+
+    def _write(self, frame, counts, start, end, delta_t, delta_f, is_broadband):
+        """
+        Write, and upload if asked, the file of one level of one day.
+        """
+
+        filename_kwargs = S3FileConnector.frequency_kwargs(delta_f, is_broadband)
+        if self.layout == "dataset":
+            file_name = dataset_filename(self.hydrophone.value.name, start, end, delta_t, **filename_kwargs)
+        else:
+            file_name = S3FileConnector.create_filename(start, end, delta_t, **filename_kwargs)
+        path = os.path.join(self.pqt_folder, file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        frame = frame.copy()
+        frame.columns = frame.columns.astype(str)
+        frame[ROLLUP_COUNT_COLUMN] = counts
+        with ParquetStreamWriter(path, encoding=self.encoding) as writer:
+            writer.write(to_dataset_frame(frame) if self.layout == "dataset" else frame)
+
+        if self.upload_to_s3:
+            connector = self.accessor.connector
+            connector.upload_file(path, start, end, delta_t, file_name=file_name, **filename_kwargs)
+            if connector.catalog is not None:
+                connector.catalog.swap([], [connector.catalog.record(connector.save_folder + "/" + file_name)])
+
+        return path
@@ -0,0 +1,164 @@
+# Native imports
+import datetime as dt
+import logging
+import os
+import shutil
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Local imports
+from .pipeline import NoiseAnalysisPipeline
+
+# One output configuration of a job, the NoiseAnalysisPipeline arguments of the same names
+Resolution = namedtuple("Resolution", "delta_t delta_f bands products", defaults=(None, None))
+
+# hydrophones x [start, end) cut in shard_length pieces x resolutions. shard_length is a timedelta or "month"
+JobSpec = namedtuple("JobSpec", "hydrophones start end shard_length resolutions")
+
+# One unit of work: one interval of one hydrophone at one resolution
+Shard = namedtuple("Shard", "hydrophone start end resolution")
+
+
+def shard_bounds(start: dt.datetime, end: dt.datetime, shard_length):
+    """
+    Split [start, end) into consecutive intervals of shard_length, the last one cut short at end.
+
+    * shard_length: timedelta, or "month" for calendar months.
+
+    # Return
+    List of (start, end) tuples
+    """
+
+    bounds = []
+    shard_start = start
+    while shard_start < end:
+        if shard_length == "month":
+            shard_end = dt.datetime(shard_start.year + shard_start.month // 12, shard_start.month % 12 + 1, 1)
+        else:
+            shard_end = shard_start + shard_length
+        bounds.append((shard_start, min(shard_end, end)))
+        shard_start = shard_end
+
+    return bounds
+
+
+def plan_shards(spec: JobSpec):
+    """
+    List every Shard of a job spec, interval by interval so all hydrophones make progress together.
+    """
+
+    return [Shard(hydrophone, start, end, resolution)
+            for start, end in shard_bounds(spec.start, spec.end, spec.shard_length)
+            for hydrophone in spec.hydrophones
+            for resolution in spec.resolutions]
+
+
+class BatchScheduler:
+    """
+    Run a JobSpec's shards over a pool of worker processes.
+
+    Each worker runs one shard at a time with a safe mode NoiseAnalysisPipeline, downloading into its own scratch
+    folder, and the cores left over are given to each worker's FFTs. Shards are idempotent: outputs already in the pqt
+    folder, its manifest or the S3 archive are skipped, and parquet files are only moved into place once complete, so
+    rerunning a job after a crash only processes what is missing. Failed shards are retried with exponential backoff.
+    Outputs go to pqt_folder/<hydrophone name>, mirroring the S3 archive layout, or with layout="dataset" in the
+    partitions of pqt_folder, which already split them by hydrophone.
+    """
+
+    def __init__(self, spec: JobSpec, pqt_folder, scratch_folder=None, max_workers=None, retries=3, backoff=30,
+                 upload_to_s3=False, no_auth=False, **pipeline_kwargs):
+        """
+        * spec: JobSpec of the work to do.
+        * pqt_folder: Local folder to store pqt files in, one subfolder per hydrophone.
+        * scratch_folder: Folder for the workers' wav files. Defaults to a scratch subfolder of pqt_folder.
+        * max_workers: Int, default None. Number of shards processed at once. Defaults to the number of cores.
+        * retries: Int, default 3. Number of times a failed shard is retried.
+        * backoff: Float, default 30. Seconds to wait before the first retry, doubled for each following one.
+        * upload_to_s3: Bool, default False. Upload generated files to the S3 archive.
+        * no_auth: Bool, default False. Allow anonymous downloads. Uploading is not available when True.
+        * pipeline_kwargs: Other keyword args are passed to NoiseAnalysisPipeline.
+        """
+
+        self.spec = spec
+        self.pqt_folder = pqt_folder
+        self.scratch_folder = scratch_folder or os.path.join(pqt_folder, 'scratch')
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.retries = retries
+        self.backoff = backoff
+        self.upload_to_s3 = upload_to_s3
+        self.no_auth = no_auth
+        self.pipeline_kwargs = pipeline_kwargs
+        self.pipeline_kwargs.setdefault('fft_workers', max(1, (os.cpu_count() or 1) // self.max_workers))
+
+    def run(self):
+        """
+        Process every shard, logging progress as shards finish.
+
+        # Return
+        Dict with the number of 'generated', 'skipped' and 'empty' shards, the list of 'failed' shards and the
+        elapsed 'seconds'.
+        """
+
+        shards = plan_shards(self.spec)
+        summary = {'generated': 0, 'skipped': 0, 'empty': 0, 'failed': [], 'seconds': 0.0}
+        started = time.time()
+
+        with ProcessPoolExecutor(self.max_workers) as executor:
+            futures = {executor.submit(run_shard, shard, self.pqt_folder, self.scratch_folder, self.retries,
+                                       self.backoff, self.upload_to_s3, self.no_auth, self.pipeline_kwargs): shard
+                       for shard in shards}
+            for done, future in enumerate(as_completed(futures), start=1):
+                shard = futures[future]
+                try:
+                    status = future.result()
+                    summary[status] += 1
+                except Exception as e:
+                    status = f"failed: {e}"
+                    summary['failed'].append(shard)
+                logging.info("[%d/%d] %s %s to %s %s: %s", done, len(shards), shard.hydrophone.name, shard.start,
+                             shard.end, tuple(shard.resolution[:3]), status)
+
+        summary['seconds'] = time.time() - started
+        logging.info("Finished %d shards in %.0fs: %d generated, %d skipped, %d empty, %d failed", len(shards),
+                     summary['seconds'], summary['generated'], summary['skipped'], summary['empty'],
+                     len(summary['failed']))
+        return summary
+
+
+def run_shard(shard: Shard, pqt_folder, scratch_folder, retries=3, backoff=30, upload_to_s3=False, no_auth=False,
+              pipeline_kwargs=None):
+    """
+    Process one shard in the calling process, retrying failures with exponential backoff.
+
+    # Return
+    'skipped' if its outputs already existed, 'empty' if there was no data, 'generated' otherwise
+    """
+
+    if (pipeline_kwargs or {}).get('layout') != 'dataset':
+        pqt_folder = os.path.join(pqt_folder, shard.hydrophone.value.name)
+    wav_folder = os.path.join(scratch_folder, f"worker-{os.getpid()}")
+    resolution = shard.resolution
+    pipeline = NoiseAnalysisPipeline(shard.hydrophone, resolution.delta_t, resolution.delta_f, bands=resolution.bands,
+                                     products=resolution.products, wav_folder=wav_folder, pqt_folder=pqt_folder,
+                                     no_auth=no_auth, mode='safe', **(pipeline_kwargs or {}))
+
+    if all([os.path.exists(os.path.join(pqt_folder, name))
+            for name in pipeline.product_filenames(shard.start, shard.end)]):
+        return 'skipped'
+
+    for attempt in range(retries + 1):
+        try:
+            files, = pipeline.generate_parquet_file_batch(shard.start, 1, shard.end - shard.start, resume=True,
+                                                          check_s3=not no_auth, upload_to_s3=upload_to_s3,
+                                                          streaming=True)
+            return 'empty' if files[0] is None else 'generated'
+        except Exception as e:
+            if attempt == retries:
+                raise
+            logging.warning("%s %s to %s failed (%s), retrying in %ss", shard.hydrophone.name, shard.start, shard.end,
+                            e, backoff * 2 ** attempt)
+            time.sleep(backoff * 2 ** attempt)
+        finally:
+            # The wav files are only scratch, don't let them pile up across shards
+            shutil.rmtree(wav_folder, ignore_errors=True)
@@ -0,0 +1,146 @@
+# Native imports
+import hashlib
+import os
+import tempfile
+import threading
+
+
+class SegmentCache:
+    """
+    Persistent on-disk cache of downloaded HLS segments, shared by pipelines and processes pointing at the same folder.
+
+    Segments are immutable once archived, so they're stored under the hash of their key (hydrophone folder, stream
+    timestamp and segment name) and never revalidated. Writes go to a temporary file that is renamed into place, so
+    concurrent workers only ever see whole segments. When the folder grows past max_bytes the least recently used
+    segments, by file modification time which every hit refreshes, are evicted down to EVICT_TO of the budget.
+    """
+
+    # Fraction of max_bytes to evict down to, so eviction scans stay rare
+    EVICT_TO = 0.9
+
+    def __init__(self, cache_dir=None, max_bytes=10 * 2**30):
+        """
+        * cache_dir: Str, default None. Folder of the cache. Defaults to ~/.cache/orcasound_noise/segments.
+        * max_bytes: Int, default 10 GiB. Disk budget of the cache.
+        """
+
+        self.cache_dir = cache_dir or os.path.join(os.path.expanduser('~'), '.cache', 'orcasound_noise', 'segments')
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # Estimate of the folder size, corrected by every eviction scan. Other processes add to it unseen, so it only
+        # decides when to scan
+        self._size = sum([size for _, size, _ in self._entries()])
+
+    @staticmethod
+    def key_from_url(url):
+        """
+        Cache key of a segment url, ".../<hydrophone folder>/hls/<stream timestamp>/<segment name>".
+        """
+
+        parts = url.rstrip('/').split('/')
+        return '/'.join(parts[-4:-3] + parts[-2:])
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest)
+
+    def get(self, key):
+        """
+        Bytes cached for key, or None on a miss.
+        """
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another process since it was read
+            pass
+
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """
+        Store data for key, evicting old segments if the cache is over budget.
+        """
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            self._size += len(data)
+            over_budget = self._size > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used segments until the cache is within EVICT_TO of its budget.
+        """
+
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        size = sum([entry_size for _, entry_size, _ in entries])
+        target = self.max_bytes * self.EVICT_TO
+        evicted = 0
+        for path, entry_size, _ in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Already evicted by another process
+                pass
+            size -= entry_size
+            evicted += 1
+
+        with self._lock:
+            self._size = size
+            self.evictions += evicted
+
+    def _entries(self):
+        """
+        (path, size, mtime) of every cached segment.
+        """
+
+        entries = []
+        for folder in os.scandir(self.cache_dir):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+
+        return entries
+
+    def stats(self):
+        """
+        Dict of hit, miss and eviction counts of this instance and the estimated cache size in bytes.
+        """
+
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'bytes': self._size}
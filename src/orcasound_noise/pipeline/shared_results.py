@@ -0,0 +1,74 @@
+# Native imports
+import os
+from collections import namedtuple
+from multiprocessing import resource_tracker, shared_memory
+
+# Third part imports
+import numpy as np
+import pandas as pd
+
+# A dataframe whose values live in a shared memory block: only this small descriptor crosses between processes
+SharedFrame = namedtuple("SharedFrame", "name shape dtype index columns")
+
+
+def to_shared(frame):
+    """
+    Copy a dataframe's values into a new shared memory block for another process to pick up with from_shared.
+
+    Falls back to returning the dataframe itself when no shared memory block can be created, e.g. when /dev/shm is
+    too small, so results are then simply pickled.
+
+    * frame: DataFrame with a single dtype.
+
+    # Return
+    SharedFrame, or frame
+    """
+
+    values = frame.to_numpy()
+    if not _shm_fits(values.nbytes):
+        return frame
+    try:
+        block = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+    except OSError:
+        return frame
+
+    np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+    block.close()
+    # The receiving process owns the block from here on and unlinks it. Without this the worker's resource tracker
+    # would unlink it again when the worker exits
+    resource_tracker.unregister(block._name, 'shared_memory')
+
+    return SharedFrame(block.name, values.shape, values.dtype.str, frame.index, frame.columns)
+
+
+def _shm_fits(nbytes):
+    """
+    Whether /dev/shm has room for nbytes. Linux only allocates shared memory when it's written to, and running out of
+    it then kills the process with SIGBUS instead of raising, so it has to be checked up front.
+    """
+
+    try:
+        stat = os.statvfs('/dev/shm')
+    except (OSError, AttributeError):
+        # No /dev/shm to check, e.g. macOS or Windows
+        return True
+
+    return nbytes < stat.f_bavail * stat.f_frsize
+
+
+def from_shared(shared):
+    """
+    Rebuild the dataframe of a SharedFrame and free its shared memory block. Dataframes are passed through unchanged.
+    """
+
+    if isinstance(shared, pd.DataFrame):
+        return shared
+
+    block = shared_memory.SharedMemory(name=shared.name)
+    try:
+        values = np.ndarray(shared.shape, dtype=np.dtype(shared.dtype), buffer=block.buf).copy()
+    finally:
+        block.close()
+        block.unlink()
+
+    return pd.DataFrame(values, index=shared.index, columns=shared.columns)
@@ -0,0 +1,245 @@
+import calendar
+import datetime as dt
+import sqlite3
+import time
+from collections import namedtuple
+from contextlib import closing
+
+from .file_connector import S3FileConnector
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    bucket TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    key TEXT NOT NULL,
+    start_time INTEGER NOT NULL,
+    end_time INTEGER NOT NULL,
+    secs_per_sample INTEGER NOT NULL,
+    freq_value INTEGER NOT NULL,
+    freq_type TEXT NOT NULL,
+    size INTEGER,
+    etag TEXT,
+    PRIMARY KEY (bucket, key)
+);
+CREATE INDEX IF NOT EXISTS objects_series ON objects (bucket, prefix, secs_per_sample, freq_type, freq_value, start_time);
+CREATE TABLE IF NOT EXISTS listings (
+    bucket TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    last_key TEXT,
+    refreshed REAL,
+    PRIMARY KEY (bucket, prefix)
+);
+"""
+
+# One file of the archive. start and end are naive UTC datetimes
+CatalogRecord = namedtuple("CatalogRecord", "key start end secs_per_sample freq_value freq_type size etag")
+
+
+def _series(hz_bands=None, is_broadband=False):
+    """
+    (freq_type, freq_value) of a product as stored in the catalog.
+    """
+
+    if is_broadband:
+        return "broadband", 0
+    if hz_bands.endswith("hz"):
+        return "delta_hz", int(hz_bands[:-len("hz")])
+    return "octave_bands", int(hz_bands[:-len("oct")])
+
+
+def _to_seconds(time_: dt.datetime):
+    return calendar.timegm(time_.timetuple())
+
+
+def _from_seconds(seconds):
+    return dt.datetime(1970, 1, 1) + dt.timedelta(seconds=seconds)
+
+
+class ArchiveCatalog:
+    """
+    Local SQLite index of the parquet files of an S3 archive, so finding files doesn't list the whole archive.
+
+    Each file under the prefix is recorded once with its key, time range, secs per sample, frequency value and type,
+    as parsed from its name, size and ETag. refresh only lists the keys after the last one seen, with StartAfter, so it
+    costs one request when nothing changed however large the archive is. Keys start with the file's start date, so new
+    files sort last unless they backfill earlier dates, or replace or delete files: refresh(full=True) relists
+    everything to pick those up, as do new flat files in a prefix that also holds a dataset layout, whose keys sort
+    after them. Files are found with interval overlap queries on an index by series and start time.
+
+    Times are stored as seconds since the epoch of the naive UTC datetimes of the file names. One catalog file can hold
+    any number of buckets and prefixes.
+    """
+
+    def __init__(self, path, client, bucket, prefix, refresh_interval=60):
+        """
+        * path: Str, path of the SQLite file, created if needed. ":memory:" is not supported, as every call opens its
+          own connection.
+        * client: boto3 S3 client to list the archive with.
+        * bucket: Str, bucket of the archive.
+        * prefix: Str, folder of the archive in the bucket, e.g. a hydrophone's save folder.
+        * refresh_interval: Float, default 60. Seconds an incremental refresh is trusted for: files and options only
+          list the archive again after that long.
+        """
+
+        self.path = path
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.rstrip("/") + "/"
+        self.refresh_interval = refresh_interval
+        with closing(self._connect()) as connection, connection:
+            connection.executescript(_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def refresh(self, full=False):
+        """
+        Add the files uploaded since the last refresh, or with full, relist the archive from scratch.
+
+        # Return
+        Int, the number of files added
+        """
+
+        with closing(self._connect()) as connection:
+            row = connection.execute("SELECT last_key FROM listings WHERE bucket = ? AND prefix = ?",
+                                     (self.bucket, self.prefix)).fetchone()
+            last_key = None if full or row is None else row[0]
+
+            kwargs = {"Bucket": self.bucket, "Prefix": self.prefix}
+            if last_key:
+                kwargs["StartAfter"] = last_key
+
+            records = []
+            for page in self.client.get_paginator("list_objects_v2").paginate(**kwargs):
+                for item in page.get("Contents", []):
+                    last_key = item["Key"]
+                    try:
+                        start, end, secs, freq_value, freq_type = S3FileConnector.parse_filename(
+                            item["Key"].split("/")[-1])
+                    except (ValueError, IndexError):
+                        # Not a product file, e.g. the ancient ambient levels
+                        continue
+                    records.append((self.bucket, self.prefix, item["Key"], _to_seconds(start), _to_seconds(end), secs,
+                                    freq_value, freq_type, item.get("Size"), item.get("ETag", "").strip('"')))
+
+            # Swapped in one transaction, so readers see either the old or the new listing
+            with connection:
+                if full:
+                    connection.execute("DELETE FROM objects WHERE bucket = ? AND prefix = ?",
+                                       (self.bucket, self.prefix))
+                connection.executemany("INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                       records)
+                connection.execute("INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?)",
+                                   (self.bucket, self.prefix, last_key, time.time()))
+
+        return len(records)
+
+    def _refresh_if_stale(self):
+        with closing(self._connect()) as connection:
+            row = connection.execute("SELECT refreshed FROM listings WHERE bucket = ? AND prefix = ?",
+                                     (self.bucket, self.prefix)).fetchone()
+        if row is None or time.time() - row[0] >= self.refresh_interval:
+            self.refresh()
+
+    def files(self, start: dt.datetime, end: dt.datetime, secs_per_sample: int, hz_bands=None, is_broadband=False):
+        """
+        Keys of the files overlapping [start, end] at the given resolution, oldest first, like
+        S3FileConnector.get_files.
+
+        * hz_bands: Str, the bands in '50hz' or '3oct' format. Ignored for broadband.
+        """
+
+        freq_type, freq_value = _series(hz_bands, is_broadband)
+        self._refresh_if_stale()
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT key FROM objects WHERE bucket = ? AND prefix = ? AND secs_per_sample = ? AND freq_type = ? "
+                "AND freq_value = ? AND start_time <= ? AND end_time >= ? ORDER BY start_time, key",
+                (self.bucket, self.prefix, secs_per_sample, freq_type, freq_value, _to_seconds(end),
+                 _to_seconds(start))).fetchall()
+
+        return [row[0] for row in rows]
+
+    def records(self, secs_per_sample=None, hz_bands=None, is_broadband=False):
+        """
+        CatalogRecord of every file of the archive, or of one series if secs_per_sample is given, oldest first.
+        """
+
+        query = ("SELECT key, start_time, end_time, secs_per_sample, freq_value, freq_type, size, etag FROM objects "
+                 "WHERE bucket = ? AND prefix = ?")
+        params = [self.bucket, self.prefix]
+        if secs_per_sample is not None:
+            query += " AND secs_per_sample = ? AND freq_type = ? AND freq_value = ?"
+            params += [secs_per_sample, *_series(hz_bands, is_broadband)]
+
+        self._refresh_if_stale()
+        with closing(self._connect()) as connection:
+            rows = connection.execute(query + " ORDER BY start_time, key", params).fetchall()
+
+        return [CatalogRecord(key, _from_seconds(start), _from_seconds(end), *rest) for key, start, end, *rest in rows]
+
+    def series(self):
+        """
+        Every series of the archive, as (secs_per_sample, hz_bands, is_broadband) tuples, the arguments of files.
+        """
+
+        self._refresh_if_stale()
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT DISTINCT secs_per_sample, freq_value, freq_type FROM objects WHERE bucket = ? AND prefix = ? "
+                "ORDER BY secs_per_sample, freq_type, freq_value", (self.bucket, self.prefix)).fetchall()
+
+        series = []
+        for secs, freq_value, freq_type in rows:
+            if freq_type == "broadband":
+                series.append((secs, None, True))
+            elif freq_type == "delta_hz":
+                series.append((secs, S3FileConnector.frequency_label(delta_hz=freq_value), False))
+            else:
+                series.append((secs, S3FileConnector.frequency_label(octave_bands=freq_value), False))
+
+        return series
+
+    def record(self, key):
+        """
+        CatalogRecord of a file just uploaded to the archive, to add with swap.
+        """
+
+        head = self.client.head_object(Bucket=self.bucket, Key=key)
+        start, end, secs, freq_value, freq_type = S3FileConnector.parse_filename(key.split("/")[-1])
+        return CatalogRecord(key, start, end, secs, freq_value, freq_type, head["ContentLength"],
+                             head["ETag"].strip('"'))
+
+    def swap(self, removed_keys, added):
+        """
+        Replace files in the catalog in one transaction, so readers see either the old files or the new ones.
+
+        * removed_keys: List of str, keys of the files to remove.
+        * added: List of CatalogRecord, the files to add.
+        """
+
+        with closing(self._connect()) as connection, connection:
+            connection.executemany("DELETE FROM objects WHERE bucket = ? AND key = ?",
+                                   [(self.bucket, key) for key in removed_keys])
+            connection.executemany("INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   [(self.bucket, self.prefix, record.key, _to_seconds(record.start),
+                                     _to_seconds(record.end), *record[3:]) for record in added])
+
+    def options(self):
+        """
+        The resolutions in the archive, like NoiseAccessor.get_options.
+
+        # Return
+        Tuple of lists. Delta_t values, Delta_f values, frequency types.
+        """
+
+        self._refresh_if_stale()
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT DISTINCT secs_per_sample, freq_value, freq_type FROM objects WHERE bucket = ? AND prefix = ?",
+                (self.bucket, self.prefix)).fetchall()
+
+        delta_ts = {secs for secs, _, _ in rows}
+        delta_fs = {freq_value for _, freq_value, _ in rows if freq_value != 0}
+        freq_types = {freq_type for _, _, freq_type in rows}
+        return list(delta_ts), list(delta_fs), list(freq_types)
@@ -0,0 +1,107 @@
+import datetime as dt
+import posixpath
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+
+from .encoding import LEVELS_COLUMN, decode_table
+from .file_connector import S3FileConnector
+
+# Name of the sorted timestamp column of dataset files, stored as their index
+TIMESTAMP_COLUMN = "timestamp"
+
+# Row groups are kept small so their timestamp statistics let readers skip most of a file
+DATASET_ROW_GROUP_BYTES = 4 * 2**20
+
+# The partition keys, in path order, of the hive style dataset layout
+PARTITION_KEYS = ("hydrophone", "product", "resolution", "date")
+
+
+def dataset_filename(hydrophone_name, start: dt.datetime, end: dt.datetime, secs_per_sample: int, delta_hz: int = None,
+                     octave_bands: int = None, is_broadband: bool = False):
+    """
+    Path of a parquet file in the dataset layout, relative to the dataset root.
+
+    Files go in hive style partitions hydrophone=<name>/product=<frequency label>/resolution=<delta_t>s/date=<start
+    date>, under their usual file name. A file is partitioned by the date it starts on, so a file longer than a day
+    holds later dates too: readers prune by date only up to the end of their range and rely on the timestamp
+    statistics of the row groups for the rest.
+
+    # Return
+    Str, posix style relative path
+    """
+
+    return posixpath.join(product_directory(hydrophone_name, secs_per_sample, delta_hz, octave_bands, is_broadband),
+                          f"date={start.strftime('%Y-%m-%d')}",
+                          S3FileConnector.create_filename(start, end, secs_per_sample, delta_hz=delta_hz,
+                                                          octave_bands=octave_bands, is_broadband=is_broadband))
+
+
+def product_directory(hydrophone_name, secs_per_sample: int, delta_hz: int = None, octave_bands: int = None,
+                      is_broadband: bool = False):
+    """
+    Relative path of the partition holding every date of one product of one hydrophone.
+    """
+
+    label = S3FileConnector.frequency_label(delta_hz, octave_bands, is_broadband)
+    return posixpath.join(f"hydrophone={hydrophone_name}", f"product={label}", f"resolution={secs_per_sample}s")
+
+
+def to_dataset_frame(frame):
+    """
+    Dataframe as stored in the dataset: string column names and the timestamps as a sorted index named timestamp.
+    """
+
+    frame = frame.rename_axis(TIMESTAMP_COLUMN)
+    frame.columns = frame.columns.astype(str)
+    if not frame.index.is_monotonic_increasing:
+        frame = frame.sort_index()
+    return frame
+
+
+def read_dataset(root, hydrophone_name, start: dt.datetime, end: dt.datetime, secs_per_sample: int, freq_label: str,
+                 columns=None, filesystem=None):
+    """
+    Read the rows of [start, end] of one product from a dataset, reading only the row groups and columns needed.
+
+    * root: Str, dataset root, a local folder or an s3:// uri.
+    * freq_label: Str, '50hz', '3oct' or 'broadband', as in file names.
+    * columns: List of str, default None. Frequency columns to read. Defaults to all of them.
+    * filesystem: pyarrow FileSystem, default None. Defaults to the local one, or anonymous S3 for s3:// uris.
+
+    # Return
+    Dataframe indexed by timestamp, empty if there is no data.
+    """
+
+    if filesystem is None and root.startswith("s3://"):
+        filesystem = pafs.S3FileSystem(anonymous=True, region="us-west-2")
+    if root.startswith("s3://"):
+        root = root[len("s3://"):]
+
+    path = posixpath.join(root, f"hydrophone={hydrophone_name}", f"product={freq_label}",
+                          f"resolution={secs_per_sample}s")
+    try:
+        dataset = ds.dataset(path, filesystem=filesystem, format="parquet",
+                             partitioning=ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive"))
+    except FileNotFoundError:
+        return pd.DataFrame(index=pd.DatetimeIndex([], name=TIMESTAMP_COLUMN))
+
+    # Files start on their date partition, so later dates can't hold the range. Earlier ones are pruned by the
+    # timestamp statistics of their row groups
+    condition = ((ds.field("date") <= end.strftime("%Y-%m-%d"))
+                 & (ds.field(TIMESTAMP_COLUMN) >= pd.Timestamp(start))
+                 & (ds.field(TIMESTAMP_COLUMN) <= pd.Timestamp(end)))
+    # Frequencies of the centi_db_list encoding are all in one column, selected once decoded
+    frequencies = None if columns is None else [str(column) for column in columns]
+    if frequencies is not None and LEVELS_COLUMN not in dataset.schema.names:
+        columns = frequencies + [TIMESTAMP_COLUMN]
+    else:
+        columns = [name for name in dataset.schema.names if name != "date"]
+
+    frame = decode_table(dataset.to_table(columns=columns, filter=condition).replace_schema_metadata(
+        dataset.schema.metadata), columns=frequencies)
+    if TIMESTAMP_COLUMN in frame.columns:
+        frame = frame.set_index(TIMESTAMP_COLUMN)
+    return frame.sort_index()
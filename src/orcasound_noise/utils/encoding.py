@@ -0,0 +1,148 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .rollup import ROLLUP_COUNT_COLUMN
+
+# Storage encodings of the level columns of parquet files. "float" is DataFrame.to_parquet's: a float column per
+# frequency. "centi_db" stores a column per frequency of int16 hundredths of a dB, so levels are kept to within 0.005 dB,
+# the precision the pipeline already rounds each frame's levels to. "centi_db_list" stores the same int16 values of
+# each row in one fixed size list column, with the frequencies only in the file's metadata.
+ENCODINGS = ("float", "centi_db", "centi_db_list")
+
+# Parquet compression of each encoding. Integer levels compress much better with zstd than with snappy
+ENCODING_COMPRESSION = {"float": "snappy", "centi_db": "zstd", "centi_db_list": "zstd"}
+
+# Levels are stored as round(level * CENTI_DB_SCALE) in int16, so within about +-327 dB
+CENTI_DB_SCALE = 100
+
+# Name of the column of the centi_db_list encoding
+LEVELS_COLUMN = "levels"
+
+# Key-value metadata of encoded files
+ENCODING_KEY = b"orcasound_noise.encoding"
+SCALE_KEY = b"orcasound_noise.scale"
+COLUMNS_KEY = b"orcasound_noise.columns"
+INDEX_KEY = b"orcasound_noise.index"
+
+# Name of the index column of encoded files whose index has no name
+DEFAULT_INDEX_COLUMN = "timestamp"
+
+
+def check_encoding(encoding):
+    if encoding not in ENCODINGS:
+        raise ValueError(f"encoding must be one of {', '.join(ENCODINGS)}")
+
+
+def encode_frame(frame, encoding="float", schema=None):
+    """
+    Arrow table of a dataframe of levels in the given storage encoding.
+
+    Encoded tables hold the index as a column, named like the index or timestamp, and record the encoding, scale,
+    column names and index name in their metadata, which decode_table reads back. The count column of rollups is
+    stored as integers.
+
+    * frame: Dataframe of levels in dB, indexed by time, with string column names.
+    * encoding: Str, default "float". One of ENCODINGS.
+    * schema: pyarrow Schema, default None. Schema to cast to, e.g. the one of the previous tables of a file.
+
+    # Return
+    pyarrow Table
+    """
+
+    check_encoding(encoding)
+    if encoding == "float":
+        return pa.Table.from_pandas(frame, schema=schema, preserve_index=True)
+
+    counts = None
+    if ROLLUP_COUNT_COLUMN in frame.columns:
+        counts = frame[ROLLUP_COUNT_COLUMN].to_numpy(dtype="int64")
+        frame = frame.drop(columns=ROLLUP_COUNT_COLUMN)
+
+    index_column = frame.index.name or DEFAULT_INDEX_COLUMN
+    levels = np.asarray(frame.to_numpy(dtype="float64")) * CENTI_DB_SCALE
+    missing = ~np.isfinite(levels)
+    levels = np.round(np.where(missing, 0, levels))
+    if np.abs(levels).max(initial=0) > np.iinfo(np.int16).max:
+        raise ValueError(f"levels outside of the +-{np.iinfo(np.int16).max / CENTI_DB_SCALE} dB of {encoding}")
+    levels = levels.astype(np.int16)
+
+    arrays = {index_column: pa.array(frame.index)}
+    if encoding == "centi_db":
+        for i, column in enumerate(frame.columns):
+            arrays[str(column)] = pa.array(levels[:, i], mask=missing[:, i])
+    else:
+        values = pa.array(levels.ravel(), mask=missing.ravel())
+        arrays[LEVELS_COLUMN] = pa.FixedSizeListArray.from_arrays(values, len(frame.columns))
+    if counts is not None:
+        arrays[ROLLUP_COUNT_COLUMN] = pa.array(counts)
+
+    metadata = {
+        ENCODING_KEY: encoding.encode(),
+        SCALE_KEY: str(CENTI_DB_SCALE).encode(),
+        COLUMNS_KEY: json.dumps([str(column) for column in frame.columns]).encode(),
+        INDEX_KEY: json.dumps(frame.index.name).encode(),
+    }
+    table = pa.table(arrays).replace_schema_metadata(metadata)
+    return table if schema is None else table.cast(schema)
+
+
+def decode_table(table, columns=None):
+    """
+    Dataframe of a table read from a parquet file of any encoding, the same as DataFrame.to_parquet would have written.
+
+    Encoded tables come back as float64 levels indexed by time. Tables read without their pandas metadata, e.g. with
+    their index as a column, come back as they are apart from the levels.
+
+    * table: pyarrow Table, with its schema metadata.
+    * columns: List of str, default None. Columns to keep. Defaults to all of them.
+
+    # Return
+    Dataframe
+    """
+
+    metadata = table.schema.metadata or {}
+    encoding = metadata.get(ENCODING_KEY, b"float").decode()
+    if encoding == "float":
+        frame = table.to_pandas()
+        return frame if columns is None else frame[columns]
+
+    scale = float(metadata[SCALE_KEY])
+    index_name = json.loads(metadata[INDEX_KEY])
+    index_column = index_name or DEFAULT_INDEX_COLUMN
+
+    if encoding == "centi_db":
+        level_columns = [name for name in table.column_names if name not in (index_column, ROLLUP_COUNT_COLUMN)]
+        levels = np.column_stack([table.column(name).to_numpy(zero_copy_only=False).astype("float64")
+                                  for name in level_columns]) if level_columns else np.zeros((len(table), 0))
+    else:
+        level_columns = json.loads(metadata[COLUMNS_KEY])
+        values = table.column(LEVELS_COLUMN).combine_chunks().flatten()
+        levels = values.to_numpy(zero_copy_only=False).astype("float64").reshape(len(table), len(level_columns))
+
+    index = pd.Index(table.column(index_column).to_pandas())
+    index.name = index_name
+    frame = pd.DataFrame(levels / scale, index=index, columns=level_columns)
+    if ROLLUP_COUNT_COLUMN in table.column_names:
+        frame[ROLLUP_COUNT_COLUMN] = table.column(ROLLUP_COUNT_COLUMN).to_numpy()
+    return frame if columns is None else frame[columns]
+
+
+def read_parquet(path, columns=None):
+    """
+    Read a parquet file, or folder of them, of any encoding as a dataframe, like pd.read_parquet for "float" files.
+
+    * columns: List of str, default None. Frequency columns to read. Defaults to all of them. Only these are read from
+      centi_db files.
+    """
+
+    read_columns = None
+    if columns is not None and not os.path.isdir(path):
+        metadata = pq.read_schema(path).metadata or {}
+        if metadata.get(ENCODING_KEY) == b"centi_db":
+            read_columns = list(columns) + [json.loads(metadata[INDEX_KEY]) or DEFAULT_INDEX_COLUMN]
+    return decode_table(pq.read_table(path, columns=read_columns), columns=columns)
@@ -13,9 +13,13 @@ class S3FileConnector:
 
     DT_FORMAT = "%Y%m%dT%H%M%S"
 
-    def __init__(self, hydrophone: Hydrophone, no_sign=False):
+    def __init__(self, hydrophone: Hydrophone, no_sign=False, catalog=None):
         """
         S3File Connector maintains a connection to an AWS s3 bucket.
+
+        * catalog: Str, default None. Path of a local SQLite ArchiveCatalog, see catalog.py, shared by any number of
+          hydrophones. get_files then queries it, listing only the files added since it was last refreshed, instead
+          of listing the whole save folder on every call.
         """
         self.bucket = hydrophone.value.bucket
         self.ref_folder = hydrophone.value.ref_folder
@@ -32,20 +36,40 @@ class S3FileConnector:
             self.source_resource = boto3.resource('s3').Bucket(self.bucket)
             self.archive_resource = boto3.resource('s3').Bucket(self.save_bucket)
 
+        self.catalog = None
+        if catalog is not None:
+            from .catalog import ArchiveCatalog
+            self.catalog = ArchiveCatalog(catalog, self.client, self.save_bucket, self.save_folder)
 
-    @classmethod
-    def create_filename(cls, start: dt.datetime, end: dt.datetime, secs_per_sample: int, delta_hz: int = None, octave_bands: int = None, is_broadband: bool =False):
-        """ Create a filename with the given daterange and granularity. Dates must be in UTC """
+
+    @staticmethod
+    def frequency_label(delta_hz: int = None, octave_bands: int = None, is_broadband: bool = False):
+        """ Frequency part of file names: 'broadband', '<octave_bands>oct' or '<delta_hz>hz' """
 
         if is_broadband:
-            freq_str = "broadband"
+            return "broadband"
         elif octave_bands is not None:
-            freq_str = str(octave_bands) + "oct"
+            return str(octave_bands) + "oct"
         elif delta_hz is not None:
-            freq_str = str(delta_hz) + "hz"
+            return str(delta_hz) + "hz"
         else:
             raise ValueError("One of delta_hz or octave_bands must be provided.")
-        
+
+    @staticmethod
+    def frequency_kwargs(hz_bands: str = None, is_broadband: bool = False):
+        """ Frequency keyword args of create_filename for hz_bands in '50hz' or '3oct' format, as used by get_files """
+
+        if is_broadband:
+            return {"is_broadband": True}
+        if hz_bands.endswith("hz"):
+            return {"delta_hz": int(hz_bands[:-len("hz")])}
+        return {"octave_bands": int(hz_bands[:-len("oct")])}
+
+    @classmethod
+    def create_filename(cls, start: dt.datetime, end: dt.datetime, secs_per_sample: int, delta_hz: int = None, octave_bands: int = None, is_broadband: bool =False):
+        """ Create a filename with the given daterange and granularity. Dates must be in UTC """
+
+        freq_str = cls.frequency_label(delta_hz, octave_bands, is_broadband)
 
         start_str = start.strftime(cls.DT_FORMAT)
         end_str = end.strftime(cls.DT_FORMAT)
@@ -80,20 +104,21 @@ class S3FileConnector:
 
         return args
 
-    def upload_file(self, file, start: dt.datetime, end: dt.datetime, secs_per_sample: int, delta_hz: int = None, octave_bands: int = None, is_broadband: bool =False):
+    def upload_file(self, file, start: dt.datetime, end: dt.datetime, secs_per_sample: int, delta_hz: int = None, octave_bands: int = None, is_broadband: bool =False, file_name: str = None):
         """
         Upload a parquet file to the S3 archive
 
         * file: File object to upload. Must be in bytemode
         * Hydrophone: Name of the hydrophone to uplaod to
         * as_of_date: The day the file represents
+        * file_name: Key of the file under the save folder, e.g. a dataset partition path. Defaults to create_filename
 
         # Return
         True if successfull upload, False otherwise
         """
 
-        
-        file_name = self.create_filename(start, end, secs_per_sample, delta_hz=delta_hz, octave_bands=octave_bands, is_broadband=is_broadband)
+        if file_name is None:
+            file_name = self.create_filename(start, end, secs_per_sample, delta_hz=delta_hz, octave_bands=octave_bands, is_broadband=is_broadband)
 
         # If file path, open as object
         if isinstance(file, str):
@@ -127,6 +152,9 @@ class S3FileConnector:
 
         """
 
+        if self.catalog is not None:
+            return self.catalog.files(start, end, secs_per_sample, hz_bands=hz_bands, is_broadband=is_broadband)
+
         # Setup
         all_files = []
 
@@ -13,3 +13,7 @@ class Hydrophone(Enum):
     PORT_TOWNSEND = HPhoneTup("port_townsend", "audio-orcasound-net", "rpi_port_townsend", "acoustic-sandbox", "ambient-sound-analysis/port_townsend", 71.6406580028601)
     SUNSET_BAY = HPhoneTup("sunset_bay", "audio-orcasound-net", "rpi_sunset_bay", "acoustic-sandbox", "ambient-sound-analysis/sunset_bay", 71.6406580028601)
     SANDBOX = HPhoneTup("sandbox", "acoustic-sandbox", "ambient-sound-analysis", "acoustic-sandbox", "ambient-sound-analysis", 71.6406580028601)
+
+    def __reduce_ex__(self, protocol):
+        # Pickle by name, the values can't be pickled because their namedtuple shares this class's name
+        return getattr, (self.__class__, self.name)
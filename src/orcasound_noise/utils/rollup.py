@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+# Seconds per row of the rollup levels built from the base products: 1 minute, 10 minutes, 1 hour and 1 day
+ROLLUP_LEVELS = (60, 600, 3600, 86400)
+
+# Column of rollup files holding the number of base rows averaged into each row
+ROLLUP_COUNT_COLUMN = "count"
+
+# Smallest amplitude converted to decibels, librosa.amplitude_to_db's amin
+_AMIN = 1e-5
+
+
+def rollup_levels(frame, delta_t, counts=None):
+    """
+    Average levels in decibels into bins of delta_t seconds, counted from midnight.
+
+    Levels are averaged as amplitudes, 10 ** (dB / 20), the domain the pipeline averages frames into bins in, so
+    rolling up a product gives the levels of the same product generated at delta_t, up to edge bins. Each row is
+    weighted by its count, the number of base rows it averages, so rollups of rollups stay exact. Missing levels are
+    left out of their bin's average.
+
+    * frame: Dataframe of levels in dB indexed by time, without a count column.
+    * delta_t: Int, seconds per bin. Must divide a day.
+    * counts: Array of row counts, default None. Defaults to one per row, for base products.
+
+    # Return
+    Tuple of (dataframe of levels, array of counts), one row per bin
+    """
+
+    if 86400 % delta_t != 0:
+        raise ValueError("delta_t must divide a day")
+
+    counts = np.ones(len(frame), dtype="int64") if counts is None else np.asarray(counts, dtype="int64")
+    levels = frame.to_numpy(dtype="float64")
+    weights = np.where(np.isfinite(levels), counts[:, np.newaxis], 0)
+    amplitudes = np.where(weights > 0, np.power(10.0, np.nan_to_num(levels) / 20), 0) * weights
+
+    # Bins of divisors of a day counted from the epoch start every midnight too
+    bins = frame.index.floor(pd.Timedelta(seconds=delta_t))
+    sums = pd.DataFrame(amplitudes, index=bins).groupby(level=0).sum()
+    totals = pd.DataFrame(weights, index=bins).groupby(level=0).sum()
+    row_counts = pd.Series(counts, index=bins).groupby(level=0).sum()
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = sums.to_numpy() / totals.to_numpy()
+        rolled = np.where(totals.to_numpy() > 0, 20 * np.log10(np.maximum(means, _AMIN)), np.nan)
+
+    index = sums.index.rename(frame.index.name)
+    return pd.DataFrame(rolled, index=index, columns=frame.columns), row_counts.to_numpy().astype("int64")
+
+
+def split_counts(frame):
+    """
+    Levels and counts of a dataframe read from a rollup file, or of a base file with one count per row.
+
+    # Return
+    Tuple of (dataframe of levels, array of counts)
+    """
+
+    if ROLLUP_COUNT_COLUMN not in frame.columns:
+        return frame, np.ones(len(frame), dtype="int64")
+    return frame.drop(columns=ROLLUP_COUNT_COLUMN), frame[ROLLUP_COUNT_COLUMN].to_numpy(dtype="int64")
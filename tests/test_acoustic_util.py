@@ -0,0 +1,214 @@
+import datetime as dt
+import os
+
+import librosa
+import numpy as np
+import pandas as pd
+import soundfile as sf
+
+from orcasound_noise.pipeline import acoustic_util
+
+WAV_FILE = os.path.join(os.path.dirname(__file__), "..", "test_files", "live000.wav")
+WAV_TO_ARRAY_FILE = os.path.join(os.path.dirname(__file__), "..", "test_files", "live000_wav_to_array.npz")
+CHIRP_FILE = os.path.join(os.path.dirname(__file__), "..", "test_files", "logchirp20_20000_24bit.wav")
+
+
+def test_spec_to_bands_matches_band_power():
+    sr, n_fft = 48000, 4800
+    freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+    psd = np.random.default_rng(0).random((20, len(freqs)))
+    delta_f = sr / n_fft
+
+    levels, fm = acoustic_util.spec_to_bands(psd, 3, delta_f, freqs=freqs, ref=1)
+
+    _, gains = acoustic_util.octave_band(3, freqs)
+    expected = np.array([[acoustic_util.band_power(row, g, delta_f) for g in gains] for row in psd])
+    expected = librosa.amplitude_to_db(expected, ref=1)
+
+    assert levels.shape == (20, len(fm))
+    np.testing.assert_allclose(levels, expected, atol=1e-6)
+
+
+def test_filter_bank_is_cached_and_sparse():
+    bank = acoustic_util.filter_bank(3, 48000, 48000)
+
+    assert acoustic_util.filter_bank(3, 48000, 48000) is bank
+    assert bank.weights.shape == (24001, len(acoustic_util.ISO_R10))
+    assert bank.weights.nnz < bank.weights.shape[0] * bank.weights.shape[1]
+
+    acoustic_util._FILTER_BANKS.clear()
+    acoustic_util.load_filter_banks({(3, 48000, 48000): bank})
+    assert acoustic_util.filter_bank(3, 48000, 48000) is bank
+
+
+def test_sparse_filter_bank_matches_dense(monkeypatch):
+    y, sr = librosa.load(CHIRP_FILE, sr=None)
+    n_fft = sr // 3
+    freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+    psd = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=n_fft // 2)).T
+
+    acoustic_util._FILTER_BANKS.clear()
+    sparse, _ = acoustic_util.spec_to_bands(psd, 24, 3, freqs, ref=1, sr=sr)
+    monkeypatch.setattr(acoustic_util, "FILTER_BANK_TOL", 0)
+    acoustic_util._FILTER_BANKS.clear()
+    dense, _ = acoustic_util.spec_to_bands(psd, 24, 3, freqs, ref=1, sr=sr)
+    acoustic_util._FILTER_BANKS.clear()
+
+    assert np.nanmax(np.abs(sparse - dense)) < 1e-4
+
+
+def test_wav_to_products_matches_wav_to_array():
+    t0 = dt.datetime(2023, 1, 1, 12, 0, 3)
+    products = [acoustic_util.Product(1), acoustic_util.Product(2, bands=3),
+                acoustic_util.Product(1, is_broadband=True), acoustic_util.Product(2, is_broadband=True)]
+
+    results = acoustic_util.wav_to_products(WAV_FILE, products, t0=t0, delta_f=10, transforms=[])
+
+    # Outputs of the original per-product wav_to_array, one STFT per call, for live000.wav at this t0:
+    # wav_to_array(delta_t=1, delta_f=10, transforms=[]) and wav_to_array(delta_t=2, delta_f=10, transforms=[], bands=3)
+    baseline = np.load(WAV_TO_ARRAY_FILE)
+    for product, name in zip(products, ["psd_1s", "bands_3oct_2s", "broadband_1s", "broadband_2s"]):
+        frame = results[product]
+        np.testing.assert_array_equal(frame.index.asi8, baseline[name + "_index"])
+        np.testing.assert_array_equal(frame.columns.astype(float), baseline[name + "_columns"])
+        np.testing.assert_allclose(frame.to_numpy(), baseline[name], rtol=0, atol=1e-9)
+
+
+def test_stream_wav_to_products_matches_one_shot():
+    t0 = dt.datetime(2023, 1, 1, 23, 59, 55)
+    products = [acoustic_util.Product(1), acoustic_util.Product(2, bands=3),
+                acoustic_util.Product(3, is_broadband=True)]
+
+    expected = acoustic_util.wav_to_products(WAV_FILE, products, t0=t0, delta_f=10, transforms=[])
+    streamed = acoustic_util.stream_wav_to_products(WAV_FILE, products, t0=t0, delta_f=10, frames_per_block=7)
+
+    for product in products:
+        pd.testing.assert_frame_equal(streamed[product], expected[product], rtol=1e-12)
+
+
+def test_array_resampler_bands_matches_pandas_resample():
+    index = pd.date_range("2023-01-01 23:59:58.3", periods=40, freq="250ms")
+    df = pd.DataFrame(np.random.default_rng(0).random((40, 3)) * 50, index=index)
+
+    resampled = acoustic_util.array_resampler_bands(df, delta_t=2)
+
+    expected = df.resample("2s").mean()
+    pd.testing.assert_index_equal(resampled.index, expected.index)
+    np.testing.assert_allclose(resampled.to_numpy(), librosa.amplitude_to_db(expected.to_numpy(), ref=1, top_db=200.0))
+
+
+def test_sub_second_products():
+    y, sr = librosa.load(WAV_FILE, sr=None)
+    t0 = dt.datetime(2023, 1, 1, 12, 0, 3)
+    products = [acoustic_util.Product(0.5), acoustic_util.Product(0.5, bands=3),
+                acoustic_util.Product(0.5, is_broadband=True), acoustic_util.Product(1)]
+
+    results = acoustic_util.array_to_products(y, sr, products, t0=t0, delta_f=10, transforms=[])
+
+    for product in products[:3]:
+        index = results[product].index
+        assert index[0] == t0 and (index[1:] - index[:-1] == pd.Timedelta(milliseconds=500)).all()
+        assert index[-1] == results[products[3]].index[-1]
+        assert np.isfinite(results[product].to_numpy()).all()
+
+
+def test_float32_products_match_float64():
+    t0 = dt.datetime(2023, 1, 1, 12, 0, 3)
+    products = [acoustic_util.Product(1), acoustic_util.Product(2, bands=12),
+                acoustic_util.Product(1, is_broadband=True)]
+
+    single = acoustic_util.wav_to_products(WAV_FILE, products, t0=t0, delta_f=1, transforms=[], dtype="float32")
+    double = acoustic_util.wav_to_products(WAV_FILE, products, t0=t0, delta_f=1, transforms=[])
+
+    for product in products:
+        assert (single[product].dtypes == np.float32).all()
+        pd.testing.assert_index_equal(single[product].index, double[product].index)
+        # At most one 0.01 dB rounding step apart
+        np.testing.assert_allclose(single[product].to_numpy(), double[product].to_numpy(), rtol=0, atol=0.011)
+
+
+def test_plan_stft_frames_matches_todays_stft():
+    t0 = dt.datetime(2023, 1, 1, 12, 0, 3)
+    products = [acoustic_util.Product(1), acoustic_util.Product(1, is_broadband=True)]
+    y, sr = librosa.load(WAV_FILE, sr=None)
+
+    plan = acoustic_util.plan_stft(sr, 10, products)
+    assert plan == acoustic_util.StftPlan(int(sr / 10), int(sr / 10) // 2, "hann", "frames")
+
+    # The same parameters the spectral stage has always used, reproduced by hand
+    magnitude = np.abs(librosa.stft(y, n_fft=int(sr / 10), hop_length=int(int(sr / 10) / 2)))
+    db = librosa.amplitude_to_db(magnitude, ref=1)
+    times = librosa.frames_to_time(np.arange(db.shape[1]), sr=sr, hop_length=plan.hop_length, n_fft=plan.n_fft)
+    index = pd.to_datetime(t0) + pd.to_timedelta(np.round(times, 6), unit="s")
+    expected = acoustic_util.array_resampler(pd.DataFrame(np.round(db.T, 2), index=index), delta_t=1)
+
+    results = acoustic_util.wav_to_products(WAV_FILE, products, t0=t0, delta_f=10, transforms=[])
+    # At most one 0.01 dB rounding step apart
+    np.testing.assert_allclose(results[products[0]].to_numpy(), expected.to_numpy(), rtol=0, atol=0.011)
+
+
+def test_plan_stft_strategies():
+    bands = [acoustic_util.Product(60, bands=3), acoustic_util.Product(60, is_broadband=True)]
+
+    assert acoustic_util.plan_stft(48000, 10, bands, "auto").strategy == "welch"
+    assert acoustic_util.plan_stft(48000, 10, bands, "welch").hop_length == 4800
+    assert acoustic_util.plan_stft(48000, 10, bands + [acoustic_util.Product(60)], "auto").strategy == "frames"
+    # The hop never skips an output bin
+    assert acoustic_util.plan_stft(48000, 0.1, [acoustic_util.Product(1)]).hop_length == 48000
+
+
+def test_welch_strategy_close_for_band_products(tmp_path):
+    wav_file = str(tmp_path / "noise.wav")
+    sf.write(wav_file, np.random.default_rng(0).normal(0, 0.1, 16000 * 30).astype("float32"), 16000)
+    t0 = dt.datetime(2023, 1, 1, 12, 0, 0)
+    products = [acoustic_util.Product(10, bands=3), acoustic_util.Product(10, is_broadband=True)]
+
+    frames = acoustic_util.wav_to_products(wav_file, products, t0=t0, delta_f=10, transforms=[])
+    welch = acoustic_util.wav_to_products(wav_file, products, t0=t0, delta_f=10, transforms=[], stft_strategy="auto")
+
+    for product in products:
+        pd.testing.assert_index_equal(welch[product].index, frames[product].index)
+        # The last bin only holds the zero padded frame at the end of the clip
+        np.testing.assert_allclose(welch[product].to_numpy()[:-1], frames[product].to_numpy()[:-1], rtol=0, atol=0.2)
+
+
+def test_fft_backends_match():
+    t0 = dt.datetime(2023, 1, 1, 12, 0, 3)
+    products = [acoustic_util.Product(1), acoustic_util.Product(2, bands=3),
+                acoustic_util.Product(1, is_broadband=True)]
+
+    expected = acoustic_util.wav_to_products(WAV_FILE, products, t0=t0, delta_f=10, transforms=[])
+    fftlib = librosa.get_fftlib()
+    for backend in ["numpy", "scipy"]:
+        results = acoustic_util.wav_to_products(WAV_FILE, products, t0=t0, delta_f=10, transforms=[],
+                                                fft_backend=backend, fft_workers=2)
+        assert librosa.get_fftlib() is fftlib
+        for product in products:
+            # At most one 0.01 dB rounding step apart
+            np.testing.assert_allclose(results[product].to_numpy(), expected[product].to_numpy(), rtol=0, atol=0.011)
+
+
+def test_stitched_clips_match_one_shot():
+    rng = np.random.default_rng(0)
+    sr = 16000
+    y = rng.standard_normal(sr * 31).astype(np.float32)
+    products = [acoustic_util.Product(1), acoustic_util.Product(1, bands=3),
+                acoustic_util.Product(2, is_broadband=True)]
+    t0 = dt.datetime(2023, 1, 1)
+    expected = acoustic_util.array_to_products(y, sr, products, t0=t0, delta_f=10, transforms=[])
+
+    # Cuts on the hop grid, mid bin, with the samples around each clip as its preroll and postroll
+    cuts = [0, 800 * 137, 800 * 391, len(y)]
+    stitcher = acoustic_util.ProductStitcher(products)
+    results = []
+    for a, b in zip(cuts[:-1], cuts[1:]):
+        partials = acoustic_util.array_to_products(y[a:b], sr, products, t0=t0 + dt.timedelta(seconds=a / sr),
+                                                   delta_f=10, transforms=[], preroll=y[:a] if a > 0 else None,
+                                                   postroll=y[b:] if b < len(y) else None, partial=True)
+        results.append(stitcher.add(partials))
+    results.append(stitcher.flush())
+
+    for product in products:
+        stitched = pd.concat([result[product] for result in results])
+        assert stitched.index.is_unique and stitched.index.is_monotonic_increasing
+        np.testing.assert_allclose(stitched.to_numpy(), expected[product].to_numpy(), rtol=0, atol=1e-9)
@@ -0,0 +1,41 @@
+import datetime as dt
+
+import boto3
+from botocore import UNSIGNED
+from botocore.config import Config
+from botocore.stub import Stubber
+
+from orcasound_noise.utils.catalog import ArchiveCatalog
+
+PREFIX = "ambient-sound-analysis/orcasound_lab/"
+
+
+def _listing(*names):
+    return {"Contents": [{"Key": PREFIX + name, "Size": 100, "ETag": '"abc"'} for name in names],
+            "IsTruncated": False}
+
+
+def test_catalog_refreshes_incrementally_and_queries_overlaps(tmp_path):
+    client = boto3.client("s3", config=Config(signature_version=UNSIGNED), region_name="us-west-2")
+    catalog = ArchiveCatalog(str(tmp_path / "catalog.sqlite"), client, "bucket", PREFIX, refresh_interval=0)
+
+    first = "20230101T000000_20230102T000000_1s_3oct.parquet"
+    second = "20230102T000000_20230103T000000_1s_3oct.parquet"
+    broadband = "20230102T000000_20230103T000000_1s_broadband.parquet"
+    with Stubber(client) as stubber:
+        stubber.add_response("list_objects_v2", _listing(first, "ancient_ambient_dB.parquet"),
+                             {"Bucket": "bucket", "Prefix": PREFIX})
+        stubber.add_response("list_objects_v2", _listing(second, broadband),
+                             {"Bucket": "bucket", "Prefix": PREFIX, "StartAfter": PREFIX + "ancient_ambient_dB.parquet"})
+        stubber.add_response("list_objects_v2", _listing(),
+                             {"Bucket": "bucket", "Prefix": PREFIX, "StartAfter": PREFIX + broadband})
+
+        assert catalog.files(dt.datetime(2023, 1, 1, 12), dt.datetime(2023, 1, 2, 12), 1, "3oct") == [PREFIX + first]
+        assert catalog.files(dt.datetime(2023, 1, 1, 12), dt.datetime(2023, 1, 2, 12), 1, "3oct") == [
+            PREFIX + first, PREFIX + second]
+        assert catalog.files(dt.datetime(2023, 1, 2, 12), dt.datetime(2023, 1, 5), 1, is_broadband=True) == [
+            PREFIX + broadband]
+        stubber.assert_no_pending_responses()
+
+    catalog.refresh_interval = 60
+    assert sorted(catalog.options()[2]) == ["broadband", "octave_bands"]
@@ -0,0 +1,81 @@
+import datetime as dt
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from orcasound_noise.analysis.accessor import NoiseAccessor
+from orcasound_noise.pipeline.compaction import ArchiveCompactor
+from orcasound_noise.utils import Hydrophone
+from orcasound_noise.utils.file_connector import S3FileConnector
+
+
+class _MemoryS3:
+    """
+    The few S3 client calls of the catalog, the connector and compaction, over a dict of keys.
+    """
+
+    def __init__(self):
+        self.objects = {}
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix, StartAfter=""):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix) and key > StartAfter)
+        yield {"Contents": [{"Key": key, "Size": len(self.objects[key]), "ETag": '"etag"'} for key in keys]}
+
+    def upload_fileobj(self, file, bucket, key):
+        self.objects[key] = file.read()
+
+    def download_file(self, bucket, key, location):
+        with open(location, "wb") as f:
+            f.write(self.objects[key])
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.objects[Key]), "ETag": '"etag"'}
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete["Objects"]:
+            del self.objects[item["Key"]]
+
+
+# Pipeline files hold a row at their end time too
+@pytest.mark.parametrize("inclusive", ["left", "both"])
+def test_compaction_keeps_reads_unchanged(tmp_path, inclusive):
+    connector = S3FileConnector(Hydrophone.SANDBOX, no_sign=True, catalog=str(tmp_path / "catalog.sqlite"))
+    connector.client = connector.catalog.client = _MemoryS3()
+    connector.catalog.refresh_interval = 0
+
+    rng = np.random.default_rng(0)
+    # Overlapping files on the first day, one ending at midnight, one across it and one on the second day
+    for start, end in [("2023-01-01 00:00", "2023-01-01 06:00"), ("2023-01-01 05:00", "2023-01-01 12:00"),
+                       ("2023-01-01 12:00", "2023-01-02 00:00"), ("2023-01-01 23:00", "2023-01-02 01:00"),
+                       ("2023-01-02 01:00", "2023-01-02 03:00")]:
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        index = pd.date_range(start, end, freq="60s", inclusive=inclusive)
+        frame = pd.DataFrame(np.round(rng.normal(60, 10, (len(index), 2)), 2), index=index, columns=["63", "80"])
+        buffer = io.BytesIO()
+        frame.to_parquet(buffer)
+        buffer.seek(0)
+        connector.upload_file(buffer, start, end, 60, octave_bands=3)
+
+    accessor = NoiseAccessor(Hydrophone.SANDBOX)
+    accessor.connector = connector
+    start, end = dt.datetime(2023, 1, 1), dt.datetime(2023, 1, 2, 12)
+    before = accessor.create_df(start, end, delta_t=60, delta_f="3oct")
+
+    compactor = ArchiveCompactor(connector)
+    keys = compactor.compact(60, "3oct", end=dt.datetime(2023, 1, 3))
+
+    prefix = connector.save_folder + "/"
+    assert keys == [prefix + "20230101T000000_20230102T000000_60s_3oct.parquet",
+                    prefix + "20230102T000000_20230103T000000_60s_3oct.parquet"]
+    assert sorted(connector.client.objects) == keys
+    assert connector.get_files(start, end, 60, "3oct") == keys
+    pd.testing.assert_frame_equal(accessor.create_df(start, end, delta_t=60, delta_f="3oct"), before,
+                                  check_freq=False)
+
+    # Already compacted periods are left alone
+    assert compactor.compact(60, "3oct", end=dt.datetime(2023, 1, 3)) == []
@@ -0,0 +1,78 @@
+import datetime as dt
+import os
+import shutil
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from orcasound_noise.analysis.accessor import NoiseAccessor
+from orcasound_noise.pipeline.pipeline import NoiseAnalysisPipeline
+from orcasound_noise.utils import Hydrophone
+from orcasound_noise.utils.file_connector import S3FileConnector
+
+TEST_FILES = os.path.join(os.path.dirname(__file__), "..", "test_files")
+
+
+@pytest.mark.parametrize("encoding", ["float", "centi_db_list"])
+def test_dataset_layout_round_trip(tmp_path, encoding):
+    archive = tmp_path / "archive"
+    archive.mkdir()
+    for i in range(3):
+        shutil.copy(os.path.join(TEST_FILES, f"live00{i}.wav"), archive / f"2023_01_01_12_00_{i}0.wav")
+
+    start, end = dt.datetime(2023, 1, 1, 12), dt.datetime(2023, 1, 1, 13)
+    outputs = {}
+    for layout in ["flat", "dataset"]:
+        pipeline = NoiseAnalysisPipeline(Hydrophone.SANDBOX, delta_t=1, delta_f=10, bands=3, no_auth=True,
+                                         local_archive=str(archive), pqt_folder=str(tmp_path / layout), layout=layout,
+                                         encoding=encoding if layout == "dataset" else "float")
+        outputs[layout] = pipeline.generate_parquet_file(start, end, streaming=layout == "dataset")
+
+    psd_path = outputs["dataset"][0]
+    assert os.path.relpath(psd_path, str(tmp_path / "dataset")).split(os.sep)[:4] == [
+        "hydrophone=sandbox", "product=3oct", "resolution=1s", "date=2023-01-01"]
+    assert pq.ParquetFile(psd_path).schema_arrow.field("timestamp") is not None
+
+    accessor = NoiseAccessor(Hydrophone.SANDBOX, dataset=str(tmp_path / "dataset"))
+    query_start, query_end = dt.datetime(2023, 1, 1, 12, 0, 5), dt.datetime(2023, 1, 1, 12, 0, 15)
+    df = accessor.create_df(query_start, query_end, delta_t=1, delta_f="3oct", columns=["0", "1"])
+
+    expected = pd.read_parquet(outputs["flat"][0])
+    expected = expected.loc[query_start:query_end, ["0", "1"]]
+    assert list(df.columns) == ["0", "1"]
+    # Hundredths of a dB are kept to within half of one
+    pd.testing.assert_frame_equal(df, expected, check_names=False, rtol=0, atol=0.005 if encoding != "float" else 0)
+
+    assert accessor.create_df(query_start, query_end, delta_t=60, delta_f="3oct").empty
+
+
+class _UploadRecorder:
+    def __init__(self):
+        self.keys = []
+
+    def upload_fileobj(self, file, bucket, key):
+        self.keys.append(key)
+
+
+def test_dataset_resume_uploads_partition_paths(tmp_path):
+    archive = tmp_path / "archive"
+    archive.mkdir()
+    for i in range(3):
+        shutil.copy(os.path.join(TEST_FILES, f"live00{i}.wav"), archive / f"2023_01_01_12_00_{i}0.wav")
+
+    pipeline = NoiseAnalysisPipeline(Hydrophone.SANDBOX, delta_t=1, delta_f=10, bands=3, no_auth=True,
+                                     local_archive=str(archive), pqt_folder=str(tmp_path / "dataset"),
+                                     layout="dataset")
+    start, hour = dt.datetime(2023, 1, 1, 12), dt.timedelta(hours=1)
+    pipeline.generate_parquet_file(start, start + hour)
+
+    # The files are already local, a resumed batch only uploads them, under their partitions
+    pipeline._file_connector = S3FileConnector(Hydrophone.SANDBOX, no_sign=True)
+    pipeline._file_connector.client = recorder = _UploadRecorder()
+    paths = pipeline.generate_parquet_file_batch(start, 1, hour, resume=True, check_s3=False, upload_to_s3=True)
+
+    save_folder = Hydrophone.SANDBOX.value.save_folder
+    assert recorder.keys == [save_folder + "/" + name for name in pipeline.product_filenames(start, start + hour)]
+    assert recorder.keys[0].startswith(save_folder + "/hydrophone=sandbox/product=3oct/resolution=1s/date=2023-01-01/")
+    assert all(os.path.exists(path) for path in paths[0])
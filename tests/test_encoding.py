@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from orcasound_noise.utils.encoding import ENCODINGS, ENCODING_COMPRESSION, encode_frame, read_parquet
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_encodings_read_back_as_written(tmp_path, encoding):
+    rng = np.random.default_rng(0)
+    index = pd.date_range("2023-01-01", periods=100, freq="1s")
+    frame = pd.DataFrame(np.round(rng.normal(60, 20, (100, 4)), 2), index=index, columns=["63", "80", "100", "125"])
+    frame.iloc[3, 1] = np.nan
+
+    path = str(tmp_path / "levels.parquet")
+    pq.write_table(encode_frame(frame, encoding), path, compression=ENCODING_COMPRESSION[encoding])
+
+    pd.testing.assert_frame_equal(read_parquet(path), frame, check_freq=False)
+    pd.testing.assert_frame_equal(read_parquet(path, columns=["80", "125"]), frame[["80", "125"]], check_freq=False)
+
+
+def test_centi_db_rejects_levels_out_of_range():
+    frame = pd.DataFrame({"0": [400.0]}, index=pd.date_range("2023-01-01", periods=1, freq="1s"))
+    with pytest.raises(ValueError):
+        encode_frame(frame, "centi_db")
@@ -0,0 +1,24 @@
+import os
+import shutil
+
+import librosa
+import numpy as np
+import pytest
+
+from orcasound_noise.pipeline.hls_stream import decode_ts
+
+TEST_FILES = os.path.join(os.path.dirname(__file__), "..", "test_files")
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_decode_ts_matches_wav():
+    with open(os.path.join(TEST_FILES, "live000.ts"), "rb") as f:
+        y, sr = decode_ts(f.read())
+
+    expected, expected_sr = librosa.load(os.path.join(TEST_FILES, "live000.wav"), sr=None)
+
+    assert sr == expected_sr
+    assert y.dtype == np.float32
+    assert len(y) == len(expected)
+    # The wav went through 16 bit PCM
+    np.testing.assert_allclose(y, expected, rtol=0, atol=1e-4)
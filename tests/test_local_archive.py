@@ -0,0 +1,61 @@
+import datetime as dt
+import os
+import shutil
+import time
+
+from orcasound_noise.pipeline import pipeline
+from orcasound_noise.pipeline.local_archive import LocalArchiveStream, WavSlice, file_start_time
+from orcasound_noise.utils import Hydrophone
+
+TEST_FILES = os.path.join(os.path.dirname(__file__), "..", "test_files")
+
+
+def test_file_start_time_from_names():
+    segment = os.path.join("rpi_orcasound_lab", "hls", "1672603200", "live012.ts")
+    assert file_start_time(segment) == dt.datetime.fromtimestamp(1672603200) + dt.timedelta(seconds=122)
+    assert file_start_time("2023_01_01_12_00_10.wav") == dt.datetime(2023, 1, 1, 12, 0, 10)
+    assert file_start_time("port_townsend_20230101T120010Z.wav") == dt.datetime(2023, 1, 1, 12, 0, 10)
+    assert file_start_time("live012.wav") is None
+
+
+def test_pipeline_reads_local_archive_without_s3(tmp_path, monkeypatch):
+    for i in range(3):
+        shutil.copy(os.path.join(TEST_FILES, f"live00{i}.wav"), tmp_path / f"2023_01_01_12_00_{i}0.wav")
+
+    def no_s3(*args, **kwargs):
+        raise AssertionError("S3 should not be used")
+
+    monkeypatch.setattr(pipeline, "S3FileConnector", no_s3)
+    clips = []
+    process_wav_file = pipeline.NoiseAnalysisPipeline.process_wav_file
+    monkeypatch.setattr(pipeline.NoiseAnalysisPipeline, "process_wav_file",
+                        staticmethod(lambda args: clips.append(args[0]) or process_wav_file(args)))
+
+    p = pipeline.NoiseAnalysisPipeline(Hydrophone.SANDBOX, delta_t=1, delta_f=10, no_auth=True,
+                                       local_archive=str(tmp_path))
+    psd, broadband = p.generate_psds(dt.datetime(2023, 1, 1, 12, 0, 5), dt.datetime(2023, 1, 1, 13), polling_interval=7)
+
+    # Only the date range of the files is read, a polling_interval at a time
+    assert all(isinstance(clip, WavSlice) for clip in clips)
+    assert clips[0].start_frame == 5 * 48000 and clips[0].frames == 5 * 48000 + 256
+    assert psd.index[0] == dt.datetime(2023, 1, 1, 12, 0, 5) and psd.index.is_unique
+    assert broadband.index.equals(psd.index.rename(None))
+
+
+def test_local_archive_clips_keep_sub_second_starts_and_split_at_gaps(tmp_path):
+    shutil.copy(os.path.join(TEST_FILES, "live000.wav"), tmp_path / "2023_01_01_12_00_00.wav")
+    start = dt.datetime(2023, 1, 1, 12)
+    stream = LocalArchiveStream(str(tmp_path), 2.5, time.mktime(start.timetuple()),
+                                time.mktime(start.timetuple()) + 60)
+    _, clip_start, _ = stream.get_next_clip()
+    _, clip_start, _ = stream.get_next_clip()
+    assert clip_start == "2023_01_01_12_00_02_500000"
+
+    # live002.ts is missing, live003.ts doesn't continue live001.ts
+    segments = tmp_path / "archive" / "hls" / "1672603200"
+    segments.mkdir(parents=True)
+    for i in [0, 1, 3]:
+        (segments / f"live00{i}.ts").touch()
+    stream = LocalArchiveStream(str(tmp_path / "archive"), 60, 1672603200, 1672603200 + 3600)
+    assert [[os.path.basename(path) for path in paths] for _, paths in stream.clips] == [
+        ["live000.ts", "live001.ts"], ["live003.ts"]]
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from orcasound_noise.pipeline.parquet_writer import ParquetStreamWriter
+
+
+def _clips():
+    rng = np.random.default_rng(0)
+    clips = []
+    for start in ["2023-01-01 00:00:00", "2023-01-01 00:00:09", "2023-01-01 00:00:17"]:
+        index = pd.date_range(start, periods=10, freq="1s", name="ind")
+        clips.append(pd.DataFrame(rng.random((10, 3)), index=index, columns=[10.0, 20.0, 40.0]))
+    return clips
+
+
+def test_stream_writer_matches_concat_and_dedupe(tmp_path):
+    path = str(tmp_path / "out.parquet")
+    clips = _clips()
+
+    # Tiny row groups so several get written
+    with ParquetStreamWriter(path, row_group_bytes=1) as writer:
+        for clip in clips:
+            writer.write(clip)
+
+    expected = pd.concat(clips)
+    expected = expected[~expected.index.duplicated(keep="last")]
+    expected.columns = expected.columns.astype(str)
+    expected.to_parquet(str(tmp_path / "expected.parquet"))
+
+    pd.testing.assert_frame_equal(pd.read_parquet(path), pd.read_parquet(str(tmp_path / "expected.parquet")))
+    assert writer.rows == len(expected)
+
+
+def test_stream_writer_leaves_no_file_on_error(tmp_path):
+    path = tmp_path / "out.parquet"
+    try:
+        with ParquetStreamWriter(str(path), row_group_bytes=1) as writer:
+            for clip in _clips():
+                writer.write(clip)
+            raise RuntimeError
+    except RuntimeError:
+        pass
+
+    assert list(tmp_path.iterdir()) == []
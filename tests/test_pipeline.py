@@ -0,0 +1,178 @@
+import datetime as dt
+import importlib
+import os
+import shutil
+from multiprocessing import Pool
+
+import librosa
+import numpy as np
+import pandas as pd
+import scipy.fft
+
+from orcasound_noise.pipeline import local_archive
+from orcasound_noise.pipeline.live import LiveSource
+from orcasound_noise.pipeline.manifest import RunManifest
+from orcasound_noise.pipeline.pipeline import NoiseAnalysisPipeline
+from orcasound_noise.utils import Hydrophone
+
+TEST_FILES = os.path.join(os.path.dirname(__file__), "..", "test_files")
+
+
+def test_batch_resume_only_processes_missing_intervals(tmp_path):
+    pipeline = NoiseAnalysisPipeline(Hydrophone.SANDBOX, delta_t=60, delta_f=10, pqt_folder=str(tmp_path),
+                                     no_auth=True)
+    calls = []
+
+    def generate_parquet_file(start, end, **kwargs):
+        calls.append(start)
+        if len(calls) == 3:
+            raise RuntimeError("crash")
+        paths = [os.path.join(str(tmp_path), name) for name in pipeline.product_filenames(start, end)]
+        for path in paths:
+            open(path, "w").close()
+        return tuple(paths)
+
+    pipeline.generate_parquet_file = generate_parquet_file
+    start, day = dt.datetime(2023, 1, 1), dt.timedelta(days=1)
+
+    # Day 2 was produced by an earlier run without a manifest
+    generate_parquet_file(start + day, start + 2 * day)
+    calls.clear()
+
+    try:
+        pipeline.generate_parquet_file_batch(start, 5, day, resume=True, check_s3=False)
+    except RuntimeError:
+        pass
+    assert calls == [start, start + 2 * day, start + 3 * day]
+
+    calls.clear()
+    paths = pipeline.generate_parquet_file_batch(start, 5, day, resume=True, check_s3=False)
+    assert calls == [start + 3 * day, start + 4 * day]
+    assert len(paths) == 5 and all(os.path.exists(p) for files in paths for p in files)
+
+    manifest = RunManifest(os.path.join(str(tmp_path), "manifest.jsonl"))
+    assert len(manifest.done) == 5
+
+
+def test_manifest_records_after_a_partial_line(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    start, day = dt.datetime(2023, 1, 1), dt.timedelta(days=1)
+    RunManifest(path).record("sandbox", start, start + day, ["a.parquet"], ["a.parquet"])
+    # A crash in the middle of writing the second record
+    with open(path, "a") as f:
+        f.write('{"hydrophone": "sandbox", "start": "2023-01')
+
+    RunManifest(path).record("sandbox", start + day, start + 2 * day, ["b.parquet"], None)
+
+    manifest = RunManifest(path)
+    assert manifest.get("sandbox", start, start + day, ["a.parquet"])["files"] == ["a.parquet"]
+    assert manifest.get("sandbox", start + day, start + 2 * day, ["b.parquet"])["files"] is None
+
+
+def test_pipeline_keeps_its_pool_until_closed():
+    with NoiseAnalysisPipeline(Hydrophone.SANDBOX, delta_t=60, delta_f=10, no_auth=True, mode="fast") as pipeline:
+        pool = pipeline.worker_pool(1)
+        assert pipeline.worker_pool() is pool
+    assert pipeline.pool is None
+
+    with Pool(1) as shared_pool:
+        pipeline = NoiseAnalysisPipeline(Hydrophone.SANDBOX, delta_t=60, delta_f=10, no_auth=True, pool=shared_pool)
+        pipeline.close()
+        assert shared_pool.map(abs, [-1]) == [1]
+
+
+def test_live_restart_neither_reprocesses_nor_skips(tmp_path, monkeypatch):
+    source = tmp_path / "stream"
+    source.mkdir()
+    for i in range(3):
+        shutil.copy(os.path.join(TEST_FILES, f"live00{i}.ts"), source)
+    # Decode the .wav copies of the segments, so the test doesn't need ffmpeg
+    monkeypatch.setattr(LiveSource, "download", lambda self, folder, segment: librosa.load(
+        os.path.join(TEST_FILES, segment.replace(".ts", ".wav")), sr=None))
+
+    def run(pqt_folder, max_segments):
+        pipeline = NoiseAnalysisPipeline(Hydrophone.SANDBOX, delta_t=1, delta_f=10, pqt_folder=str(pqt_folder),
+                                         no_auth=True)
+        return pipeline.run_live(source=str(source), start_time=dt.datetime(2023, 1, 1), from_start=True,
+                                 max_segments=max_segments, poll_interval=0)
+
+    assert run(tmp_path / "restarted", 2) == 2
+    assert run(tmp_path / "restarted", 1) == 1
+    run(tmp_path / "continuous", 3)
+
+    for name in ["1s_10hz", "1s_broadband"]:
+        restarted = pd.read_parquet(tmp_path / "restarted" / "live" / name / "2023-01-01").sort_index()
+        continuous = pd.read_parquet(tmp_path / "continuous" / "live" / name / "2023-01-01").sort_index()
+        assert len(restarted) == 30 and restarted.index.is_unique
+        pd.testing.assert_frame_equal(restarted, continuous)
+
+
+def test_live_rows_have_the_batch_timestamps(tmp_path, monkeypatch):
+    # A stream mirrored like the archive, its timestamp is 2023-01-01 12:00 in US/Pacific
+    stream = tmp_path / "rpi_orcasound_lab" / "hls" / "1672603200"
+    stream.mkdir(parents=True)
+    decoded = {}
+    for i in range(3):
+        shutil.copy(os.path.join(TEST_FILES, f"live00{i}.ts"), stream)
+        with open(os.path.join(TEST_FILES, f"live00{i}.ts"), "rb") as f:
+            decoded[f.read()] = librosa.load(os.path.join(TEST_FILES, f"live00{i}.wav"), sr=None)
+    # Decode the .wav copies of the segments, so the test doesn't need ffmpeg
+    monkeypatch.setattr(LiveSource, "download", lambda self, folder, segment: librosa.load(
+        os.path.join(TEST_FILES, segment.replace(".ts", ".wav")), sr=None))
+    monkeypatch.setattr(local_archive, "decode_ts", decoded.__getitem__)
+
+    def pipeline(name):
+        return NoiseAnalysisPipeline(Hydrophone.SANDBOX, delta_t=1, delta_f=10, pqt_folder=str(tmp_path / name),
+                                     no_auth=True, local_archive=str(tmp_path))
+
+    pipeline("live").run_live(source=str(stream), from_start=True, max_segments=3, poll_interval=0)
+    live = pd.read_parquet(tmp_path / "live" / "live" / "1s_10hz" / "2023-01-01").sort_index()
+    batch, _ = pipeline("batch").generate_psds(dt.datetime(2023, 1, 1, 12), dt.datetime(2023, 1, 1, 13),
+                                               polling_interval=10)
+
+    assert live.index[0] == dt.datetime(2023, 1, 1, 12, 0, 2)
+    assert live.index.isin(batch.index).all()
+
+
+def test_local_archive_fast_mode_matches_safe_and_frees_shared_memory(tmp_path):
+    for i in range(3):
+        shutil.copy(os.path.join(TEST_FILES, f"live00{i}.wav"), tmp_path / f"2023_01_01_12_00_{i}0.wav")
+    start, end = dt.datetime(2023, 1, 1, 12), dt.datetime(2023, 1, 1, 13)
+    blocks = set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+    def pipeline(mode):
+        return NoiseAnalysisPipeline(Hydrophone.SANDBOX, delta_t=1, delta_f=10, no_auth=True, mode=mode,
+                                     local_archive=str(tmp_path))
+
+    safe = pipeline("safe").generate_products(start, end, polling_interval=4)
+    with pipeline("fast") as fast:
+        fast.worker_pool(2)
+        # Abandon the clips partway, with results still in flight
+        clips = fast.iter_clip_products(start, end, polling_interval=4)
+        next(clips)
+        clips.close()
+
+        # The pool is still usable, and gives the same products as safe mode
+        for product, frame in fast.generate_products(start, end, polling_interval=4).items():
+            pd.testing.assert_frame_equal(frame, safe[product])
+
+    if os.path.isdir("/dev/shm"):
+        assert set(os.listdir("/dev/shm")) <= blocks
+
+
+def test_default_safe_mode_runs_threaded_ffts(tmp_path, monkeypatch):
+    shutil.copy(os.path.join(TEST_FILES, "live000.wav"), tmp_path / "2023_01_01_12_00_00.wav")
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+    # librosa 0.9 runs its FFTs on numpy.fft by default
+    monkeypatch.setattr(importlib.import_module("librosa.core.fft"), "__FFTLIB", np.fft)
+    workers = []
+    rfft = scipy.fft.rfft
+    monkeypatch.setattr(scipy.fft, "rfft", lambda *args, **kwargs: workers.append(scipy.fft.get_workers()) or rfft(
+        *args, **kwargs))
+
+    pipeline = NoiseAnalysisPipeline(Hydrophone.SANDBOX, delta_t=1, delta_f=10, no_auth=True,
+                                     local_archive=str(tmp_path))
+    assert pipeline.parallelism() == (1, 4)
+    pipeline.generate_psds(dt.datetime(2023, 1, 1, 12), dt.datetime(2023, 1, 1, 13))
+
+    assert workers and set(workers) == {4}
@@ -0,0 +1,87 @@
+import datetime as dt
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from orcasound_noise.analysis.accessor import NoiseAccessor
+from orcasound_noise.pipeline.parquet_writer import ParquetStreamWriter
+from orcasound_noise.pipeline.pipeline import NoiseAnalysisPipeline
+from orcasound_noise.pipeline.rollup import RollupBuilder
+from orcasound_noise.utils import Hydrophone
+from orcasound_noise.utils.dataset import dataset_filename, product_directory, to_dataset_frame
+from orcasound_noise.utils.rollup import rollup_levels
+
+TEST_FILES = os.path.join(os.path.dirname(__file__), "..", "test_files")
+
+
+def test_rollups_of_rollups_match_direct_rollups():
+    rng = np.random.default_rng(0)
+    index = pd.date_range("2023-01-01 23:00", periods=7200, freq="1s")
+    frame = pd.DataFrame(rng.normal(60, 10, (7200, 3)), index=index, columns=["63", "80", "100"])
+    frame.iloc[5, 1] = np.nan
+
+    minutes, counts = rollup_levels(frame, 60)
+    hours, hour_counts = rollup_levels(minutes, 3600, counts)
+    direct, direct_counts = rollup_levels(frame, 3600)
+
+    pd.testing.assert_frame_equal(hours, direct)
+    assert list(hour_counts) == list(direct_counts) == [3600, 3600]
+    assert list(hours.index) == [pd.Timestamp("2023-01-01 23:00"), pd.Timestamp("2023-01-02 00:00")]
+
+
+def test_accessor_reads_coarsest_rollup(tmp_path):
+    archive = tmp_path / "archive"
+    archive.mkdir()
+    for i in range(3):
+        shutil.copy(os.path.join(TEST_FILES, f"live00{i}.wav"), archive / f"2023_01_01_12_00_{i}0.wav")
+    root = str(tmp_path / "dataset")
+    pipeline = NoiseAnalysisPipeline(Hydrophone.SANDBOX, delta_t=1, delta_f=10, bands=3, no_auth=True,
+                                     local_archive=str(archive), pqt_folder=root, layout="dataset")
+    pipeline.generate_parquet_file(dt.datetime(2023, 1, 1, 12), dt.datetime(2023, 1, 1, 13))
+
+    accessor = NoiseAccessor(Hydrophone.SANDBOX, dataset=root)
+    start, end = dt.datetime(2023, 1, 1, 12), dt.datetime(2023, 1, 1, 12, 10)
+    expected = accessor.create_df(start, end, delta_t=1, delta_f="3oct", resolution=600)
+
+    builder = RollupBuilder(Hydrophone.SANDBOX, pqt_folder=root, layout="dataset", no_auth=True, dataset=root)
+    paths = builder.build(dt.datetime(2023, 1, 1), dt.datetime(2023, 1, 2), delta_t=1, delta_f="3oct")
+    assert sorted(paths) == [60, 600, 3600, 86400]
+
+    # Only the 10 minute rollup is left to read from
+    shutil.rmtree(os.path.join(root, "hydrophone=sandbox", "product=3oct", "resolution=1s"))
+    shutil.rmtree(os.path.join(root, "hydrophone=sandbox", "product=3oct", "resolution=60s"))
+    df = accessor.create_df(start, end, delta_t=1, delta_f="3oct", resolution=600, columns=["0", "1"])
+    assert len(df) == 1
+    pd.testing.assert_frame_equal(df, expected[["0", "1"]], check_names=False)
+
+
+def test_accessor_reads_unbuilt_days_from_finer_levels(tmp_path):
+    root = str(tmp_path)
+    rng = np.random.default_rng(0)
+    first_day, day = dt.datetime(2023, 1, 1), dt.timedelta(days=1)
+    frames = []
+    for i in range(3):
+        index = pd.date_range(first_day + i * day, first_day + (i + 1) * day, freq="60s", inclusive="left")
+        frame = pd.DataFrame(rng.normal(60, 10, (len(index), 2)), index=index, columns=["63", "80"])
+        path = os.path.join(root, dataset_filename("sandbox", index[0], index[0] + day, 60, octave_bands=3))
+        os.makedirs(os.path.dirname(path))
+        with ParquetStreamWriter(path) as writer:
+            writer.write(to_dataset_frame(frame))
+        frames.append(frame)
+    expected, _ = rollup_levels(pd.concat(frames), 3600)
+
+    # The rollups of the middle day aren't built
+    builder = RollupBuilder(Hydrophone.SANDBOX, pqt_folder=root, layout="dataset", no_auth=True, dataset=root)
+    builder.build(first_day, first_day + day, delta_t=60, delta_f="3oct")
+    builder.build(first_day + 2 * day, first_day + 3 * day, delta_t=60, delta_f="3oct")
+    # The first and last days can only come from their rollups
+    for date in ["2023-01-01", "2023-01-03"]:
+        shutil.rmtree(os.path.join(root, product_directory("sandbox", 60, octave_bands=3), f"date={date}"))
+
+    accessor = NoiseAccessor(Hydrophone.SANDBOX, dataset=root)
+    df = accessor.create_df(first_day, first_day + 3 * day - dt.timedelta(seconds=1), delta_t=60, delta_f="3oct",
+                            resolution=3600)
+    assert len(df) == 72
+    pd.testing.assert_frame_equal(df, expected, check_names=False, check_freq=False)
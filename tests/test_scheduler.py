@@ -0,0 +1,34 @@
+import datetime as dt
+import os
+
+from orcasound_noise.pipeline.pipeline import NoiseAnalysisPipeline
+from orcasound_noise.pipeline.scheduler import BatchScheduler, JobSpec, Resolution, plan_shards, shard_bounds
+from orcasound_noise.utils import Hydrophone
+
+
+def test_shard_bounds_by_month():
+    bounds = shard_bounds(dt.datetime(2020, 11, 15), dt.datetime(2021, 2, 1), "month")
+
+    assert bounds == [(dt.datetime(2020, 11, 15), dt.datetime(2020, 12, 1)),
+                      (dt.datetime(2020, 12, 1), dt.datetime(2021, 1, 1)),
+                      (dt.datetime(2021, 1, 1), dt.datetime(2021, 2, 1))]
+
+
+def test_scheduler_skips_finished_shards(tmp_path):
+    spec = JobSpec([Hydrophone.ORCASOUND_LAB, Hydrophone.BUSH_POINT], dt.datetime(2023, 1, 1), dt.datetime(2023, 1, 3),
+                   dt.timedelta(days=1), [Resolution(60, 10), Resolution(1, 10, bands=3)])
+    shards = plan_shards(spec)
+    assert len(shards) == 8
+
+    # Outputs of an earlier run
+    for shard in shards:
+        folder = os.path.join(str(tmp_path), shard.hydrophone.value.name)
+        os.makedirs(folder, exist_ok=True)
+        pipeline = NoiseAnalysisPipeline(shard.hydrophone, shard.resolution.delta_t, shard.resolution.delta_f,
+                                         bands=shard.resolution.bands, no_auth=True)
+        for name in pipeline.product_filenames(shard.start, shard.end):
+            open(os.path.join(folder, name), "w").close()
+
+    summary = BatchScheduler(spec, str(tmp_path), max_workers=2, no_auth=True).run()
+
+    assert summary["skipped"] == 8 and summary["failed"] == []
@@ -0,0 +1,41 @@
+import os
+
+from orcasound_noise.pipeline.segment_cache import SegmentCache
+
+
+def test_key_from_url():
+    url = "https://s3-us-west-2.amazonaws.com/audio-orcasound-net/rpi_orcasound_lab/hls/1679464818/live042.ts"
+    assert SegmentCache.key_from_url(url) == "rpi_orcasound_lab/1679464818/live042.ts"
+
+
+def test_cache_hits_misses_and_lru_eviction(tmp_path):
+    cache = SegmentCache(str(tmp_path), max_bytes=2500)
+
+    assert cache.get("a") is None
+    cache.put("a", b"a" * 1000)
+    cache.put("b", b"b" * 1000)
+    os.utime(cache._path("a"), (0, 0))
+    os.utime(cache._path("b"), (1, 1))
+    assert cache.get("a") == b"a" * 1000
+
+    # Over budget: b is now the least recently used
+    cache.put("c", b"c" * 1000)
+    assert cache.get("b") is None
+    assert cache.get("a") == b"a" * 1000
+    assert cache.get("c") == b"c" * 1000
+
+    assert cache.stats() == {"hits": 3, "misses": 2, "evictions": 1, "bytes": 2000}
+    # Another instance sees the same segments
+    assert SegmentCache(str(tmp_path)).get("c") == b"c" * 1000
+
+
+def test_cache_hit_survives_eviction_after_the_read(tmp_path, monkeypatch):
+    cache = SegmentCache(str(tmp_path))
+    cache.put("a", b"a" * 10)
+
+    def evicted(path, *args):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, "utime", evicted)
+    assert cache.get("a") == b"a" * 10
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 0
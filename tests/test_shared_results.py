@@ -0,0 +1,15 @@
+import numpy as np
+import pandas as pd
+
+from orcasound_noise.pipeline.shared_results import SharedFrame, from_shared, to_shared
+
+
+def test_shared_frame_round_trip():
+    index = pd.date_range("2023-01-01", periods=5, freq="1s", name="ind")
+    frame = pd.DataFrame(np.random.default_rng(0).random((5, 3)).astype(np.float32), index=index,
+                         columns=[10.0, 20.0, 30.0])
+
+    shared = to_shared(frame)
+
+    assert isinstance(shared, SharedFrame)
+    pd.testing.assert_frame_equal(from_shared(shared), frame)